@@ -1,31 +1,140 @@
 import asyncio
+import json
 import logging
+from collections.abc import AsyncIterator
 from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from typing import Union
 
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel, Field
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, model_validator
 
-from app.services.image_analysis_service import analyze_area_ratio, analyze_colors
+from app.services.image_analysis_service import (
+    analyze_area_ratio,
+    analyze_colors,
+    analyze_image_path,
+    analyze_parts_path,
+    choose_method_for_path,
+    get_background_remover,
+)
 from app.utils.exceptions import handle_common_exceptions
 
 logger = logging.getLogger(__name__)
 
+# 图像分析线程数（所有请求共用）
+_ANALYSIS_WORKERS = 2
+# 批量分析单次请求的图片数上限
+_BATCH_MAX_IMAGES = 50
+# 支持的抠图方法；auto 先用 opencv，可信度不足时改用 rembg
+_METHODS = ("opencv", "rembg", "auto")
+
 # 创建线程池用于执行 CPU 密集型任务
-_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image_analysis")
+_executor = ThreadPoolExecutor(
+    max_workers=_ANALYSIS_WORKERS, thread_name_prefix="image_analysis"
+)
 
 router = APIRouter(tags=["图像分析"])
 
 
+class AnalyzeRoi(BaseModel):
+    """识别区域（原图像素坐标），box 与 polygon 二选一"""
+
+    box: list[int] | None = Field(
+        default=None, min_length=4, max_length=4, description="矩形框 [x, y, 宽, 高]"
+    )
+    polygon: list[list[int]] | None = Field(
+        default=None, min_length=3, description="多边形顶点 [[x, y], ...]"
+    )
+
+    @model_validator(mode="after")
+    def check_shape(self) -> "AnalyzeRoi":
+        if (self.box is None) == (self.polygon is None):
+            raise ValueError("box 与 polygon 需且仅需提供一个")
+        if self.box is not None and (self.box[2] <= 0 or self.box[3] <= 0):
+            raise ValueError("矩形框的宽和高必须大于 0")
+        if self.polygon is not None and any(len(p) != 2 for p in self.polygon):
+            raise ValueError("多边形顶点必须为 [x, y]")
+        return self
+
+
 class AnalyzeRequest(BaseModel):
     image_path: str = Field(
         ..., description="已上传图片的静态路径，如 /static/uploads/xxx.png"
     )
     method: str | None = Field(
-        default=None, description="可选：rembg 或 opencv，默认 opencv"
+        default=None,
+        description="可选：opencv、rembg 或 auto（opencv 不可靠时自动改用 rembg），默认 opencv",
+    )
+    rembg_model: str | None = Field(
+        default=None,
+        description="可选：rembg 模型 u2net、u2netp、silueta、isnet 或 u2net_int8，默认由部署配置 REMBG_MODEL 决定",
+    )
+    roi: AnalyzeRoi | None = Field(
+        default=None, description="可选：只分析该区域（如用户在图片上框选的范围）"
+    )
+
+    def roi_dict(self) -> dict | None:
+        return self.roi.model_dump(exclude_none=True) if self.roi else None
+
+
+class PartsAnalyzeRequest(AnalyzeRequest):
+    min_part_ratio: float = Field(
+        default=0.05,
+        gt=0,
+        le=1,
+        description="零件面积小于最大零件该比例时视为噪点忽略",
     )
 
 
+class BatchAnalyzeRequest(BaseModel):
+    image_paths: list[str] = Field(
+        ...,
+        min_length=1,
+        max_length=_BATCH_MAX_IMAGES,
+        description="已上传图片的静态路径列表",
+    )
+    method: str | None = Field(
+        default=None,
+        description="可选：opencv、rembg 或 auto（opencv 不可靠时自动改用 rembg），默认 opencv",
+    )
+    concurrency: int = Field(
+        default=_ANALYSIS_WORKERS,
+        ge=1,
+        le=_ANALYSIS_WORKERS,
+        description="本次请求同时分析的图片数上限",
+    )
+    rembg_model: str | None = Field(
+        default=None,
+        description="可选：rembg 模型 u2net、u2netp、silueta、isnet 或 u2net_int8，默认由部署配置 REMBG_MODEL 决定",
+    )
+
+
+def _normalize_method(method: str | None) -> str:
+    method = (method or "opencv").lower()
+    return method if method in _METHODS else "opencv"
+
+
+def _analyze_with_method(analyze, payload: AnalyzeRequest, method: str):
+    """auto 时先评估 opencv 抠图可信度再分析，二者在同一个线程池任务中完成（共用超时）
+
+    返回 (分析结果, 实际使用的方法, 可信度评估结果或 None)
+    """
+    quality = None
+    if method == "auto":
+        method, quality = choose_method_for_path(
+            payload.image_path, roi=payload.roi_dict()
+        )
+    result = analyze(
+        payload.image_path,
+        method,
+        payload.rembg_model,
+        roi=payload.roi_dict(),
+        background_from_border=quality is not None,
+    )
+    return result, method, quality
+
+
 @router.post("/area-ratio")
 @handle_common_exceptions(
     file_not_found_msg="图片文件未找到",
@@ -34,35 +143,34 @@ class AnalyzeRequest(BaseModel):
 )
 async def analyze_area_ratio_api(
     payload: AnalyzeRequest,
-) -> dict[str, Union[str, float]]:
-    method = (payload.method or "opencv").lower()
-    if method not in {"opencv", "rembg"}:
-        method = "opencv"
+) -> dict[str, Union[str, float, dict[str, float]]]:
+    method = _normalize_method(payload.method)
     
     # 根据方法设置不同的超时时间
     # rembg 首次加载模型可能需要较长时间
-    timeout = 300 if method == "rembg" else 120  # rembg: 5分钟, opencv: 2分钟
+    timeout = 120 if method == "opencv" else 300  # rembg: 5分钟, opencv: 2分钟
     
     logger.info(f"开始面积比例分析: path={payload.image_path}, method={method}, timeout={timeout}s")
     
     try:
         # 在线程池中执行同步的 CPU 密集型任务，避免阻塞事件循环
         loop = asyncio.get_event_loop()
-        ratio, preview_path = await asyncio.wait_for(
+        (ratio, preview_path), used_method, quality = await asyncio.wait_for(
             loop.run_in_executor(
                 _executor,
-                analyze_area_ratio,
-                payload.image_path,
-                method,
+                partial(_analyze_with_method, analyze_area_ratio, payload, method),
             ),
             timeout=timeout,
         )
-        logger.info(f"面积比例分析完成: ratio={ratio:.4f}")
-        return {
+        logger.info(f"面积比例分析完成: ratio={ratio:.4f}, method={used_method}")
+        response = {
             "area_ratio": round(float(ratio), 4),
-            "method": method,
+            "method": used_method,
             "preview_path": preview_path,
         }
+        if quality is not None:
+            response["auto"] = quality
+        return response
     except asyncio.TimeoutError:
         logger.error(f"面积比例分析超时: path={payload.image_path}, method={method}, timeout={timeout}s")
         raise HTTPException(
@@ -74,7 +182,13 @@ async def analyze_area_ratio_api(
         
         # 检查是否是 rembg 模型下载失败
         error_str = str(e).lower()
-        if "rembg" in error_str or "github.com" in error_str or "download" in error_str or "timeout" in error_str:
+        # ValueError 为参数问题（如模型名称错误），交由统一处理返回 400
+        if not isinstance(e, ValueError) and (
+            "rembg" in error_str
+            or "github.com" in error_str
+            or "download" in error_str
+            or "timeout" in error_str
+        ):
             raise HTTPException(
                 status_code=503,
                 detail="rembg 模型下载失败（网络问题）。请检查服务器网络连接，或使用 opencv 方法（更快且不需要网络）。",
@@ -92,27 +206,25 @@ async def analyze_area_ratio_api(
 async def analyze_colors_api(
     payload: AnalyzeRequest,
 ) -> dict[str, object]:
-    method = (payload.method or "opencv").lower()
-    if method not in {"opencv", "rembg"}:
-        method = "opencv"
+    method = _normalize_method(payload.method)
     
     # 颜色分析也需要较长时间，特别是使用 rembg
-    timeout = 300 if method == "rembg" else 120
+    timeout = 120 if method == "opencv" else 300
     
     logger.info(f"开始颜色分析: path={payload.image_path}, method={method}, timeout={timeout}s")
     
     try:
         loop = asyncio.get_event_loop()
-        result = await asyncio.wait_for(
+        result, used_method, quality = await asyncio.wait_for(
             loop.run_in_executor(
                 _executor,
-                analyze_colors,
-                payload.image_path,
-                method,
+                partial(_analyze_with_method, analyze_colors, payload, method),
             ),
             timeout=timeout,
         )
         logger.info(f"颜色分析完成: colors={result.get('color_count', 0)}")
+        if quality is not None:
+            return {**result, "method": used_method, "auto": quality}
         return result
     except asyncio.TimeoutError:
         logger.error(f"颜色分析超时: path={payload.image_path}, method={method}, timeout={timeout}s")
@@ -124,3 +236,174 @@ async def analyze_colors_api(
         logger.exception(f"颜色分析失败: {e}")
         raise
 
+
+@router.post("/parts")
+@handle_common_exceptions(
+    file_not_found_msg="图片文件未找到",
+    value_error_msg="图片分析参数错误",
+    general_error_msg="零件分析失败",
+)
+async def analyze_parts_api(payload: PartsAnalyzeRequest) -> dict[str, object]:
+    """多零件排版图：一次抠图后返回每个零件的面积比例、尺寸（像素）与颜色"""
+    method = _normalize_method(payload.method)
+    timeout = 120 if method == "opencv" else 300
+
+    logger.info(f"开始零件分析: path={payload.image_path}, method={method}")
+    try:
+        loop = asyncio.get_event_loop()
+        result = await asyncio.wait_for(
+            loop.run_in_executor(
+                _executor,
+                partial(
+                    analyze_parts_path,
+                    payload.image_path,
+                    method,
+                    payload.min_part_ratio,
+                    payload.rembg_model,
+                    roi=payload.roi_dict(),
+                ),
+            ),
+            timeout=timeout,
+        )
+    except asyncio.TimeoutError:
+        logger.error(f"零件分析超时: path={payload.image_path}, method={method}")
+        raise HTTPException(
+            status_code=504,
+            detail=f"零件分析超时（{timeout}秒）。请稍后重试。",
+        ) from None
+    for part in result["parts"]:
+        part["area_ratio"] = round(float(part["area_ratio"]), 4)
+    logger.info(
+        f"零件分析完成: parts={result['part_count']}, method={result['method']}"
+    )
+    return result
+
+
+def _batch_error(e: Exception, timeout: int) -> tuple[int, str]:
+    """单张图片失败时的状态码与信息，与单张分析接口的口径一致"""
+    if isinstance(e, asyncio.TimeoutError):
+        return 504, f"分析超时（{timeout}秒）"
+    if isinstance(e, FileNotFoundError):
+        return 404, f"图片文件未找到: {e}"
+    if isinstance(e, ValueError):
+        return 400, f"图片分析参数错误: {e}"
+    return 500, "图像分析失败"
+
+
+@router.post("/batch")
+async def analyze_batch_api(
+    payload: BatchAnalyzeRequest, request: Request
+) -> StreamingResponse:
+    """批量分析多张图片（面积比例 + 颜色统计），按完成顺序逐张流式返回
+
+    默认返回 NDJSON（每行一个 JSON）；请求头 Accept 含 text/event-stream 时返回 SSE。
+    每张图片一条 status 为 ok 或 error 的结果（index 为其在 image_paths 中的位置），
+    最后一条 status 为 done 的汇总。
+    """
+    method = _normalize_method(payload.method)
+    timeout = 120 if method == "opencv" else 300
+    sse = "text/event-stream" in request.headers.get("accept", "")
+    image_paths = payload.image_paths
+    logger.info(
+        f"开始批量分析: {len(image_paths)} 张, method={method}, "
+        f"concurrency={payload.concurrency}"
+    )
+
+    def encode(item: dict[str, object]) -> str:
+        data = json.dumps(item, ensure_ascii=False)
+        return f"event: {item['status']}\ndata: {data}\n\n" if sse else data + "\n"
+
+    def done(succeeded: int) -> dict[str, object]:
+        return {
+            "status": "done",
+            "total": len(image_paths),
+            "succeeded": succeeded,
+            "failed": len(image_paths) - succeeded,
+        }
+
+    async def stream() -> AsyncIterator[str]:
+        loop = asyncio.get_event_loop()
+        try:
+            # 先加载一次抠图器（rembg 模型 session），之后各张图片共用
+            remover = await asyncio.wait_for(
+                loop.run_in_executor(
+                    _executor, get_background_remover, method, payload.rembg_model
+                ),
+                timeout=timeout,
+            )
+        except Exception as e:
+            logger.exception(f"批量分析加载抠图模型失败: {e}")
+            if isinstance(e, ValueError):
+                status_code, detail = 400, f"图片分析参数错误: {e}"
+            else:
+                status_code = 503
+                detail = "rembg 模型加载失败，请检查服务器网络连接，或使用 opencv 方法。"
+            for index, image_path in enumerate(image_paths):
+                yield encode(
+                    {
+                        "status": "error",
+                        "index": index,
+                        "image_path": image_path,
+                        "status_code": status_code,
+                        "detail": detail,
+                    }
+                )
+            yield encode(done(0))
+            return
+
+        semaphore = asyncio.Semaphore(payload.concurrency)
+
+        async def analyze_one(index: int, image_path: str) -> dict[str, object]:
+            async with semaphore:
+                try:
+                    result = await asyncio.wait_for(
+                        loop.run_in_executor(
+                            _executor, analyze_image_path, image_path, method, remover
+                        ),
+                        timeout=timeout,
+                    )
+                except Exception as e:
+                    status_code, detail = _batch_error(e, timeout)
+                    if status_code == 500:
+                        logger.exception(f"批量分析失败: path={image_path}: {e}")
+                    return {
+                        "status": "error",
+                        "index": index,
+                        "image_path": image_path,
+                        "status_code": status_code,
+                        "detail": detail,
+                    }
+            return {
+                "status": "ok",
+                "index": index,
+                "image_path": image_path,
+                "method": result["method"],
+                **{k: result[k] for k in ("rembg_model", "auto") if k in result},
+                "area_ratio": round(float(result["area_ratio"]), 4),
+                "color_count": result["color_count"],
+                "palette": result["palette"],
+                "preview_path": result["preview_path"],
+            }
+
+        tasks = [
+            asyncio.ensure_future(analyze_one(i, path))
+            for i, path in enumerate(image_paths)
+        ]
+        succeeded = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                item = await next_done
+                succeeded += item["status"] == "ok"
+                yield encode(item)
+        finally:
+            # 客户端断开时取消尚未开始的图片
+            for task in tasks:
+                task.cancel()
+        logger.info(f"批量分析完成: 成功 {succeeded}/{len(image_paths)}")
+        yield encode(done(succeeded))
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache"},
+    )
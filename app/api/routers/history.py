@@ -1,84 +1,240 @@
 import csv
 import io
-from datetime import datetime
-from typing import Optional
+from collections.abc import Iterator
+from datetime import date, datetime
+from typing import Literal, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, load_only
 
 from app.db import crud
 from app.db.models import User
-from app.db.session import get_db
+from app.db.session import SessionLocal, get_db
 from app.deps import get_current_user
-from app.schemas.history import HistoryItemResponse
+from app.schemas.history import (
+    HistoryItemResponse,
+    HistoryListItemResponse,
+    HistorySearchResponse,
+    HistoryStatsItem,
+)
+from app.services.similarity_service import similar_quote_index
 
 router = APIRouter(tags=["报价历史"])
 
+# 列表视图只加载的标量列，JSON 快照列保持未加载
+_LIST_COLUMNS = (
+    crud.QuotationHistory.id,
+    crud.QuotationHistory.worker_type,
+    crud.QuotationHistory.unit_price,
+    crud.QuotationHistory.total_price,
+    crud.QuotationHistory.computed_at,
+    crud.QuotationHistory.order_quantity,
+    crud.QuotationHistory.length,
+    crud.QuotationHistory.width,
+    crud.QuotationHistory.thickness,
+    crud.QuotationHistory.color_count,
+    crud.QuotationHistory.area_ratio,
+)
+
+# 导出时每批读取/写出的行数
+_EXPORT_CHUNK_SIZE = 500
+
 
 class BatchDeleteRequest(BaseModel):
     """批量删除请求"""
     history_ids: list[int]
 
 
-@router.get("", response_model=list[HistoryItemResponse])
+def _parse_iso(s: Optional[str]) -> Optional[datetime]:
+    if not s:
+        return None
+    try:
+        return datetime.fromisoformat(s)
+    except Exception:
+        return None
+
+
+class HistoryFilterParams:
+    """列表与导出共用的筛选参数（作为依赖注入）"""
+
+    def __init__(
+        self,
+        from_dt: Optional[str] = Query(None, description="起始时间，ISO字符串"),
+        to_dt: Optional[str] = Query(None, description="结束时间，ISO字符串"),
+        worker_type: Optional[str] = Query(None, description="工人类型过滤"),
+        min_unit: Optional[float] = Query(None, description="最小单价"),
+        max_unit: Optional[float] = Query(None, description="最大单价"),
+        color_count: Optional[int] = Query(None, ge=0, description="颜色数量"),
+        min_length: Optional[float] = Query(None, description="最小长度(cm)"),
+        max_length: Optional[float] = Query(None, description="最大长度(cm)"),
+        min_width: Optional[float] = Query(None, description="最小宽度(cm)"),
+        max_width: Optional[float] = Query(None, description="最大宽度(cm)"),
+    ):
+        self.from_dt = from_dt
+        self.to_dt = to_dt
+        self.worker_type = worker_type
+        self.min_unit = min_unit
+        self.max_unit = max_unit
+        self.color_count = color_count
+        self.min_length = min_length
+        self.max_length = max_length
+        self.min_width = min_width
+        self.max_width = max_width
+
+
+def _filter_histories(
+    db: Session,
+    user_id: int,
+    filters: HistoryFilterParams,
+    History: type = crud.QuotationHistory,
+):
+    """构建当前用户的历史查询（列表与导出共用的筛选条件，热表与归档表通用）"""
+    q = db.query(History).filter(History.user_id == user_id)
+
+    # 时间范围
+    start = _parse_iso(filters.from_dt)
+    end = _parse_iso(filters.to_dt)
+    if start:
+        q = q.filter(History.computed_at >= start)
+    if end:
+        q = q.filter(History.computed_at <= end)
+
+    # 其他筛选（均为独立列，直接在数据库中过滤）
+    if filters.worker_type:
+        q = q.filter(History.worker_type == filters.worker_type)
+    if filters.min_unit is not None:
+        q = q.filter(History.unit_price >= filters.min_unit)
+    if filters.max_unit is not None:
+        q = q.filter(History.unit_price <= filters.max_unit)
+    if filters.color_count is not None:
+        q = q.filter(History.color_count == filters.color_count)
+    if filters.min_length is not None:
+        q = q.filter(History.length >= filters.min_length)
+    if filters.max_length is not None:
+        q = q.filter(History.length <= filters.max_length)
+    if filters.min_width is not None:
+        q = q.filter(History.width >= filters.min_width)
+    if filters.max_width is not None:
+        q = q.filter(History.width <= filters.max_width)
+    return q
+
+
+def _history_list_item(history: crud.QuotationHistory, is_favorited: bool) -> dict:
+    """构造列表响应项（不触及 JSON 快照列）"""
+    return {
+        "id": history.id,
+        "worker_type": history.worker_type,
+        "unit_price": history.unit_price,
+        "total_price": history.total_price,
+        "computed_at": history.computed_at,
+        "order_quantity": history.order_quantity,
+        "length": history.length,
+        "width": history.width,
+        "thickness": history.thickness,
+        "color_count": history.color_count,
+        "area_ratio": history.area_ratio,
+        "is_favorited": is_favorited,
+    }
+
+
+def _history_item(history: crud.QuotationHistory, is_favorited: bool) -> dict:
+    """构造详情响应项，交由 response_model 做唯一一次校验"""
+    return {
+        "id": history.id,
+        "worker_type": history.worker_type,
+        "unit_price": history.unit_price,
+        "total_price": history.total_price,
+        "computed_at": history.computed_at,
+        "request_payload": history.request_payload,
+        "result_payload": history.result_payload,
+        "is_favorited": is_favorited,
+    }
+
+
+@router.get("", response_model=list[HistoryListItemResponse])
 async def get_histories(
+    response: Response,
     offset: int = Query(0, ge=0),
     limit: int = Query(20, ge=1, le=100),
-    from_dt: Optional[str] = Query(None, description="起始时间，ISO字符串"),
-    to_dt: Optional[str] = Query(None, description="结束时间，ISO字符串"),
-    worker_type: Optional[str] = Query(None, description="工人类型过滤"),
-    min_unit: Optional[float] = Query(None, description="最小单价"),
-    max_unit: Optional[float] = Query(None, description="最大单价"),
+    cursor: Optional[str] = Query(
+        None, description="分页游标（取自上一页响应头 X-Next-Cursor），提供时忽略 offset"
+    ),
+    filters: HistoryFilterParams = Depends(),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    """获取当前用户的报价历史列表（支持筛选）"""
-    # 基础查询
-    q = db.query(crud.QuotationHistory).filter(
-        crud.QuotationHistory.user_id == current_user.id
-    )
+    """获取当前用户的报价历史列表（支持筛选与游标分页）
 
-    # 时间范围
-    def parse_iso(s: Optional[str]) -> Optional[datetime]:
-        if not s:
-            return None
+    列表仅返回标量字段，request_payload/result_payload 请通过详情接口获取。
+    """
+    q = _filter_histories(db, current_user.id, filters).options(load_only(*_LIST_COLUMNS))
+
+    if cursor or offset == 0:
         try:
-            return datetime.fromisoformat(s)
-        except Exception:
-            return None
+            histories, next_cursor = crud.get_history_page(q, limit, cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e)) from e
+    else:
+        # 兼容旧的 offset 分页
+        histories = (
+            crud.order_histories_by_cursor(q).offset(offset).limit(limit + 1).all()
+        )
+        next_cursor = None
+        if len(histories) > limit:
+            histories = histories[:limit]
+            next_cursor = crud.encode_history_cursor(histories[-1])
 
-    start = parse_iso(from_dt)
-    end = parse_iso(to_dt)
-    if start:
-        q = q.filter(crud.QuotationHistory.computed_at >= start)
-    if end:
-        q = q.filter(crud.QuotationHistory.computed_at <= end)
-
-    # 其他筛选
-    if worker_type:
-        q = q.filter(crud.QuotationHistory.worker_type == worker_type)
-    if min_unit is not None:
-        q = q.filter(crud.QuotationHistory.unit_price >= min_unit)
-    if max_unit is not None:
-        q = q.filter(crud.QuotationHistory.unit_price <= max_unit)
-
-    histories = (
-        q.order_by(crud.QuotationHistory.computed_at.desc())
-        .offset(offset)
-        .limit(limit)
-        .all()
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    # 一次查询取回本页的收藏状态
+    favorited_ids = crud.get_favorited_history_ids(
+        db, current_user.id, [h.id for h in histories]
     )
+    return [_history_list_item(h, h.id in favorited_ids) for h in histories]
 
-    # 检查每条历史是否已收藏
-    result = []
-    for history in histories:
-        is_favorited = crud.check_favorite_exists(db, current_user.id, history.id)
-        history_dict = HistoryItemResponse.model_validate(history).model_dump()
-        history_dict["is_favorited"] = is_favorited
-        result.append(history_dict)
 
-    return result
+@router.get("/stats", response_model=list[HistoryStatsItem])
+async def get_history_stats(
+    group_by: Literal["day", "worker_type", "color_count"] = Query(
+        "day", description="分组维度：day / worker_type / color_count"
+    ),
+    from_date: Optional[date] = Query(None, description="起始日期（含）"),
+    to_date: Optional[date] = Query(None, description="结束日期（含）"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """报价统计（仅读取日汇总表，不扫描历史明细）"""
+    return crud.get_history_stats(db, current_user.id, group_by, from_date, to_date)
+
+
+@router.get("/search", response_model=HistorySearchResponse)
+async def search_history(
+    q: str = Query(..., min_length=1, max_length=200, description="检索词，空格分隔"),
+    worker_type: Optional[str] = None,
+    color_count: Optional[int] = Query(None, ge=1),
+    min_unit: Optional[float] = None,
+    max_unit: Optional[float] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """按收藏名称、尺寸、颜色数等全文检索历史，返回相关度排序的命中与分面统计"""
+    try:
+        return crud.search_histories(
+            db,
+            current_user.id,
+            q,
+            worker_type=worker_type,
+            color_count=color_count,
+            min_unit=min_unit,
+            max_unit=max_unit,
+            limit=limit,
+        )
+    except crud.SearchUnavailableError as e:
+        raise HTTPException(status_code=501, detail=str(e)) from None
 
 
 @router.get("/{history_id}", response_model=HistoryItemResponse)
@@ -88,15 +244,16 @@ async def get_history_detail(
     current_user: User = Depends(get_current_user),
 ):
     """获取单条历史记录详情"""
-    history = crud.get_history_by_id(db, history_id, current_user.id)
+    history, is_favorited = crud.get_history_with_favorite(
+        db, history_id, current_user.id
+    )
+    if not history:
+        # 已归档的记录从归档表解压读取（收藏记录不会被归档）
+        history = crud.get_archived_history(db, history_id, current_user.id)
     if not history:
         raise HTTPException(status_code=404, detail="历史记录不存在或无权访问")
 
-    is_favorited = crud.check_favorite_exists(db, current_user.id, history.id)
-    history_dict = HistoryItemResponse.model_validate(history).model_dump()
-    history_dict["is_favorited"] = is_favorited
-
-    return history_dict
+    return _history_item(history, is_favorited)
 
 
 @router.delete("/{history_id}")
@@ -110,6 +267,7 @@ async def delete_history_item(
     if not success:
         raise HTTPException(status_code=404, detail="历史记录不存在或无权删除")
 
+    similar_quote_index.discard([history_id])
     return {"message": "历史记录已删除"}
 
 
@@ -123,16 +281,12 @@ async def batch_delete_histories(
     if not request.history_ids:
         raise HTTPException(status_code=400, detail="请提供要删除的历史记录ID")
     
-    deleted_count = 0
-    failed_ids = []
-    
-    for history_id in request.history_ids:
-        success = crud.delete_history(db, history_id, current_user.id)
-        if success:
-            deleted_count += 1
-        else:
-            failed_ids.append(history_id)
-    
+    deleted_ids, failed_ids = crud.delete_histories(
+        db, request.history_ids, current_user.id
+    )
+    deleted_count = len(deleted_ids)
+    similar_quote_index.discard(deleted_ids)
+
     return {
         "deleted_count": deleted_count,
         "failed_count": len(failed_ids),
@@ -143,166 +297,180 @@ async def batch_delete_histories(
 
 @router.get("/export/csv")
 async def export_histories_csv(
-    db: Session = Depends(get_db),
+    filters: HistoryFilterParams = Depends(),
     current_user: User = Depends(get_current_user),
-    from_dt: Optional[str] = Query(None),
-    to_dt: Optional[str] = Query(None),
-    worker_type: Optional[str] = Query(None),
-    min_unit: Optional[float] = Query(None),
-    max_unit: Optional[float] = Query(None),
 ):
-    """导出历史为CSV"""
-    q = db.query(crud.QuotationHistory).filter(
-        crud.QuotationHistory.user_id == current_user.id
+    """导出历史为CSV（流式输出，内存占用与历史总量无关）"""
+    rows = _iter_export_rows(
+        current_user.id,
+        filters,
+        ("worker_type", "unit_price", "order_quantity", "total_price"),
+    )
+    return StreamingResponse(
+        _iter_csv(rows),
+        media_type="text/csv",
+        headers={"Content-Disposition": "attachment; filename=quotation_history.csv"},
     )
 
-    def parse_iso(s: Optional[str]):
-        if not s:
-            return None
-        try:
-            return datetime.fromisoformat(s)
-        except Exception:
-            return None
 
-    start = parse_iso(from_dt)
-    end = parse_iso(to_dt)
-    if start:
-        q = q.filter(crud.QuotationHistory.computed_at >= start)
-    if end:
-        q = q.filter(crud.QuotationHistory.computed_at <= end)
-    if worker_type:
-        q = q.filter(crud.QuotationHistory.worker_type == worker_type)
-    if min_unit is not None:
-        q = q.filter(crud.QuotationHistory.unit_price >= min_unit)
-    if max_unit is not None:
-        q = q.filter(crud.QuotationHistory.unit_price <= max_unit)
-    rows = q.order_by(crud.QuotationHistory.computed_at.desc()).all()
-    output = io.StringIO()
-    writer = csv.writer(output)
+def _iter_export_rows(
+    user_id: int, filters: HistoryFilterParams, fields: tuple[str, ...]
+) -> Iterator:
+    """依次按游标分批读取热表与归档表（归档记录均早于热表记录）
+
+    响应体在依赖清理之后才开始输出，此时请求的数据库会话已关闭，
+    因此使用独立的会话，读完（或客户端中止）时关闭。
+    """
+    db = SessionLocal()
+    try:
+        for model in (crud.QuotationHistory, crud.QuotationHistoryArchive):
+            q = _filter_histories(db, user_id, filters, model).with_entities(
+                model.id, model.computed_at, *(getattr(model, f) for f in fields)
+            )
+            yield from crud.iter_histories(q, _EXPORT_CHUNK_SIZE, model)
+    finally:
+        db.close()
+
+
+def _iter_csv(rows: Iterator) -> Iterator[str]:
+    """每批写完即输出"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
     writer.writerow(["时间", "工人类型", "单价", "数量", "总额"])
-    for h in rows:
-        qty = (
-            h.request_payload.get("order_quantity")
-            if isinstance(h.request_payload, dict)
-            else ""
-        )
+    for i, h in enumerate(rows, start=1):
         writer.writerow(
             [
                 h.computed_at.isoformat(sep=" ", timespec="seconds"),
                 h.worker_type,
                 h.unit_price,
-                qty,
+                "" if h.order_quantity is None else h.order_quantity,
                 h.total_price,
             ]
         )
-    csv_data = output.getvalue()
-    return Response(
-        content=csv_data,
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=quotation_history.csv"},
-    )
+        if i % _EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
 
 
 @router.get("/export/excel")
 async def export_histories_excel(
-    db: Session = Depends(get_db),
+    filters: HistoryFilterParams = Depends(),
     current_user: User = Depends(get_current_user),
-    from_dt: Optional[str] = Query(None),
-    to_dt: Optional[str] = Query(None),
-    worker_type: Optional[str] = Query(None),
-    min_unit: Optional[float] = Query(None),
-    max_unit: Optional[float] = Query(None),
 ):
-    """导出历史为Excel（使用openpyxl）"""
+    """导出历史为Excel（openpyxl 只写模式，写入临时文件后流式返回）"""
     try:
-        from openpyxl import Workbook
-        from openpyxl.styles import Alignment, Font
+        import openpyxl  # noqa: F401
     except ImportError:
         raise HTTPException(
             status_code=501,
             detail="Excel导出功能需要安装 openpyxl: pip install openpyxl"
         )
-    
-    q = db.query(crud.QuotationHistory).filter(
-        crud.QuotationHistory.user_id == current_user.id
-    )
 
-    def parse_iso(s: Optional[str]):
-        if not s:
-            return None
-        try:
-            return datetime.fromisoformat(s)
-        except Exception:
-            return None
+    rows = _iter_export_rows(
+        current_user.id,
+        filters,
+        (
+            "worker_type",
+            "unit_price",
+            "order_quantity",
+            "total_price",
+            "length",
+            "width",
+            "thickness",
+            "color_count",
+            "area_ratio",
+        ),
+    )
 
-    start = parse_iso(from_dt)
-    end = parse_iso(to_dt)
-    if start:
-        q = q.filter(crud.QuotationHistory.computed_at >= start)
-    if end:
-        q = q.filter(crud.QuotationHistory.computed_at <= end)
-    if worker_type:
-        q = q.filter(crud.QuotationHistory.worker_type == worker_type)
-    if min_unit is not None:
-        q = q.filter(crud.QuotationHistory.unit_price >= min_unit)
-    if max_unit is not None:
-        q = q.filter(crud.QuotationHistory.unit_price <= max_unit)
-    
-    rows = q.order_by(crud.QuotationHistory.computed_at.desc()).all()
-    
-    # 创建Excel工作簿
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "报价历史"
-    
-    # 设置表头
-    headers = ["时间", "工人类型", "单价(元)", "订单数量", "总价(元)", "长(cm)", "宽(cm)", "厚(cm)", "颜色数", "面积比例"]
-    ws.append(headers)
-    
-    # 设置表头样式
-    header_font = Font(bold=True)
-    for cell in ws[1]:
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center')
-    
-    # 填充数据
-    for h in rows:
-        request_data = h.request_payload if isinstance(h.request_payload, dict) else {}
-        ws.append([
-            h.computed_at.strftime("%Y-%m-%d %H:%M:%S"),
-            h.worker_type,
-            h.unit_price,
-            request_data.get("order_quantity", ""),
-            h.total_price,
-            request_data.get("length", ""),
-            request_data.get("width", ""),
-            request_data.get("thickness", ""),
-            request_data.get("color_count", ""),
-            request_data.get("area_ratio", ""),
-        ])
-    
-    # 调整列宽
-    for column in ws.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
-    
-    # 保存到内存
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
     filename = f"quotation_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    
-    return Response(
-        content=output.getvalue(),
+
+    return StreamingResponse(
+        _iter_excel(rows),
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         headers={"Content-Disposition": f"attachment; filename={filename}"},
     )
+
+
+_EXCEL_HEADERS = [
+    "时间", "工人类型", "单价(元)", "订单数量", "总价(元)",
+    "长(cm)", "宽(cm)", "厚(cm)", "颜色数", "面积比例",
+]
+
+
+def _excel_row(h) -> list:
+    values = [
+        h.computed_at.strftime("%Y-%m-%d %H:%M:%S"),
+        h.worker_type,
+        h.unit_price,
+        h.order_quantity,
+        h.total_price,
+        h.length,
+        h.width,
+        h.thickness,
+        h.color_count,
+        h.area_ratio,
+    ]
+    return ["" if v is None else v for v in values]
+
+
+def _iter_excel(rows: Iterator, read_size: int = 64 * 1024) -> Iterator[bytes]:
+    """分批写入只写工作簿，保存到临时文件后分块读出
+
+    rows 的数据库会话在数据写完（或写入出错）时即关闭，保存与输出文件期间不占用连接。
+    """
+    import tempfile
+
+    try:
+        wb = _build_excel(rows)
+    finally:
+        rows.close()
+
+    with tempfile.TemporaryFile() as spool:
+        wb.save(spool)
+        spool.seek(0)
+        while chunk := spool.read(read_size):
+            yield chunk
+
+
+def _build_excel(rows: Iterator):
+    """逐行写入只写工作簿（未保存）"""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Font
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("报价历史")
+
+    # 只写模式在写第一行时即输出列定义，无法事后调整列宽，
+    # 因此先缓冲首批数据，边读边累计表头与首批各列的最大宽度
+    widths = [0] * len(_EXCEL_HEADERS)
+
+    def track(values: list) -> list:
+        for i, value in enumerate(values):
+            widths[i] = max(widths[i], len(str(value)))
+        return values
+
+    track(_EXCEL_HEADERS)
+    first_chunk = [track(_excel_row(h)) for _, h in zip(range(_EXPORT_CHUNK_SIZE), rows)]
+    for i, width in enumerate(widths):
+        ws.column_dimensions[get_column_letter(i + 1)].width = min(width + 2, 50)
+
+    # 表头样式
+    header_font = Font(bold=True)
+    header_alignment = Alignment(horizontal="center")
+    header_cells = []
+    for title in _EXCEL_HEADERS:
+        cell = WriteOnlyCell(ws, value=title)
+        cell.font = header_font
+        cell.alignment = header_alignment
+        header_cells.append(cell)
+    ws.append(header_cells)
+
+    for values in first_chunk:
+        ws.append(values)
+    for h in rows:
+        ws.append(_excel_row(h))
+    return wb
@@ -1,16 +1,36 @@
 import logging
-from typing import Optional
+import os
+from datetime import datetime
+from typing import Literal, Optional
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
+from app.config import settings
 from app.db import crud
 from app.db.models import User
 from app.db.session import get_db
 from app.deps import get_current_user, get_current_user_optional
-from app.schemas.quote import QuoteRequest
-from app.services.calculator_service import compute_quote
+from app.schemas.quote import (
+    QuoteRequest,
+    QuoteSolveRequest,
+    QuoteSolveResponse,
+    ScheduleRequest,
+    ScheduleResponse,
+    SimilarQuoteItem,
+    SimilarQuoteRequest,
+)
+from app.services import import_service
+from app.services.calculator_service import (
+    build_calculator_from_db,
+    compute_quote,
+    simulate_quote_risk,
+    solve_quote,
+)
+from app.services.scheduling_service import schedule_orders_from_db
 from app.services.settings_service import create_settings_snapshot
+from app.services.similarity_service import FEATURES, similar_quote_index
 from app.utils.exceptions import handle_common_exceptions
 
 logger = logging.getLogger(__name__)
@@ -42,6 +62,7 @@ async def calculate_quote(
         order_quantity=quote_req.order_quantity,
         worker_type=quote_req.worker_type,
         debug=quote_req.debug,
+        compare_worker_types=quote_req.compare_worker_types,
     )
 
     # 附加设置快照，便于历史可追溯
@@ -59,13 +80,14 @@ async def calculate_quote(
             history = crud.create_history(
                 db=db,
                 user_id=current_user.id,
-                request_payload=quote_req.model_dump(),
+                request_payload=quote_req.model_dump(exclude={"simulation"}),
                 result_payload=result,
                 worker_type=quote_req.worker_type,
                 unit_price=result.get("产品单价", 0.0),
                 total_price=result.get("订单货款总额", 0.0),
             )
             history_id = history.id
+            similar_quote_index.add(history)
         except Exception as e:
             logger.error(f"保存历史记录失败: {e}")
             # 不影响报价结果的返回
@@ -74,4 +96,127 @@ async def calculate_quote(
     if history_id:
         result["history_id"] = history_id
 
+    # 可选：成本风险模拟（不写入历史记录）
+    if quote_req.simulation:
+        result["simulation"] = simulate_quote_risk(
+            db,
+            length=quote_req.length,
+            width=quote_req.width,
+            thickness=quote_req.thickness,
+            color_count=quote_req.color_count,
+            area_ratio=quote_req.area_ratio,
+            order_quantity=quote_req.order_quantity,
+            worker_type=quote_req.worker_type,
+            config=quote_req.simulation.model_dump(),
+        )
+
     return result
+
+
+@router.post("/solve", response_model=QuoteSolveResponse)
+async def solve_quote_target(
+    solve_req: QuoteSolveRequest,
+    db: Session = Depends(get_db),
+    current_user: Optional[User] = Depends(get_current_user_optional),
+) -> dict[str, object]:
+    """由目标单价反解最小订单数量、隐含利润率或最大尺寸/厚度/颜色数（不写入历史）"""
+    return solve_quote(
+        db,
+        solve_for=solve_req.solve_for,
+        target_unit_price=solve_req.target_unit_price,
+        params=solve_req.model_dump(exclude={"solve_for", "target_unit_price"}),
+    )
+
+
+@router.post("/similar", response_model=list[SimilarQuoteItem])
+async def similar_quotes(
+    similar_req: SimilarQuoteRequest,
+    current_user: User = Depends(get_current_user),
+):
+    """按尺寸、厚度、颜色数与面积比例查找最相近的历史报价"""
+    if similar_req.scope == "all" and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="需要管理员权限")
+
+    user_id = None if similar_req.scope == "all" else current_user.id
+    features = {f: getattr(similar_req, f) for f in FEATURES}
+    return similar_quote_index.query(features, k=similar_req.k, user_id=user_id)
+
+
+@router.post("/schedule", response_model=ScheduleResponse)
+async def schedule_quotes(
+    schedule_req: ScheduleRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """将一批订单排程到机台与班次上，返回逐单交期与产能利用率"""
+    return schedule_orders_from_db(
+        db,
+        [order.model_dump() for order in schedule_req.orders],
+        schedule_req.machines,
+        schedule_req.workers,
+    )
+
+
+_IMPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+@router.post("/import")
+async def import_quotes(
+    file: UploadFile = File(...),
+    output: Optional[Literal["csv", "xlsx"]] = Query(
+        None, description="结果文件格式，默认与上传文件相同"
+    ),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """批量导入报价：上传 CSV/XLSX，逐块报价并流式返回附带单价、总价或错误的表格"""
+    ext = os.path.splitext(file.filename or "")[1].lower()
+    fmt = import_service.IMPORT_FORMATS.get(ext)
+    if fmt is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"不支持的文件格式。仅支持: {', '.join(import_service.IMPORT_FORMATS)}",
+        )
+    output = output or fmt
+    if "xlsx" in (fmt, output):
+        try:
+            import openpyxl  # noqa: F401
+        except ImportError as e:
+            raise HTTPException(
+                status_code=501,
+                detail="Excel导入导出功能需要安装 openpyxl: pip install openpyxl",
+            ) from e
+
+    # 设置在返回前读取：流式输出期间数据库会话已关闭
+    calc = build_calculator_from_db(db)
+    try:
+        spool = import_service.spool_upload(file.file, settings.MAX_UPLOAD_SIZE)
+    except import_service.UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e)) from e
+    try:
+        rows = import_service.iter_sheet_rows(spool, fmt)
+        header = next(rows, None)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"无法解析上传文件: {e}") from e
+    if header is None:
+        raise HTTPException(status_code=400, detail="文件不能为空")
+    header, rows = import_service.strip_result_columns(header, rows)
+    try:
+        columns = import_service.map_columns(header)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+    results = import_service.quote_rows(calc, rows, columns)
+    if output == "csv":
+        body = import_service.iter_csv_output(header, results)
+    else:
+        body = import_service.iter_xlsx_output(header, results)
+    filename = f"quotation_import_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{output}"
+    return StreamingResponse(
+        body,
+        media_type=_IMPORT_MEDIA_TYPES[output],
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
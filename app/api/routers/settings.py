@@ -8,10 +8,13 @@ from app.deps import require_admin
 from app.schemas.settings import (
     AppSettingsSchema,
     SettingsResponse,
+    SettingsSimulateRequest,
+    SettingsSimulateResponse,
     SettingsUpdateRequest,
     WorkerProfileSchema,
 )
 from app.services.cache_service import invalidate_settings_cache
+from app.services.settings_service import simulate_settings
 
 router = APIRouter(tags=["系统设置"])
 
@@ -68,3 +71,31 @@ async def update_settings(
             WorkerProfileSchema.model_validate(wp) for wp in worker_profiles
         ],
     )
+
+
+@router.post("/simulate", response_model=SettingsSimulateResponse)
+async def simulate_settings_change(
+    simulate_req: SettingsSimulateRequest,
+    db: Session = Depends(get_db),
+    admin: User = Depends(require_admin),
+):
+    """预览草稿设置对最近历史报价的价格影响（仅管理员，不保存设置）"""
+    settings_overlay = (
+        simulate_req.settings.model_dump(exclude_unset=True)
+        if simulate_req.settings
+        else None
+    )
+    worker_profiles_overlay = (
+        [p.model_dump() for p in simulate_req.worker_profiles]
+        if simulate_req.worker_profiles
+        else None
+    )
+    return simulate_settings(
+        db,
+        settings_overlay,
+        worker_profiles_overlay,
+        limit=simulate_req.limit,
+        worker_type=simulate_req.worker_type,
+        start=simulate_req.from_dt,
+        end=simulate_req.to_dt,
+    )
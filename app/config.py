@@ -24,6 +24,9 @@ class Settings:
     APP_NAME: str = "PVC卡通制品报价系统"
     DEBUG: bool = os.getenv("DEBUG", "True").lower() == "true"
 
+    # 历史归档：早于该天数的报价历史可移入压缩归档表
+    HISTORY_RETENTION_DAYS: int = int(os.getenv("HISTORY_RETENTION_DAYS", "180"))
+
     # 文件上传配置
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10MB
     ALLOWED_IMAGE_EXTENSIONS: set[str] = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
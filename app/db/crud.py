@@ -1,12 +1,21 @@
+import base64
 import logging
-from typing import Optional
+from collections.abc import Iterable, Iterator
+from datetime import date, datetime
+from typing import Any, Optional
 
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import and_, func, insert, or_, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Query, Session, joinedload
 
 from app.db.models import (
+    HISTORY_FTS_TABLE,
+    HISTORY_PROMOTED_FIELDS,
     AppSettings,
     QuotationFavorite,
     QuotationHistory,
+    QuotationHistoryArchive,
+    QuotationHistoryDailyStat,
     User,
     WorkerProfile,
 )
@@ -107,8 +116,11 @@ def create_history(
         worker_type=worker_type,
         unit_price=unit_price,
         total_price=total_price,
+        **{field: request_payload.get(field) for field in HISTORY_PROMOTED_FIELDS},
     )
     db.add(history)
+    db.flush()
+    apply_history_stats(db, [history], sign=1)
     db.commit()
     db.refresh(history)
     return history
@@ -127,6 +139,125 @@ def get_user_histories(
     )
 
 
+# ==================== QuotationHistory 游标分页 ====================
+# 按 (computed_at DESC, id DESC) 排序，配合 ix_user_computed_at 索引做 keyset 分页，
+# 深翻页时无需像 OFFSET 那样逐行跳过。
+def encode_history_cursor(history: QuotationHistory) -> str:
+    """将一条历史记录的排序键编码为不透明游标"""
+    raw = f"{history.computed_at.isoformat()}|{history.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_history_cursor(cursor: str) -> tuple[datetime, int]:
+    """解析游标，格式非法时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        ts, history_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(ts), int(history_id)
+    except Exception as e:
+        raise ValueError("无效的分页游标") from e
+
+
+def order_histories_by_cursor(
+    q: Query, cursor: Optional[str] = None, model: type = QuotationHistory
+) -> Query:
+    """为查询附加 keyset 排序，若提供游标则只保留游标之后的记录
+
+    model 可为 QuotationHistory 或结构相同的 QuotationHistoryArchive。
+    """
+    if cursor:
+        computed_at, history_id = decode_history_cursor(cursor)
+        q = q.filter(
+            or_(
+                model.computed_at < computed_at,
+                and_(model.computed_at == computed_at, model.id < history_id),
+            )
+        )
+    return q.order_by(model.computed_at.desc(), model.id.desc())
+
+
+def get_history_page(
+    q: Query,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    model: type = QuotationHistory,
+) -> tuple[list[QuotationHistory], Optional[str]]:
+    """按游标获取一页历史记录，返回 (记录列表, 下一页游标)"""
+    rows = order_histories_by_cursor(q, cursor, model).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_history_cursor(rows[-1])
+
+
+def iter_histories(
+    q: Query, chunk_size: int = 500, model: type = QuotationHistory
+) -> Iterator[QuotationHistory]:
+    """按游标分块遍历查询结果，用于导出等全量场景
+
+    q 可以是实体查询，也可以是包含 id 与 computed_at 列的投影查询。
+    每块都是一次独立的短查询，不会在客户端慢速读取期间长时间持有读事务。
+    """
+    cursor = None
+    while True:
+        rows, cursor = get_history_page(q, chunk_size, cursor, model)
+        yield from rows
+        if cursor is None:
+            return
+
+
+def iter_all_histories(
+    db: Session, fields: Iterable[str], chunk_size: int = 1000
+) -> Iterator[Any]:
+    """依次遍历热表与归档表，投影为 id、computed_at 与指定列"""
+    fields = tuple(fields)
+    for model in (QuotationHistory, QuotationHistoryArchive):
+        q = db.query(model).with_entities(
+            model.id, model.computed_at, *(getattr(model, f) for f in fields)
+        )
+        yield from iter_histories(q, chunk_size, model)
+
+
+# 重新定价所需的报价参数列（均为提升列）
+HISTORY_PRICING_FIELDS = (
+    "length",
+    "width",
+    "thickness",
+    "color_count",
+    "area_ratio",
+    "order_quantity",
+    "worker_type",
+    "unit_price",
+)
+
+
+def get_history_pricing_columns(
+    db: Session,
+    limit: int,
+    worker_type: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> dict[str, list]:
+    """按列读取最近 limit 条参数完整的历史记录（全部用户），供批量重新定价"""
+    columns = [getattr(QuotationHistory, f) for f in HISTORY_PRICING_FIELDS]
+    q = db.query(*columns).filter(
+        *(getattr(QuotationHistory, f).isnot(None) for f in HISTORY_PROMOTED_FIELDS)
+    )
+    if worker_type:
+        q = q.filter(QuotationHistory.worker_type == worker_type)
+    if start:
+        q = q.filter(QuotationHistory.computed_at >= start)
+    if end:
+        q = q.filter(QuotationHistory.computed_at <= end)
+    rows = (
+        q.order_by(QuotationHistory.computed_at.desc(), QuotationHistory.id.desc())
+        .limit(limit)
+        .all()
+    )
+    values = list(zip(*rows)) or [()] * len(HISTORY_PRICING_FIELDS)
+    return {f: list(v) for f, v in zip(HISTORY_PRICING_FIELDS, values)}
+
+
 def get_history_by_id(
     db: Session, history_id: int, user_id: int
 ) -> Optional[QuotationHistory]:
@@ -137,15 +268,414 @@ def get_history_by_id(
     )
 
 
+def get_history_with_favorite(
+    db: Session, history_id: int, user_id: int
+) -> tuple[Optional[QuotationHistory], bool]:
+    """单次查询获取历史记录及其收藏状态"""
+    row = (
+        db.query(QuotationHistory, QuotationFavorite.id)
+        .outerjoin(
+            QuotationFavorite,
+            and_(
+                QuotationFavorite.history_id == QuotationHistory.id,
+                QuotationFavorite.user_id == user_id,
+            ),
+        )
+        .filter(QuotationHistory.id == history_id, QuotationHistory.user_id == user_id)
+        .first()
+    )
+    if row is None:
+        return None, False
+    return row[0], row[1] is not None
+
+
 def delete_history(db: Session, history_id: int, user_id: int) -> bool:
-    history = get_history_by_id(db, history_id, user_id)
+    """删除一条历史记录，热表中不存在时删除归档表中的同 ID 记录"""
+    history = get_history_by_id(db, history_id, user_id) or get_archived_history(
+        db, history_id, user_id
+    )
     if history:
+        apply_history_stats(db, [history], sign=-1)
         db.delete(history)
         db.commit()
         return True
     return False
 
 
+# IN 列表分批大小，避免超出 SQLite 绑定参数上限
+_IN_BATCH_SIZE = 500
+
+
+def delete_histories(
+    db: Session, history_ids: list[int], user_id: int
+) -> tuple[list[int], list[int]]:
+    """在单个事务内批量删除历史记录（连同其收藏），返回 (已删除ID, 失败ID)
+
+    热表中不存在的 ID 再到归档表中删除（归档记录没有收藏）。
+    """
+    requested = list(dict.fromkeys(history_ids))
+    owned: set[int] = set()
+    try:
+        for model in (QuotationHistory, QuotationHistoryArchive):
+            pending = [
+                history_id for history_id in requested if history_id not in owned
+            ]
+            stat_columns = [getattr(model, c.key) for c in _STAT_SOURCE_COLUMNS]
+            for i in range(0, len(pending), _IN_BATCH_SIZE):
+                batch = pending[i : i + _IN_BATCH_SIZE]
+                rows = (
+                    db.query(*stat_columns, model.id)
+                    .filter(model.user_id == user_id, model.id.in_(batch))
+                    .all()
+                )
+                if not rows:
+                    continue
+                ids = [row.id for row in rows]
+                apply_history_stats(db, rows, sign=-1)
+                if model is QuotationHistory:
+                    db.query(QuotationFavorite).filter(
+                        QuotationFavorite.history_id.in_(ids)
+                    ).delete(synchronize_session=False)
+                db.query(model).filter(
+                    model.user_id == user_id, model.id.in_(ids)
+                ).delete(synchronize_session=False)
+                owned.update(ids)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    deleted = [history_id for history_id in requested if history_id in owned]
+    failed = [history_id for history_id in requested if history_id not in owned]
+    return deleted, failed
+
+
+# ==================== 历史归档 ====================
+def get_archived_history(
+    db: Session, history_id: int, user_id: int
+) -> Optional[QuotationHistoryArchive]:
+    return (
+        db.query(QuotationHistoryArchive)
+        .filter(
+            QuotationHistoryArchive.id == history_id,
+            QuotationHistoryArchive.user_id == user_id,
+        )
+        .first()
+    )
+
+
+def archive_histories(db: Session, before: datetime, batch_size: int = 500) -> int:
+    """将早于 before 的历史记录分批移入归档表，返回归档条数
+
+    已收藏的记录保留在热表（收藏外键指向热表）；热表 ID 为 AUTOINCREMENT，
+    新记录不会复用已归档的 ID。日汇总不受影响。
+    """
+    favorited = select(QuotationFavorite.history_id)
+    total = 0
+    while True:
+        rows = (
+            db.query(QuotationHistory)
+            .filter(
+                QuotationHistory.computed_at < before,
+                QuotationHistory.id.notin_(favorited),
+            )
+            .order_by(QuotationHistory.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+        db.execute(
+            insert(QuotationHistoryArchive),
+            [
+                {
+                    "id": h.id,
+                    "user_id": h.user_id,
+                    "payload_gz": QuotationHistoryArchive.compress_payloads(
+                        h.request_payload, h.result_payload
+                    ),
+                    "worker_type": h.worker_type,
+                    "unit_price": h.unit_price,
+                    "total_price": h.total_price,
+                    "computed_at": h.computed_at,
+                    **{field: getattr(h, field) for field in HISTORY_PROMOTED_FIELDS},
+                }
+                for h in rows
+            ],
+        )
+        db.query(QuotationHistory).filter(
+            QuotationHistory.id.in_([h.id for h in rows])
+        ).delete(synchronize_session=False)
+        db.commit()
+        for h in rows:
+            db.expunge(h)
+        total += len(rows)
+    return total
+
+
+# ==================== 历史统计汇总 ====================
+# 汇总维护所需的历史列（可直接用于投影查询）
+_STAT_SOURCE_COLUMNS = (
+    QuotationHistory.user_id,
+    QuotationHistory.computed_at,
+    QuotationHistory.worker_type,
+    QuotationHistory.color_count,
+    QuotationHistory.order_quantity,
+    QuotationHistory.unit_price,
+    QuotationHistory.total_price,
+)
+_STAT_BUCKET_KEYS = ("user_id", "day", "worker_type", "color_count")
+_STAT_MEASURES = ("quote_count", "quantity_sum", "unit_price_sum", "total_price_sum")
+
+
+def apply_history_stats(db: Session, rows: Iterable[Any], sign: int) -> None:
+    """将一批历史记录计入（sign=1）或移出（sign=-1）日汇总，不提交事务"""
+    deltas: dict[tuple, list[float]] = {}
+    for row in rows:
+        bucket = (
+            row.user_id,
+            row.computed_at.date(),
+            row.worker_type,
+            -1 if row.color_count is None else row.color_count,
+        )
+        delta = deltas.setdefault(bucket, [0, 0, 0.0, 0.0])
+        delta[0] += 1
+        delta[1] += row.order_quantity or 0
+        delta[2] += row.unit_price
+        delta[3] += row.total_price
+
+    for bucket, delta in deltas.items():
+        _upsert_history_stat(
+            db,
+            dict(zip(_STAT_BUCKET_KEYS, bucket)),
+            {m: sign * v for m, v in zip(_STAT_MEASURES, delta)},
+        )
+
+    if sign < 0 and deltas:
+        user_ids = {bucket[0] for bucket in deltas}
+        db.query(QuotationHistoryDailyStat).filter(
+            QuotationHistoryDailyStat.user_id.in_(user_ids),
+            QuotationHistoryDailyStat.quote_count <= 0,
+        ).delete(synchronize_session=False)
+
+
+def _upsert_history_stat(
+    db: Session, key: dict[str, Any], delta: dict[str, float]
+) -> None:
+    Stat = QuotationHistoryDailyStat
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        dialect_insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = dialect_insert(Stat).values(**key, **delta)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(_STAT_BUCKET_KEYS),
+            set_={m: getattr(Stat, m) + stmt.excluded[m] for m in _STAT_MEASURES},
+        )
+        db.execute(stmt)
+        return
+
+    stat = db.query(Stat).filter_by(**key).first()
+    if stat is None:
+        db.add(Stat(**key, **delta))
+    else:
+        for m, v in delta.items():
+            setattr(stat, m, getattr(stat, m) + v)
+
+
+def rebuild_history_stats(db: Session, user_id: Optional[int] = None) -> int:
+    """从原始历史记录全量重算日汇总，返回汇总行数"""
+    Stat = QuotationHistoryDailyStat
+    stats_q = db.query(Stat)
+    if user_id is not None:
+        stats_q = stats_q.filter(Stat.user_id == user_id)
+    stats_q.delete(synchronize_session=False)
+
+    # 归档只是转移存储，归档记录仍计入统计
+    buckets: dict[tuple, list] = {}
+    for model in (QuotationHistory, QuotationHistoryArchive):
+        day = func.date(model.computed_at)
+        color_count = func.coalesce(model.color_count, -1)
+        q = db.query(
+            model.user_id,
+            day,
+            model.worker_type,
+            color_count,
+            func.count(model.id),
+            func.coalesce(func.sum(model.order_quantity), 0),
+            func.sum(model.unit_price),
+            func.sum(model.total_price),
+        )
+        if user_id is not None:
+            q = q.filter(model.user_id == user_id)
+        q = q.group_by(model.user_id, day, model.worker_type, color_count)
+
+        for uid, d, worker_type, colors, *measures in q:
+            d = d if isinstance(d, date) else date.fromisoformat(d)
+            totals = buckets.setdefault((uid, d, worker_type, colors), [0, 0, 0.0, 0.0])
+            for i, v in enumerate(measures):
+                totals[i] += v
+
+    values = [
+        {**dict(zip(_STAT_BUCKET_KEYS, bucket)), **dict(zip(_STAT_MEASURES, totals))}
+        for bucket, totals in buckets.items()
+    ]
+    if values:
+        db.execute(insert(Stat), values)
+    db.commit()
+    return len(values)
+
+
+def get_history_stats(
+    db: Session,
+    user_id: int,
+    group_by: str = "day",
+    start_day: Optional[date] = None,
+    end_day: Optional[date] = None,
+) -> list[dict[str, Any]]:
+    """从日汇总表读取统计结果，group_by 可选 day / worker_type / color_count"""
+    Stat = QuotationHistoryDailyStat
+    key = {
+        "day": Stat.day,
+        "worker_type": Stat.worker_type,
+        "color_count": Stat.color_count,
+    }[group_by]
+    q = db.query(
+        key,
+        func.sum(Stat.quote_count),
+        func.sum(Stat.quantity_sum),
+        func.sum(Stat.unit_price_sum),
+        func.sum(Stat.total_price_sum),
+    ).filter(Stat.user_id == user_id)
+    if start_day:
+        q = q.filter(Stat.day >= start_day)
+    if end_day:
+        q = q.filter(Stat.day <= end_day)
+
+    return [
+        {
+            "key": k,
+            "quote_count": count,
+            "total_quantity": quantity,
+            "total_revenue": round(revenue, 2),
+            "avg_unit_price": round(unit_sum / count, 4) if count else 0.0,
+        }
+        for k, count, quantity, unit_sum, revenue in q.group_by(key).order_by(key)
+    ]
+
+
+# ==================== 历史全文检索 ====================
+# 颜色数分面的分桶（与默认颜色产能映射的区间一致）
+HISTORY_COLOR_BUCKETS = ((1, 2), (3, 5), (6, 8), (9, 11), (12, 14), (15, 18))
+
+# trigram 分词要求检索词至少 3 个字符，更短的词退化为子串匹配
+_FTS_MIN_TERM_LENGTH = 3
+
+# 检索词只匹配 names 与 spec 列，user_tok 列仅用于按用户收窄候选行
+_FTS_TEXT_COLUMNS = "{names spec}"
+
+class SearchUnavailableError(RuntimeError):
+    """当前数据库不支持全文检索（FTS5 仅在 SQLite 上建立）"""
+
+
+_SEARCH_HIT_COLUMNS = (
+    "rowid AS id, names, spec, worker_type, color_count, "
+    "unit_price, total_price, computed_at"
+)
+
+
+def _color_bucket_sql() -> str:
+    cases = " ".join(
+        f"WHEN color_count BETWEEN {lo} AND {hi} THEN '{lo}-{hi}色'"
+        for lo, hi in HISTORY_COLOR_BUCKETS
+    )
+    return f"CASE WHEN color_count IS NULL THEN '未知' {cases} ELSE '其他' END"
+
+
+def search_histories(
+    db: Session,
+    user_id: int,
+    query: str,
+    worker_type: Optional[str] = None,
+    color_count: Optional[int] = None,
+    min_unit: Optional[float] = None,
+    max_unit: Optional[float] = None,
+    limit: int = 20,
+) -> dict[str, Any]:
+    """在收藏名称与规格描述中全文检索当前用户的历史记录
+
+    命中按 BM25 相关度排序（收藏名称权重更高）；分面统计覆盖全部命中，
+    均直接在 FTS 索引上计算，不回表。返回 {"total", "hits", "facets"}。
+
+    Raises:
+        SearchUnavailableError: 数据库不是 SQLite
+    """
+    if db.get_bind().dialect.name != "sqlite":
+        raise SearchUnavailableError("全文检索仅支持 SQLite")
+
+    conditions = [f"{HISTORY_FTS_TABLE} MATCH :match", "user_id = :user_id"]
+    params: dict[str, Any] = {"user_id": user_id}
+    phrases = []
+    for i, term in enumerate(query.split()):
+        if len(term) >= _FTS_MIN_TERM_LENGTH:
+            phrases.append('"' + term.replace('"', '""') + '"')
+        else:
+            conditions.append(f"instr(lower(names || ' ' || spec), :term_{i}) > 0")
+            params[f"term_{i}"] = term.lower()
+    # 用户令牌与检索词在同一个 MATCH 中求交，候选行不会扫描到其他用户的记录
+    match = f'user_tok : "u{user_id}u"'
+    if phrases:
+        match += f" AND {_FTS_TEXT_COLUMNS} : ({' AND '.join(phrases)})"
+    params["match"] = match
+    if worker_type:
+        conditions.append("worker_type = :worker_type")
+        params["worker_type"] = worker_type
+    if color_count is not None:
+        conditions.append("color_count = :color_count")
+        params["color_count"] = color_count
+    if min_unit is not None:
+        conditions.append("unit_price >= :min_unit")
+        params["min_unit"] = min_unit
+    if max_unit is not None:
+        conditions.append("unit_price <= :max_unit")
+        params["max_unit"] = max_unit
+
+    where = " AND ".join(conditions)
+    if phrases:
+        score = f"-bm25({HISTORY_FTS_TABLE}, 2.0, 1.0, 0.0)"
+        order_by = "score DESC, rowid DESC"
+    else:
+        score = "NULL"
+        order_by = "rowid DESC"
+
+    hits = db.execute(
+        text(
+            f"SELECT {_SEARCH_HIT_COLUMNS}, {score} AS score "
+            f"FROM {HISTORY_FTS_TABLE} WHERE {where} "
+            f"ORDER BY {order_by} LIMIT :limit"
+        ),
+        {**params, "limit": limit},
+    ).mappings()
+    hits = [dict(hit) for hit in hits]
+
+    facets = {}
+    for name, expr in (
+        ("worker_type", "worker_type"),
+        ("color_count", _color_bucket_sql()),
+    ):
+        rows = db.execute(
+            text(
+                f"SELECT {expr} AS value, count(*) AS count "
+                f"FROM {HISTORY_FTS_TABLE} WHERE {where} "
+                "GROUP BY value ORDER BY count DESC, value"
+            ),
+            params,
+        ).all()
+        facets[name] = [{"value": value, "count": count} for value, count in rows]
+
+    total = sum(f["count"] for f in facets["worker_type"])
+    return {"total": total, "hits": hits, "facets": facets}
+
+
 # ==================== QuotationFavorite CRUD ====================
 def create_favorite(
     db: Session, user_id: int, history_id: int, name: Optional[str] = None
@@ -188,6 +718,23 @@ def delete_favorite(db: Session, favorite_id: int, user_id: int) -> bool:
     return False
 
 
+def get_favorited_history_ids(
+    db: Session, user_id: int, history_ids: list[int]
+) -> set[int]:
+    """批量查询一组历史记录中已被收藏的 ID（避免逐行查询）"""
+    if not history_ids:
+        return set()
+    rows = (
+        db.query(QuotationFavorite.history_id)
+        .filter(
+            QuotationFavorite.user_id == user_id,
+            QuotationFavorite.history_id.in_(history_ids),
+        )
+        .all()
+    )
+    return {row[0] for row in rows}
+
+
 def check_favorite_exists(db: Session, user_id: int, history_id: int) -> bool:
     return (
         db.query(QuotationFavorite)
@@ -0,0 +1,326 @@
+"""轻量级数据库迁移：补齐新增列并回填数据（幂等，随 init_db 执行）"""
+
+import json
+import logging
+
+from sqlalchemy import column, func, inspect, select, table, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable
+
+from app.db import crud
+from app.db.models import (
+    HISTORY_FTS_TABLE,
+    HISTORY_PROMOTED_FIELDS,
+    Base,
+    QuotationHistory,
+    QuotationHistoryArchive,
+    QuotationHistoryDailyStat,
+)
+from app.db.types import encode_payload
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def add_missing_columns(engine: Engine) -> None:
+    """为已存在的表补齐模型中新增的可空列（create_all 不会修改已有表）"""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for tbl in Base.metadata.sorted_tables:
+            if tbl.name not in existing_tables:
+                continue
+            existing = {c["name"] for c in inspector.get_columns(tbl.name)}
+            for col in tbl.columns:
+                if col.name in existing or not col.nullable:
+                    continue
+                col_type = col.type.compile(dialect=engine.dialect)
+                logger.info(f"迁移：为 {tbl.name} 添加列 {col.name} {col_type}")
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {tbl.name} ADD COLUMN {col.name} {col_type}"
+                )
+
+
+def ensure_history_autoincrement(engine: Engine) -> bool:
+    """将旧库的 quotation_history 重建为 AUTOINCREMENT 表（仅 SQLite），返回是否重建
+
+    ID 序列同时对齐归档表的最大 ID；重建时删除的索引与全文检索触发器由后续迁移步骤补建。
+    """
+    if engine.dialect.name != "sqlite":
+        return False
+    name = QuotationHistory.__tablename__
+    with engine.begin() as conn:
+        ddl = conn.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+        ).scalar()
+        if ddl is None or "AUTOINCREMENT" in ddl.upper():
+            return False
+
+        logger.info(f"迁移：重建 {name} 为 AUTOINCREMENT 表")
+        staging = f"{name}__autoincrement"
+        create = str(
+            CreateTable(QuotationHistory.__table__).compile(dialect=engine.dialect)
+        )
+        conn.exec_driver_sql(
+            create.replace(f"CREATE TABLE {name} ", f"CREATE TABLE {staging} ", 1)
+        )
+        columns = ", ".join(c.name for c in QuotationHistory.__table__.columns)
+        conn.exec_driver_sql(
+            f"INSERT INTO {staging} ({columns}) SELECT {columns} FROM {name}"
+        )
+        # 全文检索触发器正文引用了该表，需先删除，否则改名时校验失败
+        _drop_history_search_triggers(conn)
+        conn.exec_driver_sql(f"DROP TABLE {name}")
+        conn.exec_driver_sql(f"ALTER TABLE {staging} RENAME TO {name}")
+
+        archived_max = conn.execute(
+            select(func.max(QuotationHistoryArchive.id))
+        ).scalar()
+        if archived_max is not None:
+            updated = conn.exec_driver_sql(
+                "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?",
+                (archived_max, name),
+            ).rowcount
+            if not updated:
+                conn.exec_driver_sql(
+                    "INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)",
+                    (name, archived_max),
+                )
+    return True
+
+
+def create_missing_indexes(engine: Engine) -> None:
+    """为已存在的表补建模型中新增的索引"""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    for tbl in Base.metadata.sorted_tables:
+        if tbl.name not in existing_tables:
+            continue
+        existing = {ix["name"] for ix in inspector.get_indexes(tbl.name)}
+        for index in tbl.indexes:
+            if index.name not in existing:
+                logger.info(f"迁移：为 {tbl.name} 创建索引 {index.name}")
+                index.create(bind=engine)
+
+
+def backfill_history_promoted_fields(engine: Engine) -> int:
+    """从 request_payload 回填提升列，返回回填行数
+
+    只处理提升列全部为空、快照仍为 JSON 文本的旧记录（提升列引入之后写入的记录在插入时
+    即已填好），用一条 json_extract 的 UPDATE 在数据库内完成；需在快照转换为二进制编码前执行。
+    仅处理 SQLite（json_valid / json_extract 为 SQLite 的 JSON 函数）。
+    """
+    if engine.dialect.name != "sqlite":
+        return 0
+    # 不带类型的表对象：直接引用原始存储值，绕过 CompactJSON 的编解码
+    raw = table(
+        QuotationHistory.__tablename__,
+        column("request_payload"),
+        *(column(field) for field in HISTORY_PROMOTED_FIELDS),
+    )
+    payload = raw.c.request_payload
+    with engine.begin() as conn:
+        total = conn.execute(
+            update(raw)
+            .where(
+                *(raw.c[field].is_(None) for field in HISTORY_PROMOTED_FIELDS),
+                func.json_valid(payload) == 1,
+            )
+            .values(
+                {
+                    field: func.json_extract(payload, f"$.{field}")
+                    for field in HISTORY_PROMOTED_FIELDS
+                }
+            )
+        ).rowcount
+
+    if total:
+        logger.info(f"迁移：已回填 {total} 条历史记录的提升字段")
+    return total
+
+
+def convert_history_payloads(engine: Engine) -> int:
+    """将以 JSON 文本存储的历史快照转换为紧凑二进制编码，返回转换行数
+
+    仅处理 SQLite（列类型可直接容纳二进制值）；旧数据在转换前仍可正常读取。
+    """
+    if engine.dialect.name != "sqlite":
+        return 0
+    # 不带类型的表对象：按原始存储值读写，绕过 CompactJSON 的编解码
+    raw = table(
+        QuotationHistory.__tablename__,
+        column("id"),
+        column("request_payload"),
+        column("result_payload"),
+    )
+    is_text = (func.typeof(raw.c.request_payload) == "text") | (
+        func.typeof(raw.c.result_payload) == "text"
+    )
+
+    total = 0
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(raw.c.id, raw.c.request_payload, raw.c.result_payload)
+                .where(is_text, raw.c.id > last_id)
+                .order_by(raw.c.id)
+                .limit(BACKFILL_BATCH_SIZE)
+            ).all()
+            if not rows:
+                break
+            for history_id, request_payload, result_payload in rows:
+                values = {
+                    name: encode_payload(json.loads(value))
+                    for name, value in (
+                        ("request_payload", request_payload),
+                        ("result_payload", result_payload),
+                    )
+                    if isinstance(value, str)
+                }
+                conn.execute(update(raw).where(raw.c.id == history_id).values(values))
+            last_id = rows[-1][0]
+            total += len(rows)
+
+    if total:
+        logger.info(f"迁移：已将 {total} 条历史快照转换为紧凑编码")
+    return total
+
+
+def ensure_history_stats(engine: Engine) -> None:
+    """汇总表为空但已有历史记录时（首次升级），从原始历史初始化汇总"""
+    with Session(engine) as db:
+        if db.query(QuotationHistoryDailyStat.id).first() is not None:
+            return
+        if db.query(QuotationHistory.id).first() is None:
+            return
+        count = crud.rebuild_history_stats(db)
+        logger.info(f"迁移：已初始化 {count} 条历史日汇总")
+
+
+# 检索文本：收藏名称（names）与规格描述（spec，如 "3x2x0.4cm 4色 standard"）；
+# user_tok 为用户令牌（"u<id>u"，首尾的 u 避免 u12 命中 u123），检索时与关键词一并 MATCH，
+# 候选行直接由倒排索引限定在当前用户内；其余列为 UNINDEXED，供筛选、分面统计与结果展示
+# 直接从索引读取
+_FTS_SPEC_SQL = """
+    CASE WHEN {row}.length IS NULL THEN '' ELSE
+        printf('%gx%gx%gcm ', {row}.length, {row}.width, {row}.thickness) END
+    || CASE WHEN {row}.color_count IS NULL THEN '' ELSE
+        printf('%d色 ', {row}.color_count) END
+    || {row}.worker_type
+"""
+_FTS_USER_TOKEN_SQL = "'u' || {row}.user_id || 'u'"
+_FTS_NAMES_SQL = """
+    coalesce((SELECT group_concat(name, ' ') FROM quotation_favorites
+              WHERE history_id = {history_id} AND name IS NOT NULL), '')
+"""
+_FTS_INSERT_SQL = f"""
+    INSERT INTO {HISTORY_FTS_TABLE} (rowid, names, spec, user_tok, user_id,
+        worker_type, color_count, unit_price, total_price, computed_at)
+"""
+_FTS_INSERT_ROW_SQL = (
+    _FTS_INSERT_SQL
+    + "VALUES (new.id, "
+    + _FTS_NAMES_SQL.format(history_id="new.id")
+    + ", "
+    + _FTS_SPEC_SQL.format(row="new")
+    + ", "
+    + _FTS_USER_TOKEN_SQL.format(row="new")
+    + """, new.user_id, new.worker_type, new.color_count, new.unit_price,
+        new.total_price, new.computed_at);"""
+)
+_FTS_REFRESH_NAMES_SQL = (
+    f"UPDATE {HISTORY_FTS_TABLE} SET names = "
+    + _FTS_NAMES_SQL.format(history_id="{row}.history_id")
+    + " WHERE rowid = {row}.history_id;"
+)
+
+_FTS_DDL = (
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {HISTORY_FTS_TABLE} USING fts5(
+        names, spec, user_tok,
+        user_id UNINDEXED, worker_type UNINDEXED, color_count UNINDEXED,
+        unit_price UNINDEXED, total_price UNINDEXED, computed_at UNINDEXED,
+        tokenize = 'trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {HISTORY_FTS_TABLE}_ai
+        AFTER INSERT ON quotation_history BEGIN {_FTS_INSERT_ROW_SQL} END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {HISTORY_FTS_TABLE}_au
+        AFTER UPDATE ON quotation_history BEGIN
+            DELETE FROM {HISTORY_FTS_TABLE} WHERE rowid = old.id;
+            {_FTS_INSERT_ROW_SQL}
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {HISTORY_FTS_TABLE}_ad
+        AFTER DELETE ON quotation_history BEGIN
+            DELETE FROM {HISTORY_FTS_TABLE} WHERE rowid = old.id;
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {HISTORY_FTS_TABLE}_fav_ai
+        AFTER INSERT ON quotation_favorites BEGIN
+            {_FTS_REFRESH_NAMES_SQL.format(row="new")}
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {HISTORY_FTS_TABLE}_fav_au
+        AFTER UPDATE OF name, history_id ON quotation_favorites BEGIN
+            {_FTS_REFRESH_NAMES_SQL.format(row="old")}
+            {_FTS_REFRESH_NAMES_SQL.format(row="new")}
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {HISTORY_FTS_TABLE}_fav_ad
+        AFTER DELETE ON quotation_favorites BEGIN
+            {_FTS_REFRESH_NAMES_SQL.format(row="old")}
+        END""",
+)
+
+
+def _drop_history_search_triggers(conn: Connection) -> None:
+    triggers = conn.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE ?",
+        (f"{HISTORY_FTS_TABLE}_%",),
+    ).scalars()
+    for trigger in list(triggers):
+        conn.exec_driver_sql(f"DROP TRIGGER {trigger}")
+
+
+def ensure_history_search_index(engine: Engine) -> None:
+    """创建历史全文检索表与同步触发器（仅 SQLite）；索引为空时从现有数据填充
+
+    已有索引的列与当前定义不一致（缺少 user_tok）时删除重建。
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        existing = conn.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (HISTORY_FTS_TABLE,),
+        ).scalar()
+        if existing is not None and "user_tok" not in existing:
+            logger.info(f"迁移：{HISTORY_FTS_TABLE} 结构已变更，重建全文索引")
+            _drop_history_search_triggers(conn)
+            conn.exec_driver_sql(f"DROP TABLE {HISTORY_FTS_TABLE}")
+        for ddl in _FTS_DDL:
+            conn.exec_driver_sql(ddl)
+        if conn.exec_driver_sql(f"SELECT 1 FROM {HISTORY_FTS_TABLE} LIMIT 1").first():
+            return
+        result = conn.exec_driver_sql(
+            _FTS_INSERT_SQL
+            + "SELECT h.id, "
+            + _FTS_NAMES_SQL.format(history_id="h.id")
+            + ", "
+            + _FTS_SPEC_SQL.format(row="h")
+            + ", "
+            + _FTS_USER_TOKEN_SQL.format(row="h")
+            + """, h.user_id, h.worker_type, h.color_count, h.unit_price,
+                h.total_price, h.computed_at FROM quotation_history AS h"""
+        )
+        if result.rowcount:
+            logger.info(f"迁移：已为 {result.rowcount} 条历史记录建立全文索引")
+
+
+def run_migrations(engine: Engine) -> None:
+    """执行全部迁移步骤"""
+    add_missing_columns(engine)
+    ensure_history_autoincrement(engine)
+    backfill_history_promoted_fields(engine)
+    convert_history_payloads(engine)
+    create_missing_indexes(engine)
+    ensure_history_stats(engine)
+    ensure_history_search_index(engine)
@@ -1,25 +1,44 @@
+import gzip
+import json
 from datetime import datetime
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any
 
 from sqlalchemy import (
     JSON,
     Boolean,
     Column,
+    Date,
     DateTime,
     Float,
     ForeignKey,
     Index,
     Integer,
+    LargeBinary,
     String,
     UniqueConstraint,
 )
 from sqlalchemy.orm import declarative_base, relationship
 
+from app.db.types import CompactJSON
+
 if TYPE_CHECKING:
     pass
 
 Base = declarative_base()
 
+# 历史全文检索的 FTS5 虚拟表（仅 SQLite，由触发器与历史/收藏保持同步，见 migrations）
+HISTORY_FTS_TABLE = "quotation_history_fts"
+
+# 从 request_payload 提升为独立列的字段：列表展示直接读取列，无需解析 JSON
+HISTORY_PROMOTED_FIELDS = (
+    "order_quantity",
+    "length",
+    "width",
+    "thickness",
+    "color_count",
+    "area_ratio",
+)
+
 
 class User(Base):
     __tablename__ = "users"
@@ -98,14 +117,20 @@ class QuotationHistory(Base):
         Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True
     )
 
-    # 请求与响应快照
-    request_payload = Column(JSON, nullable=False)
-    result_payload = Column(JSON, nullable=False)
+    # 请求与响应快照（紧凑二进制编码，见 app.db.types）
+    request_payload = Column(CompactJSON, nullable=False)
+    result_payload = Column(CompactJSON, nullable=False)
 
     # 冗余字段（便于列表展示与筛选）
     worker_type = Column(String(50), nullable=False)
     unit_price = Column(Float, nullable=False)
     total_price = Column(Float, nullable=False)
+    order_quantity = Column(Integer, nullable=True)
+    length = Column(Float, nullable=True)
+    width = Column(Float, nullable=True)
+    thickness = Column(Float, nullable=True)
+    color_count = Column(Integer, nullable=True)
+    area_ratio = Column(Float, nullable=True)
 
     computed_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
 
@@ -119,6 +144,10 @@ class QuotationHistory(Base):
     __table_args__ = (
         Index("ix_user_computed_at", "user_id", "computed_at"),
         Index("ix_worker_type_computed_at", "worker_type", "computed_at"),
+        Index("ix_user_color_count", "user_id", "color_count"),
+        Index("ix_user_length_width", "user_id", "length", "width"),
+        # AUTOINCREMENT：新 ID 不复用已删除或已归档记录的 ID
+        {"sqlite_autoincrement": True},
     )
 
 
@@ -148,3 +177,81 @@ class QuotationFavorite(Base):
         UniqueConstraint("user_id", "history_id", name="uq_user_history"),
         Index("ix_user_created_at", "user_id", "created_at"),
     )
+
+
+class QuotationHistoryDailyStat(Base):
+    """报价历史日汇总：随历史写入/删除增量维护，供统计看板读取"""
+
+    __tablename__ = "quotation_history_daily_stats"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    day = Column(Date, nullable=False)
+    worker_type = Column(String(50), nullable=False)
+    color_count = Column(Integer, nullable=False)  # 未知颜色数记为 -1
+
+    quote_count = Column(Integer, nullable=False, default=0)
+    quantity_sum = Column(Integer, nullable=False, default=0)
+    unit_price_sum = Column(Float, nullable=False, default=0.0)
+    total_price_sum = Column(Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "user_id", "day", "worker_type", "color_count", name="uq_daily_stat_bucket"
+        ),
+    )
+
+
+class QuotationHistoryArchive(Base):
+    """冷数据归档：超出保留期的历史记录，保留原 ID 与标量列，快照压缩存储"""
+
+    __tablename__ = "quotation_history_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)  # 与原历史记录 ID 相同
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+
+    # gzip 压缩的 {"request": ..., "result": ...} JSON
+    payload_gz = Column(LargeBinary, nullable=False)
+
+    worker_type = Column(String(50), nullable=False)
+    unit_price = Column(Float, nullable=False)
+    total_price = Column(Float, nullable=False)
+    order_quantity = Column(Integer, nullable=True)
+    length = Column(Float, nullable=True)
+    width = Column(Float, nullable=True)
+    thickness = Column(Float, nullable=True)
+    color_count = Column(Integer, nullable=True)
+    area_ratio = Column(Float, nullable=True)
+
+    computed_at = Column(DateTime, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (Index("ix_archive_user_computed_at", "user_id", "computed_at"),)
+
+    @staticmethod
+    def compress_payloads(request_payload: Any, result_payload: Any) -> bytes:
+        raw = json.dumps(
+            {"request": request_payload, "result": result_payload},
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+        return gzip.compress(raw.encode("utf-8"))
+
+    def _payloads(self) -> dict:
+        cached = self.__dict__.get("_payload_cache")
+        if cached is None:
+            cached = json.loads(gzip.decompress(self.payload_gz).decode("utf-8"))
+            self.__dict__["_payload_cache"] = cached
+        return cached
+
+    @property
+    def request_payload(self) -> Any:
+        return self._payloads()["request"]
+
+    @property
+    def result_payload(self) -> Any:
+        return self._payloads()["result"]
@@ -27,6 +27,10 @@ def init_db():
     Base.metadata.create_all(bind=engine)
     logger.info("数据库表创建完成")
 
+    from app.db.migrations import run_migrations
+
+    run_migrations(engine)
+
     # 导入并执行种子
     from app.db.seed import seed_database
 
@@ -0,0 +1,205 @@
+"""自定义列类型：报价快照的紧凑二进制编码"""
+
+import json
+import zlib
+from typing import Any, Optional
+
+from sqlalchemy import LargeBinary
+from sqlalchemy.types import TypeDecorator
+
+# 快照中反复出现的键（结果中文键、设置快照与调试信息字段）。
+# 编码后以 "~<base36 序号>" 代替原键，序号即在此元组中的位置：
+# 只能在末尾追加，不可删除或调整顺序，否则已存储的数据无法解码。
+PAYLOAD_KEYS: tuple[str, ...] = (
+    # 报价请求
+    "length",
+    "width",
+    "thickness",
+    "color_count",
+    "area_ratio",
+    "order_quantity",
+    "worker_type",
+    "debug",
+    # 报价结果
+    "产品单价",
+    "订单货款总额",
+    "订单数量",
+    "工人类型",
+    "每模产品数",
+    "单班产量(个)",
+    "需要班数",
+    "单个产品材料成本",
+    "单个产品平均生产成本",
+    "单个产品出厂成本(含废品率)",
+    "单个产品克重(g)",
+    "--- 成本明细 (供内部参考) ---",
+    # 设置快照
+    "settings_snapshot",
+    "settings",
+    "worker_profiles",
+    "name",
+    "monthly_salary",
+    "machines_operated",
+    "profit_margin",
+    "waste_rate",
+    "material_density",
+    "material_price_per_gram",
+    "mold_edge_length",
+    "mold_spacing",
+    "base_molds_per_shift",
+    "working_days_per_month",
+    "shifts_per_day",
+    "needles_per_machine",
+    "setup_fee_per_color",
+    "base_setup_fee",
+    "coloring_fee_per_color_per_shift",
+    "other_salary_per_cell_shift",
+    "rent_per_cell_shift",
+    "electricity_fee_per_cell_shift",
+    "color_output_map",
+    "min_colors",
+    "max_colors",
+    "molds_per_shift",
+    # 调试信息
+    "debug_info",
+    "input_params",
+    "system_params",
+    "worker_profile",
+    "capacity_calculation",
+    "material_cost",
+    "setup_cost",
+    "shift_cost",
+    "total_cost",
+    "产品长度(cm)",
+    "产品宽度(cm)",
+    "产品厚度(cm)",
+    "颜色数量",
+    "占用面积比例",
+    "利润率",
+    "废品率",
+    "材料密度(g/cm³)",
+    "材料价格(元/g)",
+    "模具可用边长(cm)",
+    "产品间距(cm)",
+    "每台机台针头数",
+    "每日班数",
+    "每月工作天数",
+    "调机费/颜色(元)",
+    "基础调机费(元)",
+    "调色费/颜色/班(元)",
+    "月薪(元)",
+    "操作机台数",
+    "根据颜色数确定的单班产模数",
+    "每模产品数(个)",
+    "产品使用针头数",
+    "单班生产单元综合成本(元)",
+    "完成订单需要班数",
+    "单个产品材料成本(元)",
+    "单个产品平均生产成本(元)",
+    "单个产品出厂成本(含废品率)(元)",
+    "产品销售单价(元)",
+    "订单材料总成本(元)",
+    "订单班次总成本(元)",
+    "订单固定调机费(元)",
+    "订单生产总成本(元)",
+    "订单货款总额(元)",
+    "1-2色",
+    "3-5色",
+    "6-8色",
+    "9-11色",
+    "12-14色",
+    "15-18色",
+)
+
+_KEY_PREFIX = "~"
+_BASE36 = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+# 首字节标识编码格式
+_FORMAT_RAW = b"\x01"  # 键驻留后的紧凑 JSON
+_FORMAT_ZLIB = b"\x02"  # 同上，再经 zlib 压缩
+_COMPRESS_THRESHOLD = 256  # 字节数低于该值时压缩收益不足，直接存储
+
+
+def _base36(n: int) -> str:
+    digits = ""
+    while True:
+        n, r = divmod(n, 36)
+        digits = _BASE36[r] + digits
+        if n == 0:
+            return digits
+
+
+_KEY_TO_TOKEN = {key: _KEY_PREFIX + _base36(i) for i, key in enumerate(PAYLOAD_KEYS)}
+_TOKEN_TO_KEY = {token: key for key, token in _KEY_TO_TOKEN.items()}
+
+
+def _intern(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        out = {}
+        for key, value in obj.items():
+            key = str(key)
+            token = _KEY_TO_TOKEN.get(key)
+            if token is None:
+                # 原键本身以前缀开头时转义，避免与驻留键混淆
+                token = _KEY_PREFIX + key if key.startswith(_KEY_PREFIX) else key
+            out[token] = _intern(value)
+        return out
+    if isinstance(obj, (list, tuple)):
+        return [_intern(v) for v in obj]
+    return obj
+
+
+def _unintern(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        out = {}
+        for token, value in obj.items():
+            if token.startswith(_KEY_PREFIX):
+                key = _TOKEN_TO_KEY.get(token) or token[1:]
+            else:
+                key = token
+            out[key] = _unintern(value)
+        return out
+    if isinstance(obj, list):
+        return [_unintern(v) for v in obj]
+    return obj
+
+
+def encode_payload(value: Any) -> bytes:
+    """编码快照：键驻留 + 紧凑 JSON，较大的快照再做 zlib 压缩"""
+    raw = json.dumps(_intern(value), ensure_ascii=False, separators=(",", ":")).encode(
+        "utf-8"
+    )
+    if len(raw) >= _COMPRESS_THRESHOLD:
+        return _FORMAT_ZLIB + zlib.compress(raw)
+    return _FORMAT_RAW + raw
+
+
+def decode_payload(data: Any) -> Any:
+    """解码快照；兼容迁移前以 JSON 文本存储的旧数据"""
+    if isinstance(data, str):
+        return json.loads(data)
+    data = bytes(data)
+    head, body = data[:1], data[1:]
+    if head == _FORMAT_ZLIB:
+        body = zlib.decompress(body)
+    elif head != _FORMAT_RAW:
+        # 未带格式头：旧 JSON 以二进制形式读出
+        return json.loads(data)
+    return _unintern(json.loads(body))
+
+
+class CompactJSON(TypeDecorator):
+    """以紧凑二进制存储 JSON 快照，对 ORM 读写透明"""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value: Any, dialect: Any) -> Optional[bytes]:
+        if value is None:
+            return None
+        return encode_payload(value)
+
+    def process_result_value(self, value: Any, dialect: Any) -> Any:
+        if value is None:
+            return None
+        return decode_payload(value)
@@ -22,7 +22,8 @@ from app.api.routers import (
     upload,
 )
 from app.config import settings as config_settings
-from app.db.session import init_db
+from app.db.session import SessionLocal, init_db
+from app.services.similarity_service import similar_quote_index
 from app.utils.error_handlers import (
     BusinessLogicError,
     DatabaseError,
@@ -59,6 +60,13 @@ async def lifespan(app: FastAPI):
         logger.info(f"数据库文件不存在，将创建并初始化: {db_file}")
 
     init_db()
+
+    # 重建相似报价索引（之后随报价增量维护）
+    try:
+        with SessionLocal() as db:
+            similar_quote_index.rebuild(db)
+    except Exception as e:
+        logger.warning(f"相似报价索引重建失败（不影响报价）: {e}")
     
     # 可选：预加载 rembg 模型（如果可用）
     # 这可以避免首次使用时因下载模型导致的延迟
@@ -66,9 +74,11 @@ async def lifespan(app: FastAPI):
         if os.getenv("PRELOAD_REMBG_MODEL", "false").lower() == "true":
             logger.info("正在预加载 rembg 模型...")
             try:
-                from rembg import new_session
-                session = new_session("u2net")
-                logger.info("✓ rembg 模型预加载成功")
+                # 加载部署配置 REMBG_MODEL 指定的模型，之后的分析请求共用该 session
+                from app.services.image_analysis_service import get_background_remover
+
+                get_background_remover("rembg")
+                logger.info("✓ rembg 模型预加载完成")
             except Exception as e:
                 logger.warning(f"rembg 模型预加载失败（不影响使用）: {e}")
     except ImportError:
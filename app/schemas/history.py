@@ -1,5 +1,5 @@
-from datetime import datetime
-from typing import Optional
+from datetime import date, datetime
+from typing import Optional, Union
 
 from pydantic import BaseModel, Field
 
@@ -18,6 +18,61 @@ class HistoryItemResponse(BaseModel):
         from_attributes = True
 
 
+class HistoryListItemResponse(BaseModel):
+    """历史列表精简投影：仅含标量列，完整快照通过详情接口按需获取"""
+
+    id: int
+    worker_type: str
+    unit_price: float
+    total_price: float
+    computed_at: datetime
+    order_quantity: Optional[int] = None
+    length: Optional[float] = None
+    width: Optional[float] = None
+    thickness: Optional[float] = None
+    color_count: Optional[int] = None
+    area_ratio: Optional[float] = None
+    is_favorited: Optional[bool] = False
+
+    class Config:
+        from_attributes = True
+
+
+class HistoryStatsItem(BaseModel):
+    """统计看板的一个分组"""
+
+    key: Union[date, int, str]  # 分组键：日期 / 颜色数 / 工人类型
+    quote_count: int
+    total_quantity: int
+    total_revenue: float
+    avg_unit_price: float
+
+
+class HistorySearchHit(BaseModel):
+    """检索命中：字段均来自全文索引"""
+
+    id: int
+    names: str  # 收藏名称（多个以空格分隔）
+    spec: str  # 规格描述
+    worker_type: str
+    color_count: Optional[int] = None
+    unit_price: float
+    total_price: float
+    computed_at: datetime
+    score: Optional[float] = None  # 相关度，越大越相关（纯子串匹配时为空）
+
+
+class HistoryFacetCount(BaseModel):
+    value: str
+    count: int
+
+
+class HistorySearchResponse(BaseModel):
+    total: int
+    hits: list[HistorySearchHit]
+    facets: dict[str, list[HistoryFacetCount]]  # worker_type / color_count 分桶
+
+
 class FavoriteCreateRequest(BaseModel):
     history_id: int = Field(..., gt=0)
     name: Optional[str] = Field(None, max_length=200)
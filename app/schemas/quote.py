@@ -1,8 +1,41 @@
-from typing import Any, Optional
+from typing import Any, Literal, Optional
 
 from pydantic import BaseModel, ConfigDict, Field
 
 
+class ParameterDistribution(BaseModel):
+    """以当前设置值为中心的参数波动分布"""
+
+    kind: Literal["normal", "uniform", "triangular"] = Field(
+        default="normal", description="分布类型"
+    )
+    spread: float = Field(
+        default=0.1,
+        ge=0,
+        le=1,
+        description="相对波动幅度：normal 为相对标准差，uniform/triangular 为相对半宽",
+    )
+
+
+class MonteCarloConfig(BaseModel):
+    """蒙特卡洛成本风险模拟配置"""
+
+    samples: int = Field(default=100_000, ge=1000, le=1_000_000, description="采样数")
+    seed: Optional[int] = Field(default=None, description="随机种子（便于复现）")
+    waste_rate: ParameterDistribution = Field(
+        default_factory=lambda: ParameterDistribution(spread=0.3),
+        description="废品率",
+    )
+    material_price: ParameterDistribution = Field(
+        default_factory=lambda: ParameterDistribution(spread=0.1),
+        description="材料单价",
+    )
+    output_per_shift: ParameterDistribution = Field(
+        default_factory=lambda: ParameterDistribution(kind="triangular", spread=0.15),
+        description="单班产量（颜色产能映射）",
+    )
+
+
 class QuoteRequest(BaseModel):
     """报价请求"""
 
@@ -14,6 +47,13 @@ class QuoteRequest(BaseModel):
     order_quantity: int = Field(..., gt=0, le=1000000, description="订单数量")
     worker_type: str = Field(default="standard", description="工人类型")
     debug: bool = Field(default=False, description="调试模式")
+    simulation: Optional[MonteCarloConfig] = Field(
+        default=None, description="提供时附加蒙特卡洛成本风险模拟结果"
+    )
+    compare_worker_types: Optional[list[str]] = Field(
+        default=None,
+        description="提供时附加各工人类型的报价对比表，空列表表示全部已配置的工人类型",
+    )
 
 
 class QuoteResponse(BaseModel):
@@ -35,3 +75,129 @@ class QuoteResponse(BaseModel):
     # 其他动态字段
     def __init__(self, **data: Any) -> None:
         super().__init__(**data)
+
+
+class QuoteSolveRequest(BaseModel):
+    """报价反解：由目标单价求订单数量、利润率或产品参数，待求参数可缺省"""
+
+    solve_for: Literal[
+        "quantity", "margin", "length", "width", "thickness", "color_count"
+    ] = Field(..., description="反解目标")
+    target_unit_price: float = Field(..., gt=0, description="目标单价（元）")
+    length: Optional[float] = Field(None, gt=0, le=1000, description="产品长度 (cm)")
+    width: Optional[float] = Field(None, gt=0, le=1000, description="产品宽度 (cm)")
+    thickness: Optional[float] = Field(None, gt=0, le=100, description="产品厚度 (cm)")
+    color_count: Optional[int] = Field(None, ge=0, le=50, description="颜色数量")
+    area_ratio: Optional[float] = Field(None, gt=0, le=1, description="占用面积比例")
+    order_quantity: Optional[int] = Field(
+        None, gt=0, le=1000000, description="订单数量"
+    )
+    worker_type: str = Field(default="standard", description="工人类型")
+
+
+class QuoteSolveResponse(BaseModel):
+    """报价反解结果"""
+
+    solve_for: str
+    target_unit_price: float
+    feasible: bool
+    value: Optional[float] = Field(
+        None,
+        description="quantity 为最小数量，margin 为隐含利润率，其余为不超过目标单价的最大值",
+    )
+    unit_price: Optional[float] = Field(None, description="取该值时的单价")
+    total_price: Optional[float] = Field(None, description="取该值时的总价")
+    unit_cost: Optional[float] = Field(None, description="取该值时的单个产品出厂成本")
+    floor_unit_price: Optional[float] = Field(
+        None, description="数量趋于无穷时的极限单价（仅 quantity）"
+    )
+    reason: Optional[str] = Field(None, description="不可行时的原因")
+
+
+class SimilarQuoteRequest(BaseModel):
+    """相似历史报价查询"""
+
+    length: float = Field(..., gt=0, le=1000, description="产品长度 (cm)")
+    width: float = Field(..., gt=0, le=1000, description="产品宽度 (cm)")
+    thickness: float = Field(..., gt=0, le=100, description="产品厚度 (cm)")
+    color_count: int = Field(..., ge=0, le=50, description="颜色数量")
+    area_ratio: float = Field(..., gt=0, le=1, description="占用面积比例")
+    k: int = Field(default=5, ge=1, le=50, description="返回条数")
+    scope: Literal["mine", "all"] = Field(
+        default="mine", description="检索范围：本人历史 / 全部用户（仅管理员）"
+    )
+
+
+class SimilarQuoteItem(BaseModel):
+    """相似历史报价"""
+
+    id: int
+    distance: float = Field(..., description="归一化特征空间中的距离")
+    user_id: int
+    worker_type: str
+    unit_price: float
+    order_quantity: Optional[int] = None
+    length: float
+    width: float
+    thickness: float
+    color_count: int
+    area_ratio: float
+
+
+class ScheduleOrder(BaseModel):
+    """待排程订单"""
+
+    id: Optional[str] = Field(default=None, description="订单标识（原样返回）")
+    length: float = Field(..., gt=0, le=1000, description="产品长度 (cm)")
+    width: float = Field(..., gt=0, le=1000, description="产品宽度 (cm)")
+    thickness: float = Field(..., gt=0, le=100, description="产品厚度 (cm)")
+    color_count: int = Field(..., ge=0, le=50, description="颜色数量")
+    area_ratio: float = Field(..., gt=0, le=1, description="占用面积比例")
+    order_quantity: int = Field(..., gt=0, le=1000000, description="订单数量")
+    worker_type: str = Field(default="standard", description="工人类型")
+    priority: int = Field(default=0, description="优先级，越小越先排")
+    due_days: Optional[float] = Field(default=None, ge=0, description="要求交期（天）")
+
+
+class ScheduleRequest(BaseModel):
+    """产能排程请求"""
+
+    orders: list[ScheduleOrder] = Field(..., min_length=1, max_length=20000)
+    machines: int = Field(..., gt=0, le=10000, description="机台总数")
+    workers: dict[str, int] = Field(..., description="各工人类型的人数")
+
+
+class ScheduledOrder(BaseModel):
+    index: int  # 在请求 orders 中的位置
+    id: Optional[str] = None
+    worker_type: str
+    machine: int
+    needles: int
+    start_shift: float
+    end_shift: float
+    lead_time_days: float
+    late: bool
+
+
+class UnscheduledOrder(BaseModel):
+    index: int
+    id: Optional[str] = None
+    reason: str
+
+
+class ScheduleSummary(BaseModel):
+    orders: int
+    scheduled: int
+    machines: int
+    makespan_shifts: float
+    makespan_days: float
+    utilization: float  # 针头·班次利用率
+    utilization_by_worker_type: dict[str, float]
+    avg_lead_time_days: float
+    late_orders: int
+
+
+class ScheduleResponse(BaseModel):
+    scheduled: list[ScheduledOrder]
+    unscheduled: list[UnscheduledOrder]
+    summary: ScheduleSummary
@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import Optional
 
 from pydantic import BaseModel, Field
@@ -57,3 +58,43 @@ class SettingsResponse(BaseModel):
 class SettingsUpdateRequest(BaseModel):
     settings: Optional[AppSettingsSchema] = None
     worker_profiles: Optional[list[WorkerProfileSchema]] = None
+
+
+class SettingsSimulateRequest(BaseModel):
+    """草稿设置模拟：用草稿设置重算最近的历史报价，不保存"""
+
+    settings: Optional[AppSettingsSchema] = None
+    worker_profiles: Optional[list[WorkerProfileSchema]] = None
+    limit: int = Field(5000, ge=1, le=100000, description="参与模拟的最近历史条数")
+    worker_type: Optional[str] = None
+    from_dt: Optional[datetime] = None
+    to_dt: Optional[datetime] = None
+
+
+class PriceDistribution(BaseModel):
+    count: int
+    mean: Optional[float] = None
+    min: Optional[float] = None
+    p10: Optional[float] = None
+    p50: Optional[float] = None
+    p90: Optional[float] = None
+    max: Optional[float] = None
+    histogram: list[int]
+
+
+class PriceChangeSummary(BaseModel):
+    compared: int  # 当前与草稿设置下均可定价的条数
+    became_invalid: int  # 草稿设置下无法定价的条数
+    increased: int
+    decreased: int
+    mean_delta: float  # 单价平均变化（元）
+    mean_pct: float  # 单价平均变化（%）
+
+
+class SettingsSimulateResponse(BaseModel):
+    sample_size: int
+    histogram_edges: list[float]
+    stored: PriceDistribution  # 历史记录中的实际单价
+    current: PriceDistribution  # 当前设置重算
+    draft: PriceDistribution  # 草稿设置重算
+    change: PriceChangeSummary
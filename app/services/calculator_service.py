@@ -1,7 +1,9 @@
+import math
 import os
 import sys
-from typing import Any
+from typing import Any, Optional
 
+import numpy as np
 from sqlalchemy.orm import Session
 
 # 导入原始计算器（从项目根目录）
@@ -9,15 +11,25 @@ sys.path.insert(
     0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 )
 from app.services.cache_service import get_cached_settings, get_cached_worker_profiles
-from app.utils.error_handlers import BusinessLogicError, safe_execute
+from app.utils.error_handlers import (
+    BusinessLogicError,
+    safe_execute,
+    validate_required_fields,
+)
 from quotation import QuotationCalculator
 
 
-def build_calculator_from_db(db: Session) -> QuotationCalculator:
+def build_calculator_from_db(
+    db: Session,
+    settings_overlay: Optional[dict[str, Any]] = None,
+    worker_profiles_overlay: Optional[list[dict[str, Any]]] = None,
+) -> QuotationCalculator:
     """从数据库设置构建计算器实例
 
     Args:
         db: Database session
+        settings_overlay: 覆盖在当前设置之上的草稿设置（值为 None 的键忽略）
+        worker_profiles_overlay: 按 name 覆盖或新增的工人配置
 
     Returns:
         Configured QuotationCalculator instance
@@ -38,6 +50,17 @@ def build_calculator_from_db(db: Session) -> QuotationCalculator:
         get_cached_worker_profiles, db, error_message="获取工人配置失败"
     )
 
+    # 叠加草稿设置（不修改缓存中的对象）
+    if settings_overlay:
+        settings = {
+            **settings,
+            **{k: v for k, v in settings_overlay.items() if v is not None},
+        }
+    if worker_profiles_overlay:
+        profiles = {p["name"]: p for p in worker_profiles_list}
+        profiles.update({p["name"]: p for p in worker_profiles_overlay})
+        worker_profiles_list = list(profiles.values())
+
     # 创建计算器实例
     calc = QuotationCalculator()
 
@@ -98,8 +121,13 @@ def compute_quote(
     order_quantity: int,
     worker_type: str = "standard",
     debug: bool = False,
+    compare_worker_types: Optional[list[str]] = None,
 ) -> dict[str, Any]:
-    """执行报价计算"""
+    """执行报价计算
+
+    compare_worker_types 不为 None 时，附加各工人类型的对比表（worker_comparison），
+    空列表表示全部已配置的工人类型。
+    """
 
     calc = build_calculator_from_db(db)
 
@@ -152,6 +180,481 @@ def compute_quote(
     except Exception:
         pass
 
+    if compare_worker_types is not None:
+        result["worker_comparison"] = compare_worker_type_quotes(
+            calc,
+            length,
+            width,
+            thickness,
+            color_count,
+            area_ratio,
+            order_quantity,
+            worker_types=(
+                [worker_type, *compare_worker_types]
+                if compare_worker_types
+                else [worker_type, *calc.WORKER_PROFILES]
+            ),
+            baseline=worker_type,
+        )
+
+    return result
+
+
+def calculate_quotes_vectorized(
+    calc: QuotationCalculator,
+    length: Any,
+    width: Any,
+    thickness: Any,
+    color_count: Any,
+    area_ratio: Any,
+    order_quantity: Any,
+    worker_type: Any,
+    *,
+    waste_rate: Any = None,
+    material_price_per_gram: Any = None,
+    output_scale: Any = 1.0,
+) -> dict[str, np.ndarray]:
+    """以 NumPy 数组批量执行 QuotationCalculator.calculate_quote 的定价公式
+
+    各参数可为标量或等长数组（按广播规则对齐）。返回 unit_price / total_price
+    数组，舍入方式与逐条计算一致；逐条计算会报错的行（尺寸超出模具、颜色数
+    超出映射或针头数、未知工人类型）取 NaN。另返回未舍入的 unit_cost
+    （含废品率的单个产品出厂成本）与 shifts_needed（完成订单需要的班数）。
+
+    waste_rate / material_price_per_gram 可传入数组以逐行替换计算器中的设置，
+    output_scale 为单班产量的倍率，供蒙特卡洛模拟等场景使用。
+    """
+    if waste_rate is None:
+        waste_rate = calc.WASTE_RATE
+    if material_price_per_gram is None:
+        material_price_per_gram = calc.MATERIAL_PRICE_PER_GRAM
+    length = np.asarray(length, dtype=float)
+    width = np.asarray(width, dtype=float)
+    thickness = np.asarray(thickness, dtype=float)
+    color_count = np.asarray(color_count, dtype=int)
+    area_ratio = np.asarray(area_ratio, dtype=float)
+    order_quantity = np.asarray(order_quantity, dtype=float)
+    worker_type = np.asarray(worker_type, dtype=object)
+
+    # 产能：每模产品数 × 单班产模数
+    edge, spacing = calc.MOLD_EDGE_LENGTH, calc.MOLD_SPACING
+    fits = ((length + spacing) <= edge) & ((width + spacing) <= edge)
+    units_per_mold = np.where(
+        fits,
+        np.floor(edge / (width + spacing)) * np.floor(edge / (length + spacing)),
+        0,
+    )
+    # 颜色数 -> 单班产模数查找表；逆序写入，使区间重叠时与逐条计算一样取首个匹配
+    max_colors = max((hi for _, hi in calc.COLOR_OUTPUT_MAP), default=0)
+    # 末位恒为 0，超出映射范围的颜色数裁剪到该位
+    molds_table = np.zeros(max(max_colors, 0) + 2)
+    for (lo, hi), molds in reversed(list(calc.COLOR_OUTPUT_MAP.items())):
+        molds_table[max(lo, 0) : hi + 1] = molds
+    molds_per_shift = molds_table[np.clip(color_count, 0, len(molds_table) - 1)]
+    output_per_shift = molds_per_shift * units_per_mold * output_scale
+
+    # 工人配置按类型映射为数组
+    salary = np.full(worker_type.shape, np.nan)
+    machines = np.full(worker_type.shape, np.nan)
+    for name, profile in calc.WORKER_PROFILES.items():
+        mask = worker_type == name
+        salary[mask] = profile["monthly_salary"]
+        machines[mask] = profile["machines_operated"]
+
+    needles_used = color_count + 1
+    valid = (output_per_shift > 0) & (needles_used <= calc.NEEDLES_PER_MACHINE)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shifts_needed = order_quantity / output_per_shift
+
+        weight = length * width * thickness * area_ratio * calc.MATERIAL_DENSITY
+        total_material_cost = weight * material_price_per_gram * order_quantity
+
+        cell_cost = (
+            salary / (calc.WORKING_DAYS_PER_MONTH * calc.SHIFTS_PER_DAY)
+            + calc.OTHER_SALARY_PER_CELL_SHIFT
+            + calc.RENT_PER_CELL_SHIFT
+            + calc.ELECTRICITY_FEE_PER_CELL_SHIFT
+        )
+        cost_per_cell_shift = (
+            cell_cost / machines * (needles_used / calc.NEEDLES_PER_MACHINE) * machines
+            + color_count * calc.COLORING_FEE_PER_COLOR_PER_SHIFT
+        )
+        setup_fee = color_count * calc.SETUP_FEE_PER_COLOR + calc.BASE_SETUP_FEE
+
+        total_production_cost = (
+            total_material_cost + cost_per_cell_shift * shifts_needed + setup_fee
+        )
+        factory_cost = total_production_cost / order_quantity / (1 - waste_rate)
+        unit_price = factory_cost * (1 + calc.PROFIT_MARGIN)
+        total_price = unit_price * order_quantity
+
+    unit_price = np.where(valid, unit_price, np.nan)
+    total_price = np.where(valid, total_price, np.nan)
+    return {
+        "unit_price": np.round(unit_price, 4),
+        "total_price": np.round(total_price, 2),
+        "unit_cost": np.where(valid, factory_cost, np.nan),
+        "shifts_needed": np.where(valid, shifts_needed, np.nan),
+    }
+
+
+def compare_worker_type_quotes(
+    calc: QuotationCalculator,
+    length: float,
+    width: float,
+    thickness: float,
+    color_count: int,
+    area_ratio: float,
+    order_quantity: int,
+    worker_types: list[str],
+    baseline: str,
+) -> list[dict[str, Any]]:
+    """一次向量化计算多个工人类型的报价对比表
+
+    产能与材料成本与工人类型无关，各行只在工人工资与看机台数上不同；
+    worker_types 去重后保持顺序，price_diff 为相对 baseline 的单价差。
+    """
+    worker_types = list(dict.fromkeys(worker_types))
+    unknown = [w for w in worker_types if w not in calc.WORKER_PROFILES]
+    if unknown:
+        raise ValueError(f"未知的工人类型: {', '.join(unknown)}")
+
+    quoted = calculate_quotes_vectorized(
+        calc,
+        length,
+        width,
+        thickness,
+        color_count,
+        area_ratio,
+        order_quantity,
+        np.asarray(worker_types, dtype=object),
+    )
+    unit_prices = dict(zip(worker_types, quoted["unit_price"].tolist()))
+    return [
+        {
+            "worker_type": name,
+            "monthly_salary": calc.WORKER_PROFILES[name]["monthly_salary"],
+            "machines_operated": calc.WORKER_PROFILES[name]["machines_operated"],
+            "unit_price": unit_prices[name],
+            "total_price": float(total),
+            "unit_cost": round(float(cost), 4),
+            "price_diff": round(unit_prices[name] - unit_prices[baseline], 4),
+        }
+        for name, total, cost in zip(
+            worker_types, quoted["total_price"], quoted["unit_cost"]
+        )
+    ]
+
+
+# 成本风险模拟输出的百分位
+SIMULATION_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def _sample_around(
+    rng: np.random.Generator, center: float, spec: dict[str, Any], size: int
+) -> np.ndarray:
+    """按相对波动分布在 center 附近采样"""
+    spread = spec["spread"]
+    if spread == 0:
+        return np.full(size, float(center))
+    low, high = center * (1 - spread), center * (1 + spread)
+    if spec["kind"] == "uniform":
+        return rng.uniform(low, high, size)
+    if spec["kind"] == "triangular":
+        return rng.triangular(low, center, high, size)
+    return rng.normal(center, center * spread, size)
+
+
+def _percentile_band(values: np.ndarray) -> dict[str, float]:
+    bands = np.percentile(values, SIMULATION_PERCENTILES)
+    summary = {f"p{p}": float(v) for p, v in zip(SIMULATION_PERCENTILES, bands)}
+    summary["mean"] = float(values.mean())
+    return summary
+
+
+def simulate_quote_risk(
+    db: Session,
+    length: float,
+    width: float,
+    thickness: float,
+    color_count: int,
+    area_ratio: float,
+    order_quantity: int,
+    worker_type: str,
+    config: dict[str, Any],
+) -> dict[str, Any]:
+    """蒙特卡洛模拟废品率、材料单价与单班产量的波动对成本和利润率的影响
+
+    报价单价按当前设置的点估计固定，对每组采样参数整体向量化计算单位成本，
+    返回单位成本与利润率（(报价 - 成本) / 报价）的百分位区间及亏损概率。
+    """
+    calc = build_calculator_from_db(db)
+    params = (length, width, thickness, color_count, area_ratio, order_quantity)
+    quoted = calculate_quotes_vectorized(calc, *params, worker_type)
+    quoted_price = float(quoted["unit_price"])
+    if np.isnan(quoted_price):
+        raise BusinessLogicError(
+            "当前参数无法报价，无法进行模拟", error_code="CALCULATION_ERROR"
+        )
+
+    rng = np.random.default_rng(config.get("seed"))
+    n = config["samples"]
+    waste_rate = np.clip(
+        _sample_around(rng, calc.WASTE_RATE, config["waste_rate"], n), 0.0, 0.95
+    )
+    material_price = np.clip(
+        _sample_around(rng, calc.MATERIAL_PRICE_PER_GRAM, config["material_price"], n),
+        0.0,
+        None,
+    )
+    output_scale = np.clip(
+        _sample_around(rng, 1.0, config["output_per_shift"], n), 0.05, None
+    )
+
+    unit_cost = calculate_quotes_vectorized(
+        calc,
+        *params,
+        worker_type,
+        waste_rate=waste_rate,
+        material_price_per_gram=material_price,
+        output_scale=output_scale,
+    )["unit_cost"]
+    margin = (quoted_price - unit_cost) / quoted_price
+
+    return {
+        "samples": n,
+        "quoted_unit_price": quoted_price,
+        "expected_unit_cost": float(quoted["unit_cost"]),
+        "unit_cost": _percentile_band(unit_cost),
+        "margin": _percentile_band(margin),
+        "loss_probability": float((unit_cost > quoted_price).mean()),
+    }
+
+
+# 反解目标 -> 对应的请求参数（margin 为隐含利润率，无对应参数）
+SOLVE_TARGETS = {
+    "quantity": "order_quantity",
+    "margin": None,
+    "length": "length",
+    "width": "width",
+    "thickness": "thickness",
+    "color_count": "color_count",
+}
+_SOLVE_PARAMS = (
+    "length",
+    "width",
+    "thickness",
+    "color_count",
+    "area_ratio",
+    "order_quantity",
+)
+# 尺寸反解结果向下取整的精度 (cm)
+_SOLVE_DIMENSION_STEP = 0.01
+# 厚度反解的上限 (cm)，与报价请求的校验范围一致
+_SOLVE_MAX_THICKNESS = 100.0
+# 订单数量反解的上限，与报价请求的校验范围一致
+_SOLVE_MAX_QUANTITY = 1000000
+# 数量闭式解在舍入边界上逐一向上修正的最多步数，仍不满足时改为二分查找
+_SOLVE_QUANTITY_STEPS = 3
+# 单价舍入到 4 位小数，未舍入单价低于 目标 + 半个舍入单位 即视为满足目标
+_SOLVE_PRICE_TOLERANCE = 0.5e-4
+
+
+def _raw_unit_price(
+    calc: QuotationCalculator, params: dict[str, Any], **overrides: Any
+) -> np.ndarray:
+    """未舍入的销售单价；overrides 中可传入数组，对单个参数批量取值"""
+    quoted = calculate_quotes_vectorized(calc, **{**params, **overrides})
+    return quoted["unit_cost"] * (1 + calc.PROFIT_MARGIN)
+
+
+def _quoted_price(calc: QuotationCalculator, params: dict[str, Any]) -> float:
+    """舍入后的销售单价"""
+    return float(calculate_quotes_vectorized(calc, **params)["unit_price"])
+
+
+def _solve_quantity(
+    calc: QuotationCalculator, params: dict[str, Any], target: float, bound: float
+) -> dict[str, Any]:
+    """单价 = 极限单价 + 调机费分摊 / 数量，对 1/数量 线性，直接解出最小数量"""
+    p1, p2 = _raw_unit_price(calc, params, order_quantity=np.array([1.0, 2.0]))
+    slope = 2 * (p1 - p2)
+    floor = p1 - slope
+    if bound <= floor:
+        return {
+            "feasible": False,
+            "floor_unit_price": round(float(floor), 4),
+            "reason": f"目标单价低于大批量极限单价 {floor:.4f}",
+        }
+    too_large = {
+        "feasible": False,
+        "floor_unit_price": round(float(floor), 4),
+        "reason": f"所需订单数量超过上限 {_SOLVE_MAX_QUANTITY}",
+    }
+
+    def affordable(quantity: int) -> bool:
+        return _quoted_price(calc, {**params, "order_quantity": quantity}) <= target
+
+    quantity = 1 if bound > p1 else math.ceil(slope / (bound - floor))
+    if quantity > _SOLVE_MAX_QUANTITY:
+        return too_large
+    # 舍入边界上的浮点误差：向上修正几步，仍不满足时在 (quantity, 上限] 内二分
+    for _ in range(_SOLVE_QUANTITY_STEPS):
+        if affordable(quantity):
+            break
+        quantity += 1
+    else:
+        if not affordable(_SOLVE_MAX_QUANTITY):
+            return too_large
+        lo, hi = quantity - 1, _SOLVE_MAX_QUANTITY
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            lo, hi = (lo, mid) if affordable(mid) else (mid, hi)
+        quantity = hi
+    return {"value": quantity, "floor_unit_price": round(float(floor), 4)}
+
+
+def _solve_mold_dimension(
+    calc: QuotationCalculator, params: dict[str, Any], name: str, target: float
+) -> Optional[float]:
+    """反解长度或宽度的最大值
+
+    每模排数 k 在尺寸区间 (E/(k+1) - s, E/k - s] 内不变，区间内单价对尺寸线性；
+    对所有区间一次性向量化求出两点单价，按直线解出每段内的最大可行尺寸。
+    """
+    edge, spacing = calc.MOLD_EDGE_LENGTH, calc.MOLD_SPACING
+    k = np.arange(1, int(edge / (spacing + _SOLVE_DIMENSION_STEP)) + 1)
+    hi = edge / k - spacing
+    lo = np.maximum(edge / (k + 1) - spacing, 0.0)
+    mid = (lo + hi) / 2
+    p_hi = _raw_unit_price(calc, params, **{name: hi})
+    p_mid = _raw_unit_price(calc, params, **{name: mid})
+    if not np.isfinite(p_hi).any():
+        return None
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (p_hi - p_mid) / (hi - mid)
+        best = np.where(p_hi <= target, hi, hi - (p_hi - target) / slope)
+    feasible = np.isfinite(best) & (best > lo)
+    return float(best[feasible].max()) if feasible.any() else 0.0
+
+
+def _solve_thickness(
+    calc: QuotationCalculator, params: dict[str, Any], target: float
+) -> Optional[float]:
+    """单价对厚度线性（仅材料成本随厚度变化）"""
+    p1, p2 = _raw_unit_price(calc, params, thickness=np.array([1.0, 2.0]))
+    if not np.isfinite(p1):
+        return None
+    slope = p2 - p1
+    if slope <= 0:
+        return _SOLVE_MAX_THICKNESS if p1 <= target else 0.0
+    return min(1.0 + (target - p1) / slope, _SOLVE_MAX_THICKNESS)
+
+
+def solve_quote(
+    db: Session,
+    solve_for: str,
+    target_unit_price: float,
+    params: dict[str, Any],
+) -> dict[str, Any]:
+    """由目标单价反解报价参数
+
+    quantity 求单价不高于目标的最小订单数量；length / width / thickness /
+    color_count 求其余参数不变时单价不高于目标的最大值；margin 求按目标单价
+    成交时的隐含利润率。解析可解的部分直接用闭式解，分段的部分（每模产品数、
+    颜色档位）对所有分段向量化求值后取最优。
+
+    Args:
+        db: Database session
+        solve_for: 反解目标，见 SOLVE_TARGETS
+        target_unit_price: 目标销售单价（元）
+        params: 其余报价参数（QuoteRequest 字段，待求参数可缺省）
+
+    Returns:
+        反解结果：feasible、value，以及取该值时的单价、总价与出厂成本；
+        不可行时附 reason
+    """
+    field = SOLVE_TARGETS[solve_for]
+    validate_required_fields(params, [f for f in _SOLVE_PARAMS if f != field])
+    params = {
+        **{f: params[f] for f in _SOLVE_PARAMS if f != field},
+        "worker_type": params.get("worker_type") or "standard",
+    }
+
+    calc = build_calculator_from_db(db)
+    target = float(target_unit_price)
+    bound = target + _SOLVE_PRICE_TOLERANCE
+    result: dict[str, Any] = {
+        "solve_for": solve_for,
+        "target_unit_price": target,
+        "feasible": True,
+        "value": None,
+        "unit_price": None,
+        "total_price": None,
+        "unit_cost": None,
+        "floor_unit_price": None,
+        "reason": None,
+    }
+    unpriceable = BusinessLogicError(
+        "当前参数无法报价，无法反解", error_code="CALCULATION_ERROR"
+    )
+
+    if solve_for == "margin":
+        quoted = calculate_quotes_vectorized(calc, **params)
+        unit_cost = float(quoted["unit_cost"])
+        if np.isnan(unit_cost):
+            raise unpriceable
+        result.update(
+            value=round(target / unit_cost - 1, 6),
+            unit_price=target,
+            total_price=round(target * params["order_quantity"], 2),
+            unit_cost=unit_cost,
+        )
+        return result
+
+    if solve_for == "quantity":
+        if np.isnan(_raw_unit_price(calc, params, order_quantity=1)):
+            raise unpriceable
+        result.update(_solve_quantity(calc, params, target, bound))
+    elif solve_for == "color_count":
+        colors = np.arange(calc.NEEDLES_PER_MACHINE)
+        prices = calculate_quotes_vectorized(calc, **params, color_count=colors)[
+            "unit_price"
+        ]
+        if not np.isfinite(prices).any():
+            raise unpriceable
+        affordable = colors[prices <= target]
+        if len(affordable):
+            result["value"] = int(affordable.max())
+    else:
+        if solve_for == "thickness":
+            value = _solve_thickness(calc, params, bound)
+        else:
+            value = _solve_mold_dimension(calc, params, solve_for, bound)
+        if value is None:
+            raise unpriceable
+        # 向下取整到精度（单价随尺寸单调不减）；舍入边界上的浮点误差再回退一步
+        steps = math.floor(value / _SOLVE_DIMENSION_STEP + 1e-9)
+        while steps > 0 and (
+            _quoted_price(calc, {**params, solve_for: steps * _SOLVE_DIMENSION_STEP})
+            > target
+        ):
+            steps -= 1
+        if steps > 0:
+            result["value"] = round(steps * _SOLVE_DIMENSION_STEP, 2)
+
+    if result["value"] is None:
+        result["feasible"] = False
+        result["reason"] = result["reason"] or "即使取最小值，单价仍高于目标"
+    if not result["feasible"]:
+        return result
+
+    quoted = calculate_quotes_vectorized(calc, **params, **{field: result["value"]})
+    result.update(
+        unit_price=float(quoted["unit_price"]),
+        total_price=float(quoted["total_price"]),
+        unit_cost=float(quoted["unit_cost"]),
+    )
     return result
 
 
@@ -1,9 +1,13 @@
+import copy
+import functools
 import logging
 import sys
+import threading
 import uuid
+from collections import OrderedDict
 from io import BytesIO
 from pathlib import Path
-from typing import Literal, Optional
+from typing import Any, Literal, Optional
 
 import cv2
 import numpy as np
@@ -16,8 +20,16 @@ UPLOADS_DIR = STATIC_DIR / "uploads"
 ANALYSIS_DIR = UPLOADS_DIR / "analysis"
 ANALYSIS_DIR.mkdir(parents=True, exist_ok=True)
 
+# 分析结果缓存条数（按图片文件、参数与 ROI 区分）
+RESULT_CACHE_SIZE = 128
+# auto 方法：opencv 抠图可信度（0~1）低于该值时改用 rembg
+AUTO_CONFIDENCE_THRESHOLD = 0.9
+
 logger = logging.getLogger(__name__)
 
+_result_cache: "OrderedDict[tuple, Any]" = OrderedDict()
+_result_cache_lock = threading.Lock()
+
 
 def _ensure_uint8(image: np.ndarray) -> np.ndarray:
     if image.dtype == np.uint8:
@@ -133,25 +145,40 @@ def save_preview(preview_bgr: np.ndarray) -> str:
     return f"/static/uploads/analysis/{filename}"
 
 
-def get_mask_rgb_opencv(image_bgr: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+def _border_pixels(mask: np.ndarray) -> int:
+    return int(
+        np.count_nonzero(mask[0])
+        + np.count_nonzero(mask[-1])
+        + np.count_nonzero(mask[:, 0])
+        + np.count_nonzero(mask[:, -1])
+    )
+
+
+def get_mask_rgb_opencv(
+    image_bgr: np.ndarray, background_from_border: bool = False
+) -> tuple[np.ndarray, np.ndarray]:
     gray = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY)
     gray = cv2.GaussianBlur(gray, (5, 5), 0)
     _, thr1 = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
     _, thr2 = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-    # pick better by larger contour
-    c1 = _find_largest_contour(thr1)
-    c2 = _find_largest_contour(thr2)
+    if background_from_border:
+        # 取接触图片边缘较少的一侧（auto 选用 opencv 时与可信度评估的取法一致）
+        mask = thr1 if _border_pixels(thr1) <= _border_pixels(thr2) else thr2
+    else:
+        # pick better by larger contour
+        c1 = _find_largest_contour(thr1)
+        c2 = _find_largest_contour(thr2)
 
-    def score(c):
-        return 0.0 if c is None else float(cv2.contourArea(c))
+        def score(c):
+            return 0.0 if c is None else float(cv2.contourArea(c))
 
-    mask = thr1 if score(c1) >= score(c2) else thr2
+        mask = thr1 if score(c1) >= score(c2) else thr2
     mask = (mask > 0).astype(np.uint8)
     rgb = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
     return mask, rgb
 
 
-def load_image_bgr_from_path(static_path: str) -> tuple[np.ndarray, bytes]:
+def _static_abs_path(static_path: str) -> Path:
     # static_path like "/static/uploads/xxx.png"
     if not static_path.startswith("/static/"):
         raise ValueError("非法路径")
@@ -159,19 +186,118 @@ def load_image_bgr_from_path(static_path: str) -> tuple[np.ndarray, bytes]:
     abs_path = STATIC_DIR / rel
     if not abs_path.exists():
         raise FileNotFoundError("图片不存在")
+    return abs_path
+
+
+def _crop_box(
+    image_bgr: np.ndarray, x: int, y: int, w: int, h: int
+) -> tuple[np.ndarray, int, int]:
+    height, width = image_bgr.shape[:2]
+    x0, y0 = max(int(x), 0), max(int(y), 0)
+    x1, y1 = min(int(x + w), width), min(int(y + h), height)
+    if x1 <= x0 or y1 <= y0:
+        raise ValueError("识别区域超出图片范围")
+    return image_bgr[y0:y1, x0:x1].copy(), x0, y0
+
+
+def crop_to_roi(image_bgr: np.ndarray, roi: dict[str, Any]) -> np.ndarray:
+    """按识别区域裁剪（坐标为原图像素）
+
+    roi 为 {"box": [x, y, w, h]} 或 {"polygon": [[x, y], ...]}。多边形先裁到外接
+    矩形，区域外的像素填充为多边形边缘的中位色，使其在后续抠图中归为背景。
+    """
+    if roi.get("box") is not None:
+        return _crop_box(image_bgr, *roi["box"])[0]
+    points = np.asarray(roi["polygon"], dtype=np.int32)
+    cropped, x0, y0 = _crop_box(image_bgr, *cv2.boundingRect(points))
+    points = points - np.array([x0, y0], dtype=np.int32)
+    inside = np.zeros(cropped.shape[:2], np.uint8)
+    cv2.fillPoly(inside, [points], 1)
+    if not inside.any():
+        raise ValueError("识别区域超出图片范围")
+    edge = np.zeros_like(inside)
+    cv2.polylines(edge, [points], True, 1, thickness=3)
+    edge_pixels = cropped[(edge > 0) & (inside > 0)]
+    if len(edge_pixels):
+        cropped[inside == 0] = np.median(edge_pixels, axis=0).astype(np.uint8)
+    return cropped
+
+
+def _roi_key(roi: Optional[dict[str, Any]]) -> Optional[tuple]:
+    if not roi:
+        return None
+    if roi.get("box") is not None:
+        return ("box", tuple(roi["box"]))
+    return ("polygon", tuple(tuple(p) for p in roi["polygon"]))
+
+
+def load_image_bgr_from_path(
+    static_path: str, roi: Optional[dict[str, Any]] = None
+) -> tuple[np.ndarray, bytes]:
+    """读取图片；指定识别区域时解码后立即裁剪，返回的字节也改为裁剪后的 PNG
+    （rembg 只处理该区域）"""
+    abs_path = _static_abs_path(static_path)
     data = abs_path.read_bytes()
     arr = np.frombuffer(data, dtype=np.uint8)
     img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
     if img is None:
         raise ValueError("无法读取图片内容")
+    if roi:
+        img = crop_to_roi(img, roi)
+        data = cv2.imencode(".png", img)[1].tobytes()
     return img, data
 
 
+def _cache_by_image(func):
+    """按 (图片文件, 参数, 识别区域) 缓存分析结果
+
+    图片被覆盖（修改时间或大小变化）后自动失效。返回副本，调用方可自由修改。
+    """
+
+    @functools.wraps(func)
+    def wrapper(static_path: str, *args, roi=None, **kwargs):
+        stat = _static_abs_path(static_path).stat()
+        key = (
+            func.__name__,
+            static_path,
+            stat.st_mtime_ns,
+            stat.st_size,
+            args,
+            tuple(sorted(kwargs.items())),
+            _roi_key(roi),
+        )
+        with _result_cache_lock:
+            if key in _result_cache:
+                _result_cache.move_to_end(key)
+                return copy.deepcopy(_result_cache[key])
+        result = func(static_path, *args, roi=roi, **kwargs)
+        with _result_cache_lock:
+            _result_cache[key] = result
+            while len(_result_cache) > RESULT_CACHE_SIZE:
+                _result_cache.popitem(last=False)
+        return copy.deepcopy(result)
+
+    return wrapper
+
+
+@_cache_by_image
 def analyze_area_ratio(
-    static_path: str, method: Literal["opencv", "rembg"]
+    static_path: str,
+    method: Literal["opencv", "rembg"],
+    rembg_model: Optional[str] = None,
+    roi: Optional[dict[str, Any]] = None,
+    background_from_border: bool = False,
 ) -> tuple[float, str]:
-    """计算面积比例（同步函数，应在线程池中调用）"""
-    logger.info(f"[area_ratio] 开始分析: path={static_path}, method={method}")
+    """计算面积比例（同步函数，应在线程池中调用）
+
+    rembg_model 为 rembg 使用的模型（见 REMBG_MODELS），未指定时使用部署配置。
+    background_from_border 为 True 时 opencv 取接触图片边缘较少的一侧为前景
+    （auto 选用 opencv 时与可信度评估一致）。
+    """
+    logger.info(
+        f"[area_ratio] 开始分析: path={static_path}, method={method}, "
+        f"rembg_model={rembg_model}, roi={roi}"
+    )
     
     # 使用脚本模块进行抠图与面积计算（兼容重构后的 scripts/ 目录）
     repo_root = Path(__file__).resolve().parents[2]
@@ -189,11 +315,11 @@ def analyze_area_ratio(
         from scripts.background_remover import BackgroundRemover  # type: ignore
 
     logger.info(f"[area_ratio] 加载图片: {static_path}")
-    image_bgr, image_bytes = load_image_bgr_from_path(static_path)
+    image_bgr, image_bytes = load_image_bgr_from_path(static_path, roi)
     logger.info(f"[area_ratio] 图片尺寸: {image_bgr.shape}")
     
     logger.info(f"[area_ratio] 开始抠图，方法: {method}")
-    remover = BackgroundRemover()
+    remover = BackgroundRemover(rembg_model)
     
     # rembg 可能需要较长时间，特别是首次加载模型
     if method == "rembg":
@@ -203,6 +329,7 @@ def analyze_area_ratio(
         method=method,
         image_bgr=image_bgr if method == "opencv" else None,
         image_bytes=image_bytes if method == "rembg" else None,
+        background_from_border=background_from_border,
     )
     logger.info(f"[area_ratio] 抠图完成，前景像素数: {(mask > 0).sum()}")
     
@@ -219,17 +346,20 @@ def analyze_area_ratio(
     return ratio, preview_path
 
 
+@_cache_by_image
 def analyze_colors(
-    static_path: str, method: Literal["opencv", "rembg"] = "opencv"
+    static_path: str,
+    method: Literal["opencv", "rembg"] = "opencv",
+    rembg_model: Optional[str] = None,
+    roi: Optional[dict[str, Any]] = None,
+    background_from_border: bool = False,
 ) -> dict[str, object]:
-    """统计主体颜色数量与调色板（改为使用 color_counter 模块）。"""
+    """统计主体颜色数量与调色板（改为使用 color_counter 模块）。
+
+    background_from_border 的含义同 analyze_area_ratio。
+    """
     # 解析文件绝对路径
-    if not static_path.startswith("/static/"):
-        raise ValueError("非法路径")
-    rel = static_path[len("/static/") :]
-    abs_path = STATIC_DIR / rel
-    if not abs_path.exists():
-        raise FileNotFoundError("图片不存在")
+    abs_path = _static_abs_path(static_path)
     logger.info("[colors] analyze start path=%s abs=%s", static_path, str(abs_path))
 
     # 导入 color_counter 并调用（支持 scripts/ 目录）
@@ -249,16 +379,16 @@ def analyze_colors(
             raise ImportError("无法导入 color_counter 模块") from e
 
     # 复用我们已有抠图流程，避免重复IO
-    image_bgr, image_bytes = load_image_bgr_from_path(static_path)
+    image_bgr, image_bytes = load_image_bgr_from_path(static_path, roi)
     if method == "opencv":
-        mask, rgb = get_mask_rgb_opencv(image_bgr)
+        mask, rgb = get_mask_rgb_opencv(image_bgr, background_from_border)
     else:
         # rembg 路径需要懒加载模块，避免不必要的 onnxruntime 依赖
         try:
             from background_remover import BackgroundRemover  # type: ignore
         except Exception:
             from scripts.background_remover import BackgroundRemover  # type: ignore
-        remover = BackgroundRemover()
+        remover = BackgroundRemover(rembg_model)
         mask, rgb = remover.get_mask_and_rgb(
             method="rembg", image_bgr=None, image_bytes=image_bytes
         )
@@ -289,7 +419,14 @@ def analyze_colors(
     if num_colors is None:
         raise ValueError("颜色统计失败")
 
-    # 构造统一返回结构
+    return {
+        "color_count": int(num_colors),
+        "palette": _build_palette(colors, percentages),
+    }
+
+
+def _build_palette(colors, percentages) -> list[dict[str, object]]:
+    """构造统一的调色板返回结构"""
     palette = []
     if colors and percentages:
         for rgb, pct in zip(colors, percentages):
@@ -300,5 +437,245 @@ def analyze_colors(
                     "ratio": round(float(pct) / 100.0, 6),
                 }
             )
+    return palette
+
+
+def analyze_image(
+    image_bgr: np.ndarray,
+    image_bytes: bytes,
+    method: Literal["opencv", "rembg", "auto"] = "opencv",
+    remover=None,
+    threshold: float = AUTO_CONFIDENCE_THRESHOLD,
+) -> dict[str, object]:
+    """对已读入的图片一次完成抠图、面积比例与颜色统计（同步函数）
+
+    结果与分别调用 analyze_area_ratio / analyze_colors 一致，但 rembg 只抠图一次。
+    批量分析时由调用方传入复用的 BackgroundRemover；threshold 为 auto 的可信度阈值。
+
+    Returns:
+        {"area_ratio", "color_count", "palette", "preview", "method"}，preview 为
+        BGR 预览图（未保存），method 为实际使用的抠图方法；使用 rembg 时另含
+        "rembg_model"，auto 时另含 "auto"（可信度评估）
 
-    return {"color_count": int(num_colors), "palette": palette}
+    Raises:
+        ValueError: 未检测到前景轮廓或颜色统计失败
+    """
+    repo_root = Path(__file__).resolve().parents[2]
+    scripts_dir = repo_root / "scripts"
+    sys.path.insert(0, str(repo_root))
+    sys.path.insert(0, str(scripts_dir))
+    try:
+        from area_ratio_calculator import AreaRatioCalculator  # type: ignore
+        from background_remover import BackgroundRemover  # type: ignore
+        from color_counter import count_product_colors_from_mask_rgb  # type: ignore
+    except Exception:
+        from scripts.area_ratio_calculator import AreaRatioCalculator  # type: ignore
+        from scripts.background_remover import BackgroundRemover  # type: ignore
+        from scripts.color_counter import (  # type: ignore
+            count_product_colors_from_mask_rgb,
+        )
+
+    remover = remover or BackgroundRemover()
+    quality = None
+    if method == "auto":
+        method, quality = choose_method(image_bgr, remover, threshold)
+    # auto 选用 opencv 时按与可信度评估相同的边缘规则取前景
+    from_border = quality is not None
+    mask, rgb = remover.get_mask_and_rgb(
+        method=method,
+        image_bgr=image_bgr if method == "opencv" else None,
+        image_bytes=image_bytes if method == "rembg" else None,
+        background_from_border=from_border,
+    )
+    base_bgr = image_bgr if method == "opencv" else cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+    ratio, preview = AreaRatioCalculator().compute(mask=mask, base_bgr=base_bgr)
+
+    # 颜色统计沿用 analyze_colors 的口径：opencv 使用未做形态学细化的 mask
+    if method == "opencv":
+        mask, rgb = get_mask_rgb_opencv(image_bgr, from_border)
+    num_colors, colors, percentages = count_product_colors_from_mask_rgb(
+        mask, rgb, k_range=(2, 10), min_percentage=5.0
+    )
+    if num_colors is None:
+        raise ValueError("颜色统计失败")
+    result = {
+        "area_ratio": ratio,
+        "color_count": int(num_colors),
+        "palette": _build_palette(colors, percentages),
+        "preview": preview,
+        "method": method,
+    }
+    if method == "rembg":
+        result["rembg_model"] = remover.rembg_model
+    if quality is not None:
+        result["auto"] = quality
+    return result
+
+
+def choose_method(
+    image_bgr: np.ndarray,
+    remover=None,
+    threshold: float = AUTO_CONFIDENCE_THRESHOLD,
+) -> tuple[str, dict[str, float]]:
+    """auto 方法：先评估 opencv 抠图的可信度，低于阈值时改用 rembg
+
+    opencv 候选按接触图片边缘较少的一侧取前景；选用 opencv 时，抠图也须使用
+    background_from_border=True，与评估结果一致。
+
+    Returns:
+        (实际使用的方法, 可信度评估)，评估含 score、solidity、foreground_fraction、
+        border_contact、polarity_agreement 与 threshold
+    """
+    remover = remover or get_background_remover("opencv")
+    quality = remover.opencv_quality(image_bgr)
+    method = "opencv" if quality["score"] >= threshold else "rembg"
+    logger.info(
+        f"[auto] opencv 可信度 {quality['score']:.3f}（阈值 {threshold}），使用 {method}"
+    )
+    return method, {**quality, "threshold": threshold}
+
+
+@_cache_by_image
+def choose_method_for_path(
+    static_path: str, roi: Optional[dict[str, Any]] = None
+) -> tuple[str, dict[str, float]]:
+    """读取已上传的图片并按 auto 规则选择抠图方法（同步函数，应在线程池中调用）"""
+    image_bgr, _ = load_image_bgr_from_path(static_path, roi)
+    return choose_method(image_bgr)
+
+
+@functools.cache
+def get_background_remover(
+    method: Literal["opencv", "rembg", "auto"] = "opencv",
+    rembg_model: Optional[str] = None,
+):
+    """进程内共享的抠图器；rembg 在首次调用时加载模型 session，之后的请求复用
+
+    auto 不预加载模型，首次需要改用 rembg 时再加载。
+
+    Raises:
+        ValueError: 未知的 rembg_model
+    """
+    repo_root = Path(__file__).resolve().parents[2]
+    scripts_dir = repo_root / "scripts"
+    sys.path.insert(0, str(repo_root))
+    sys.path.insert(0, str(scripts_dir))
+    try:
+        from background_remover import (  # type: ignore
+            BackgroundRemover,
+            get_rembg_session,
+        )
+    except Exception:
+        from scripts.background_remover import (  # type: ignore
+            BackgroundRemover,
+            get_rembg_session,
+        )
+
+    remover = BackgroundRemover(rembg_model)
+    if method == "rembg":
+        get_rembg_session(remover.rembg_model)
+    return remover
+
+
+def analyze_image_path(
+    static_path: str,
+    method: Literal["opencv", "rembg", "auto"] = "opencv",
+    remover=None,
+) -> dict[str, object]:
+    """分析已上传的图片并保存预览（同步函数，应在线程池中调用）"""
+    logger.info(f"[batch] 开始分析: path={static_path}, method={method}")
+    image_bgr, image_bytes = load_image_bgr_from_path(static_path)
+    result = analyze_image(image_bgr, image_bytes, method, remover)
+    preview_path = save_preview(result.pop("preview"))
+    logger.info(
+        f"[batch] 分析完成: ratio={result['area_ratio']:.4f}, colors={result['color_count']}"
+    )
+    return {**result, "preview_path": preview_path}
+
+
+def analyze_parts(
+    image_bgr: np.ndarray,
+    image_bytes: bytes,
+    method: Literal["opencv", "rembg", "auto"] = "opencv",
+    remover=None,
+    min_part_ratio: float = 0.05,
+) -> dict[str, object]:
+    """多零件排版图：一次抠图后逐个零件计算面积比例、尺寸与颜色（同步函数）
+
+    颜色对所有零件像素只聚类一次，再按零件编号统计各自占比。
+    opencv 抠图以接触图片边缘较多的一侧为背景（零件通常不会占满整张图）。
+
+    Returns:
+        {"part_count", "parts", "preview", "method"}；parts 每项含 index、bbox、
+        rect_size、pixel_area、area_ratio、color_count、palette，preview 为 BGR
+        预览图（未保存）；使用 rembg 时另含 "rembg_model"，auto 时另含 "auto"（可信度评估）
+
+    Raises:
+        ValueError: 未检测到前景
+    """
+    repo_root = Path(__file__).resolve().parents[2]
+    scripts_dir = repo_root / "scripts"
+    sys.path.insert(0, str(repo_root))
+    sys.path.insert(0, str(scripts_dir))
+    try:
+        from area_ratio_calculator import AreaRatioCalculator  # type: ignore
+        from color_counter import count_part_colors_from_labels  # type: ignore
+    except Exception:
+        from scripts.area_ratio_calculator import AreaRatioCalculator  # type: ignore
+        from scripts.color_counter import (  # type: ignore
+            count_part_colors_from_labels,
+        )
+
+    remover = remover or get_background_remover(method)
+    quality = None
+    if method == "auto":
+        method, quality = choose_method(image_bgr, remover)
+    if method == "opencv":
+        mask, rgb = remover.opencv_mask_and_rgb(image_bgr, background_from_border=True)
+        base_bgr = image_bgr
+    else:
+        mask, rgb = remover.get_mask_and_rgb(
+            method=method, image_bgr=None, image_bytes=image_bytes
+        )
+        base_bgr = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+
+    labels, parts, preview = AreaRatioCalculator().compute_parts(
+        mask=mask, base_bgr=base_bgr, min_part_ratio=min_part_ratio
+    )
+    colors = count_part_colors_from_labels(
+        labels, len(parts), rgb, k_range=(2, 10), min_percentage=5.0
+    )
+    for part, (num_colors, part_colors, percentages) in zip(parts, colors):
+        part["color_count"] = int(num_colors)
+        part["palette"] = _build_palette(part_colors, percentages)
+    result = {
+        "part_count": len(parts),
+        "parts": parts,
+        "preview": preview,
+        "method": method,
+    }
+    if method == "rembg":
+        result["rembg_model"] = remover.rembg_model
+    if quality is not None:
+        result["auto"] = quality
+    return result
+
+
+@_cache_by_image
+def analyze_parts_path(
+    static_path: str,
+    method: Literal["opencv", "rembg", "auto"] = "opencv",
+    min_part_ratio: float = 0.05,
+    rembg_model: Optional[str] = None,
+    roi: Optional[dict[str, Any]] = None,
+) -> dict[str, object]:
+    """分析已上传的零件排版图并保存预览（同步函数，应在线程池中调用）"""
+    logger.info(f"[parts] 开始分析: path={static_path}, method={method}, roi={roi}")
+    remover = get_background_remover(method, rembg_model)
+    image_bgr, image_bytes = load_image_bgr_from_path(static_path, roi)
+    result = analyze_parts(
+        image_bgr, image_bytes, method, remover, min_part_ratio=min_part_ratio
+    )
+    preview_path = save_preview(result.pop("preview"))
+    logger.info(f"[parts] 分析完成: parts={result['part_count']}")
+    return {**result, "preview_path": preview_path}
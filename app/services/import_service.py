@@ -0,0 +1,301 @@
+"""批量报价导入：流式解析 CSV / XLSX，按块向量化报价并流式写出结果"""
+
+import codecs
+import csv
+import io
+import tempfile
+from collections.abc import Iterable, Iterator, Sequence
+from itertools import islice
+from typing import IO, Any, Optional
+
+import numpy as np
+from pydantic import ValidationError
+
+from app.schemas.quote import QuoteRequest
+from app.services.calculator_service import calculate_quotes_vectorized
+from quotation import QuotationCalculator
+
+# 每块报价/写出的行数
+IMPORT_CHUNK_SIZE = 1000
+# 单次导入最多报价的数据行数，超出部分不再报价
+IMPORT_MAX_ROWS = 100000
+
+# 支持的文件格式（按扩展名识别）
+IMPORT_FORMATS = {".csv": "csv", ".xlsx": "xlsx"}
+
+# 报价参数 -> 可识别的表头（不区分大小写），与历史导出的 Excel 表头兼容
+IMPORT_COLUMN_ALIASES = {
+    "length": ("length", "长", "长(cm)", "长度", "产品长度"),
+    "width": ("width", "宽", "宽(cm)", "宽度", "产品宽度"),
+    "thickness": ("thickness", "厚", "厚(cm)", "厚度", "产品厚度"),
+    "color_count": ("color_count", "颜色数", "颜色数量"),
+    "area_ratio": ("area_ratio", "面积比例", "占用面积比例"),
+    "order_quantity": ("order_quantity", "quantity", "数量", "订单数量"),
+    "worker_type": ("worker_type", "工人类型"),
+}
+_OPTIONAL_COLUMNS = ("worker_type",)
+
+# 追加在原表各列之后的结果列
+RESULT_HEADERS = ("单价(元)", "总价(元)", "错误")
+
+# 复制上传内容、校验 CSV 编码时每次读取的字节数
+_SPOOL_READ_SIZE = 1024 * 1024
+# 依次尝试的 CSV 编码：UTF-8（可带 BOM），失败时 GB18030（Excel 中文版另存的 CSV）
+_CSV_ENCODINGS = ("utf-8-sig", "gb18030")
+
+
+class UploadTooLargeError(ValueError):
+    """上传文件超过大小限制"""
+
+
+def _decodes_as(fileobj: IO[bytes], encoding: str) -> bool:
+    decoder = codecs.getincrementaldecoder(encoding)()
+    try:
+        while chunk := fileobj.read(_SPOOL_READ_SIZE):
+            decoder.decode(chunk)
+        decoder.decode(b"", final=True)
+        return True
+    except UnicodeDecodeError:
+        return False
+    finally:
+        fileobj.seek(0)
+
+
+def _detect_csv_encoding(fileobj: IO[bytes]) -> str:
+    """按整个文件校验编码，而不是只看开头
+
+    在开始流式输出之前完成：文件后部的编码错误也在返回结果前报出，不会输出截断的表格。
+
+    Raises:
+        ValueError: 文件不是 UTF-8 或 GB18030 编码
+    """
+    for encoding in _CSV_ENCODINGS:
+        if _decodes_as(fileobj, encoding):
+            return encoding
+    raise ValueError("无法识别文件编码，请另存为 UTF-8 或 GB18030 编码的 CSV")
+
+
+def spool_upload(fileobj: IO[bytes], max_size: Optional[int] = None) -> IO[bytes]:
+    """把上传内容分块复制到磁盘临时文件，超过 max_size 字节时抛出 UploadTooLargeError
+
+    请求处理函数返回后上传文件即被关闭，而结果是在其后流式生成的。
+    """
+    spool = tempfile.TemporaryFile()
+    size = 0
+    while chunk := fileobj.read(_SPOOL_READ_SIZE):
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            spool.close()
+            raise UploadTooLargeError(f"文件大小超过限制({max_size // 1024 // 1024}MB)")
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+def iter_sheet_rows(fileobj: IO[bytes], fmt: str) -> Iterator[Sequence[Any]]:
+    """逐行读取上传文件（含表头行），不整体载入内存；读完或中止时关闭 fileobj"""
+    with fileobj:
+        if fmt == "csv":
+            encoding = _detect_csv_encoding(fileobj)
+            text = io.TextIOWrapper(fileobj, encoding=encoding, newline="")
+            yield from csv.reader(text)
+            return
+
+        from openpyxl import load_workbook
+
+        wb = load_workbook(fileobj, read_only=True, data_only=True)
+        try:
+            yield from wb.active.iter_rows(values_only=True)
+        finally:
+            wb.close()
+
+
+def map_columns(header: Sequence[Any]) -> dict[str, int]:
+    """按表头定位各报价参数所在列
+
+    Raises:
+        ValueError: 缺少必需的参数列
+    """
+    positions = {
+        str(title).strip().lower(): i
+        for i, title in enumerate(header)
+        if title is not None
+    }
+    columns = {}
+    for field, aliases in IMPORT_COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias.lower() in positions:
+                columns[field] = positions[alias.lower()]
+                break
+    missing = [
+        IMPORT_COLUMN_ALIASES[f][0]
+        for f in IMPORT_COLUMN_ALIASES
+        if f not in columns and f not in _OPTIONAL_COLUMNS
+    ]
+    if missing:
+        raise ValueError(f"缺少必需的列: {', '.join(missing)}")
+    return columns
+
+
+def strip_result_columns(
+    header: Sequence[Any], rows: Iterable[Sequence[Any]]
+) -> tuple[list[Any], Iterator[Sequence[Any]]]:
+    """去掉输入中已有的结果列（重新报价上一次的输出时），避免结果列重复"""
+    keep = [i for i, title in enumerate(header) if title not in RESULT_HEADERS]
+    if len(keep) == len(header):
+        return list(header), iter(rows)
+    return [header[i] for i in keep], (
+        [row[i] if i < len(row) else None for i in keep] for row in rows
+    )
+
+
+def _is_blank(row: Sequence[Any]) -> bool:
+    return all(v is None or (isinstance(v, str) and not v.strip()) for v in row)
+
+
+def parse_row(row: Sequence[Any], columns: dict[str, int]) -> QuoteRequest:
+    """按 QuoteRequest 的约束校验单行参数（空单元格视为缺省）
+
+    Raises:
+        ValidationError: 参数缺失或超出范围
+    """
+    values = {}
+    for field, i in columns.items():
+        value = row[i] if i < len(row) else None
+        if isinstance(value, str):
+            value = value.strip()
+        if value is not None and value != "":
+            values[field] = value
+    return QuoteRequest.model_validate(values)
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in error.errors()
+    )
+
+
+def calculation_error(calc: QuotationCalculator, req: QuoteRequest) -> str:
+    """向量化结果为 NaN 的行，用逐条计算取得与单条报价一致的错误信息"""
+    try:
+        result = calc.calculate_quote(
+            **req.model_dump(include=set(IMPORT_COLUMN_ALIASES))
+        )
+    except ValueError as e:
+        return str(e)
+    return result.get("error", "无法报价")
+
+
+def quote_chunk(
+    calc: QuotationCalculator, chunk: list[Sequence[Any]], columns: dict[str, int]
+) -> list[list[Any]]:
+    """向量化报价一块行：原行各列之后追加单价、总价与错误信息"""
+    requests: list[Optional[QuoteRequest]] = []
+    errors: list[Optional[str]] = []
+    for row in chunk:
+        try:
+            requests.append(parse_row(row, columns))
+            errors.append(None)
+        except ValidationError as e:
+            requests.append(None)
+            errors.append(_validation_message(e))
+
+    valid = [i for i, req in enumerate(requests) if req is not None]
+    unit_price = np.full(len(chunk), np.nan)
+    total_price = np.full(len(chunk), np.nan)
+    if valid:
+        quoted = calculate_quotes_vectorized(
+            calc,
+            *(
+                np.asarray([getattr(requests[i], f) for i in valid])
+                for f in (
+                    "length",
+                    "width",
+                    "thickness",
+                    "color_count",
+                    "area_ratio",
+                    "order_quantity",
+                )
+            ),
+            np.asarray([requests[i].worker_type for i in valid], dtype=object),
+        )
+        unit_price[valid] = quoted["unit_price"]
+        total_price[valid] = quoted["total_price"]
+
+    results = []
+    for i, row in enumerate(chunk):
+        if errors[i] is None and np.isnan(unit_price[i]):
+            errors[i] = calculation_error(calc, requests[i])
+        if errors[i] is None:
+            results.append([*row, float(unit_price[i]), float(total_price[i]), None])
+        else:
+            results.append([*row, None, None, errors[i]])
+    return results
+
+
+def quote_rows(
+    calc: QuotationCalculator,
+    rows: Iterable[Sequence[Any]],
+    columns: dict[str, int],
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+    max_rows: int = IMPORT_MAX_ROWS,
+) -> Iterator[list[Any]]:
+    """逐块报价（空行跳过）；超过 max_rows 时在第一条未报价的行上给出错误并停止"""
+    quoted = 0
+    for chunk in iter_chunks(rows, chunk_size):
+        if quoted + len(chunk) > max_rows:
+            yield from quote_chunk(calc, chunk[: max_rows - quoted], columns)
+            row = chunk[max_rows - quoted]
+            yield [*row, None, None, f"超过单次导入上限 {max_rows} 行，自此行起未报价"]
+            return
+        yield from quote_chunk(calc, chunk, columns)
+        quoted += len(chunk)
+
+
+def iter_chunks(
+    rows: Iterable[Sequence[Any]], chunk_size: int = IMPORT_CHUNK_SIZE
+) -> Iterator[list[Sequence[Any]]]:
+    """按块切分数据行，跳过空行"""
+    rows = (row for row in rows if not _is_blank(row))
+    while chunk := list(islice(rows, chunk_size)):
+        yield chunk
+
+
+def iter_csv_output(
+    header: Sequence[Any],
+    rows: Iterable[Sequence[Any]],
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+) -> Iterator[str]:
+    """每块写完即输出（带 BOM，便于 Excel 直接打开）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")
+    writer.writerow([*header, *RESULT_HEADERS])
+    for i, row in enumerate(rows, start=1):
+        writer.writerow(["" if v is None else v for v in row])
+        if i % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
+
+
+def iter_xlsx_output(
+    header: Sequence[Any],
+    rows: Iterable[Sequence[Any]],
+    read_size: int = 64 * 1024,
+) -> Iterator[bytes]:
+    """逐行写入只写工作簿，保存到临时文件后分块读出"""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("报价结果")
+    ws.append([*header, *RESULT_HEADERS])
+    for row in rows:
+        ws.append(row)
+
+    with tempfile.TemporaryFile() as spool:
+        wb.save(spool)
+        spool.seek(0)
+        while chunk := spool.read(read_size):
+            yield chunk
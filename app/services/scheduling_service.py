@@ -0,0 +1,199 @@
+"""产能排程：将一批报价订单分配到有限的机台与班次上"""
+
+import heapq
+import math
+from collections import deque
+from typing import Any, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.services.calculator_service import (
+    build_calculator_from_db,
+    calculate_quotes_vectorized,
+)
+from quotation import QuotationCalculator
+
+# 订单参数列
+_ORDER_FIELDS = (
+    "length",
+    "width",
+    "thickness",
+    "color_count",
+    "area_ratio",
+    "order_quantity",
+    "worker_type",
+)
+
+
+def _build_machines(
+    calc: QuotationCalculator, machines: int, workers: dict[str, int]
+) -> list[str]:
+    """按工人配置把机台分配给各工人类型：每名工人操作 machines_operated 台，
+    机台数不足时按 workers 中的顺序依次分配。返回每台机台所属的工人类型"""
+    machine_types: list[str] = []
+    for worker_type, count in workers.items():
+        profile = calc.WORKER_PROFILES.get(worker_type)
+        if not profile:
+            continue
+        wanted = count * profile["machines_operated"]
+        take = min(wanted, machines - len(machine_types))
+        machine_types.extend([worker_type] * take)
+    return machine_types
+
+
+def schedule_orders(
+    calc: QuotationCalculator,
+    orders: list[dict[str, Any]],
+    machines: int,
+    workers: dict[str, int],
+) -> dict[str, Any]:
+    """按优先级做事件驱动的列表排程
+
+    每台机台有 NEEDLES_PER_MACHINE 个颜色针头，订单占用 color_count + 1 个针头、
+    持续 shifts_needed 个班次（与报价成本模型的分摊口径一致），针头未占满时
+    同一机台可并行生产多个订单。订单按 (priority, due_days, 提交顺序) 排队，
+    每当有订单完成释放针头时，依次为队首订单选择剩余针头最少但足够的机台
+    （best fit）；队首无法安排时等待下一次释放，不越过队首插队，避免大订单饿死。
+
+    Args:
+        calc: 已加载设置的计算器
+        orders: 订单参数列表（含 _ORDER_FIELDS，可选 id / priority / due_days）
+        machines: 机台总数
+        workers: 各工人类型的人数
+
+    Returns:
+        排程结果：scheduled（逐单起止班次与交期）、unscheduled（无法安排的订单及原因）
+        与 summary（总工期、利用率、平均交期、逾期数）
+    """
+    needles_per_machine = calc.NEEDLES_PER_MACHINE
+    shifts_per_day = calc.SHIFTS_PER_DAY
+    machine_types = _build_machines(calc, machines, workers)
+    machines_by_type: dict[str, list[int]] = {}
+    for m, worker_type in enumerate(machine_types):
+        machines_by_type.setdefault(worker_type, []).append(m)
+
+    # 向量化计算每单所需班数
+    columns = {f: np.asarray([o[f] for o in orders]) for f in _ORDER_FIELDS}
+    shifts_needed = calculate_quotes_vectorized(calc, **columns)["shifts_needed"]
+
+    queues: dict[str, deque] = {}
+    unscheduled = []
+    ranked = sorted(
+        range(len(orders)),
+        key=lambda i: (
+            orders[i].get("priority", 0),
+            (
+                orders[i].get("due_days")
+                if orders[i].get("due_days") is not None
+                else math.inf
+            ),
+            i,
+        ),
+    )
+    for i in ranked:
+        order = orders[i]
+        if not math.isfinite(shifts_needed[i]):
+            unscheduled.append(
+                {"index": i, "id": order.get("id"), "reason": "订单参数无法报价"}
+            )
+        elif not machines_by_type.get(order["worker_type"]):
+            unscheduled.append(
+                {
+                    "index": i,
+                    "id": order.get("id"),
+                    "reason": "没有该工人类型可用的机台",
+                }
+            )
+        else:
+            queues.setdefault(order["worker_type"], deque()).append(i)
+
+    free = [needles_per_machine] * len(machine_types)
+    busy = [0.0] * len(machine_types)  # 各机台累计针头·班次
+    events: list[tuple[float, int, int]] = []  # (完成时刻, 机台, 释放针头数)
+    scheduled = []
+
+    def dispatch(now: float) -> None:
+        for worker_type, queue in queues.items():
+            candidates = machines_by_type[worker_type]
+            while queue:
+                i = queue[0]
+                needles = int(orders[i]["color_count"]) + 1
+                best: Optional[int] = None
+                for m in candidates:
+                    if free[m] >= needles and (best is None or free[m] < free[best]):
+                        best = m
+                if best is None:
+                    break
+                queue.popleft()
+                duration = float(shifts_needed[i])
+                end = now + duration
+                free[best] -= needles
+                busy[best] += needles * duration
+                heapq.heappush(events, (end, best, needles))
+                due_days = orders[i].get("due_days")
+                lead_time_days = end / shifts_per_day
+                scheduled.append(
+                    {
+                        "index": i,
+                        "id": orders[i].get("id"),
+                        "worker_type": worker_type,
+                        "machine": best,
+                        "needles": needles,
+                        "start_shift": now,
+                        "end_shift": end,
+                        "lead_time_days": lead_time_days,
+                        "late": due_days is not None and lead_time_days > due_days,
+                    }
+                )
+
+    dispatch(0.0)
+    while events:
+        now, m, needles = heapq.heappop(events)
+        free[m] += needles
+        # 同一时刻的完成事件一并释放后再派工
+        while events and events[0][0] == now:
+            _, m, needles = heapq.heappop(events)
+            free[m] += needles
+        dispatch(now)
+
+    makespan = max((s["end_shift"] for s in scheduled), default=0.0)
+    capacity = needles_per_machine * makespan
+    utilization_by_type = {
+        worker_type: (
+            sum(busy[m] for m in ms) / (capacity * len(ms)) if capacity else 0.0
+        )
+        for worker_type, ms in machines_by_type.items()
+    }
+    scheduled.sort(key=lambda s: s["index"])
+    return {
+        "scheduled": scheduled,
+        "unscheduled": unscheduled,
+        "summary": {
+            "orders": len(orders),
+            "scheduled": len(scheduled),
+            "machines": len(machine_types),
+            "makespan_shifts": makespan,
+            "makespan_days": makespan / shifts_per_day,
+            "utilization": (
+                sum(busy) / (capacity * len(machine_types)) if capacity else 0.0
+            ),
+            "utilization_by_worker_type": utilization_by_type,
+            "avg_lead_time_days": (
+                sum(s["lead_time_days"] for s in scheduled) / len(scheduled)
+                if scheduled
+                else 0.0
+            ),
+            "late_orders": sum(s["late"] for s in scheduled),
+        },
+    }
+
+
+def schedule_orders_from_db(
+    db: Session,
+    orders: list[dict[str, Any]],
+    machines: int,
+    workers: dict[str, int],
+) -> dict[str, Any]:
+    """使用当前系统设置排程"""
+    return schedule_orders(build_calculator_from_db(db), orders, machines, workers)
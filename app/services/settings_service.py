@@ -1,10 +1,19 @@
 """Settings service for creating snapshots and managing app settings."""
 
-from typing import Any
+from datetime import datetime
+from typing import Any, Optional
 
+import numpy as np
 from sqlalchemy.orm import Session
 
 from app.db import crud
+from app.services.calculator_service import (
+    build_calculator_from_db,
+    calculate_quotes_vectorized,
+)
+
+# Number of histogram bins in settings simulation results
+SIMULATION_HISTOGRAM_BINS = 20
 
 
 def create_settings_snapshot(db: Session) -> dict[str, Any]:
@@ -131,3 +140,97 @@ def update_settings_batch(db: Session, settings_data: dict[str, Any]) -> bool:
     except Exception:
         db.rollback()
         return False
+
+
+def _price_distribution(prices: np.ndarray, edges: np.ndarray) -> dict[str, Any]:
+    """Summarize a unit-price distribution, ignoring NaN (unpriceable) rows."""
+    prices = prices[np.isfinite(prices)]
+    if not len(prices):
+        return {"count": 0, "histogram": [0] * (len(edges) - 1)}
+    p10, p50, p90 = np.percentile(prices, [10, 50, 90])
+    return {
+        "count": int(len(prices)),
+        "mean": float(prices.mean()),
+        "min": float(prices.min()),
+        "p10": float(p10),
+        "p50": float(p50),
+        "p90": float(p90),
+        "max": float(prices.max()),
+        "histogram": np.histogram(prices, bins=edges)[0].tolist(),
+    }
+
+
+def simulate_settings(
+    db: Session,
+    settings_overlay: Optional[dict[str, Any]] = None,
+    worker_profiles_overlay: Optional[list[dict[str, Any]]] = None,
+    limit: int = 5000,
+    worker_type: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> dict[str, Any]:
+    """Re-price recent history under draft settings without persisting anything.
+
+    The stored request parameters of the selected rows are loaded column-wise
+    and priced in one vectorized pass, once with the current settings and once
+    with the draft overlay.
+
+    Args:
+        db: Database session
+        settings_overlay: Draft settings applied over the current settings
+        worker_profiles_overlay: Draft worker profiles (matched by name)
+        limit: Number of most recent history rows to re-price
+        worker_type: Only include history of this worker type
+        start: Only include history computed at or after this time
+        end: Only include history computed at or before this time
+
+    Returns:
+        Distributions of stored, current and draft unit prices (sharing
+        histogram edges) plus a per-row summary of draft vs current changes
+    """
+    columns = crud.get_history_pricing_columns(db, limit, worker_type, start, end)
+    params = {
+        f: np.asarray(columns[f])
+        for f in (
+            "length",
+            "width",
+            "thickness",
+            "color_count",
+            "area_ratio",
+            "order_quantity",
+            "worker_type",
+        )
+    }
+    stored = np.asarray(columns["unit_price"], dtype=float)
+
+    current = calculate_quotes_vectorized(build_calculator_from_db(db), **params)
+    draft = calculate_quotes_vectorized(
+        build_calculator_from_db(db, settings_overlay, worker_profiles_overlay),
+        **params,
+    )
+    current, draft = current["unit_price"], draft["unit_price"]
+
+    finite = np.concatenate([a[np.isfinite(a)] for a in (stored, current, draft)])
+    if len(finite):
+        edges = np.histogram_bin_edges(finite, bins=SIMULATION_HISTOGRAM_BINS)
+    else:
+        edges = np.zeros(SIMULATION_HISTOGRAM_BINS + 1)
+
+    both = np.isfinite(current) & np.isfinite(draft)
+    delta = draft[both] - current[both]
+    pct = delta / current[both] * 100 if both.any() else delta
+    return {
+        "sample_size": int(len(stored)),
+        "histogram_edges": edges.tolist(),
+        "stored": _price_distribution(stored, edges),
+        "current": _price_distribution(current, edges),
+        "draft": _price_distribution(draft, edges),
+        "change": {
+            "compared": int(both.sum()),
+            "became_invalid": int((np.isfinite(current) & ~np.isfinite(draft)).sum()),
+            "increased": int((delta > 0).sum()),
+            "decreased": int((delta < 0).sum()),
+            "mean_delta": float(delta.mean()) if len(delta) else 0.0,
+            "mean_pct": float(pct.mean()) if len(pct) else 0.0,
+        },
+    }
@@ -0,0 +1,193 @@
+"""相似历史报价检索：基于产品特征向量的内存 KD 树索引"""
+
+import logging
+import threading
+from typing import Any, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.db import crud
+
+try:
+    from sklearn.neighbors import KDTree
+except ImportError:  # pragma: no cover - 未安装 scikit-learn 时退化为暴力检索
+    KDTree = None
+
+logger = logging.getLogger(__name__)
+
+# 参与距离计算的特征（均为 QuotationHistory 的提升列）
+FEATURES = ("length", "width", "thickness", "color_count", "area_ratio")
+# 随命中一并返回的附加字段
+_EXTRA_FIELDS = ("user_id", "worker_type", "unit_price", "order_quantity")
+
+# 增量写入的点先进入缓冲区（暴力检索），累积到该数量后重建该分区的树
+_PENDING_REBUILD_SIZE = 256
+# 分区内删除标记超过该数量时剔除已删除的点并重建树，查询时至多多取这么多条候选
+_TOMBSTONE_REBUILD_SIZE = 64
+
+
+class _Partition:
+    """一个检索范围（单个用户或全局）内的点集：KD 树 + 增量缓冲区 + 删除标记"""
+
+    def __init__(self) -> None:
+        self.ids: list[int] = []
+        self.features: list[tuple[float, ...]] = []
+        self.extras: list[dict[str, Any]] = []
+        self.positions: dict[int, int] = {}  # history_id -> 下标
+        self.removed: set[int] = set()  # 已删除点的下标
+        self.tree: Optional[Any] = None
+        self.tree_size = 0  # 已建入树的点数，其后为缓冲区
+        self.points = np.empty((0, len(FEATURES)))
+
+    def add(self, history_id: int, features: tuple, extra: dict) -> None:
+        self.positions[history_id] = len(self.ids)
+        self.ids.append(history_id)
+        self.features.append(features)
+        self.extras.append(extra)
+
+    def remove(self, history_id: int, scale: np.ndarray) -> None:
+        """标记删除；标记数超过 _TOMBSTONE_REBUILD_SIZE 时剔除已删除的点并重建"""
+        i = self.positions.get(history_id)
+        if i is None:
+            return
+        self.removed.add(i)
+        if len(self.removed) <= _TOMBSTONE_REBUILD_SIZE:
+            return
+        keep = [j for j in range(len(self.ids)) if j not in self.removed]
+        self.ids = [self.ids[j] for j in keep]
+        self.features = [self.features[j] for j in keep]
+        self.extras = [self.extras[j] for j in keep]
+        self.positions = {history_id: j for j, history_id in enumerate(self.ids)}
+        self.removed = set()
+        self.build(scale)
+
+    def build(self, scale: np.ndarray) -> None:
+        self.points = np.asarray(self.features, dtype=float).reshape(-1, len(FEATURES))
+        self.points = self.points / scale
+        self.tree_size = len(self.ids)
+        self.tree = KDTree(self.points) if KDTree and self.tree_size else None
+
+    def append_point(self, point: np.ndarray, scale: np.ndarray) -> None:
+        self.points = np.vstack([self.points, point])
+        if len(self.ids) - self.tree_size >= _PENDING_REBUILD_SIZE:
+            self.build(scale)
+
+    def query(self, point: np.ndarray, k: int) -> list[tuple[float, int]]:
+        """返回 (距离, 下标) 列表，按距离升序"""
+        candidates: list[tuple[float, int]] = []
+        start = 0
+        if self.tree is not None:
+            dist, idx = self.tree.query(point[None, :], k=min(k, self.tree_size))
+            candidates.extend(zip(dist[0].tolist(), idx[0].tolist()))
+            start = self.tree_size
+        rest = self.points[start:]
+        if len(rest):
+            dist = np.sqrt(((rest - point) ** 2).sum(axis=1))
+            order = np.argsort(dist)[:k]
+            candidates.extend(zip(dist[order].tolist(), (order + start).tolist()))
+        candidates.sort()
+        return candidates[:k]
+
+
+class SimilarQuoteIndex:
+    """按用户分区（另含全局分区供管理员使用）的 k 近邻索引
+
+    特征按各维标准差归一化，使尺寸、颜色数、面积比例在距离中的权重相当；
+    归一化系数在重建时计算，增量写入沿用当前系数。
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._scale = np.ones(len(FEATURES))
+        self._partitions: dict[Optional[int], _Partition] = {}
+
+    def rebuild(self, db: Session) -> int:
+        """从热表与归档表全量重建，返回索引点数"""
+        partitions: dict[Optional[int], _Partition] = {None: _Partition()}
+        for row in crud.iter_all_histories(db, FEATURES + _EXTRA_FIELDS):
+            features = tuple(getattr(row, f) for f in FEATURES)
+            if any(v is None for v in features):
+                continue
+            extra = {f: getattr(row, f) for f in _EXTRA_FIELDS}
+            partitions[None].add(row.id, features, extra)
+            partitions.setdefault(row.user_id, _Partition()).add(
+                row.id, features, extra
+            )
+
+        all_features = np.asarray(partitions[None].features, dtype=float)
+        scale = np.ones(len(FEATURES))
+        if len(all_features) > 1:
+            std = all_features.std(axis=0)
+            scale = np.where(std > 1e-9, std, 1.0)
+        for partition in partitions.values():
+            partition.build(scale)
+
+        with self._lock:
+            self._scale = scale
+            self._partitions = partitions
+        count = len(partitions[None].ids)
+        logger.info(f"相似报价索引已重建，共 {count} 条")
+        return count
+
+    def add(self, history: Any) -> None:
+        """增量加入一条历史记录（缺少特征字段时忽略）"""
+        features = tuple(getattr(history, f) for f in FEATURES)
+        if any(v is None for v in features):
+            return
+        extra = {f: getattr(history, f) for f in _EXTRA_FIELDS}
+        with self._lock:
+            point = np.asarray(features, dtype=float) / self._scale
+            for key in (None, history.user_id):
+                partition = self._partitions.setdefault(key, _Partition())
+                partition.add(history.id, features, extra)
+                partition.append_point(point, self._scale)
+
+    def discard(self, history_ids: list[int]) -> None:
+        """从全局分区与所属用户分区中删除记录"""
+        with self._lock:
+            everyone = self._partitions.get(None)
+            if everyone is None:
+                return
+            for history_id in history_ids:
+                i = everyone.positions.get(history_id)
+                if i is None or i in everyone.removed:
+                    continue
+                owner = self._partitions.get(everyone.extras[i]["user_id"])
+                for partition in (everyone, owner):
+                    if partition is not None:
+                        partition.remove(history_id, self._scale)
+
+    def query(
+        self,
+        features: dict[str, float],
+        k: int = 5,
+        user_id: Optional[int] = None,
+    ) -> list[dict[str, Any]]:
+        """查询最相近的 k 条历史；user_id 为 None 时在全局范围内检索"""
+        with self._lock:
+            partition = self._partitions.get(user_id)
+            if partition is None or not partition.ids:
+                return []
+            point = np.asarray([features[f] for f in FEATURES], dtype=float)
+            point = point / self._scale
+            # 多取该分区的删除标记数（不超过 _TOMBSTONE_REBUILD_SIZE），保证过滤后仍有 k 条
+            candidates = partition.query(point, k + len(partition.removed))
+            hits = []
+            for distance, i in candidates:
+                if i in partition.removed:
+                    continue
+                hits.append(
+                    {
+                        "id": partition.ids[i],
+                        "distance": distance,
+                        **dict(zip(FEATURES, partition.features[i])),
+                        **partition.extras[i],
+                    }
+                )
+                if len(hits) == k:
+                    break
+            return hits
+
+
+similar_quote_index = SimilarQuoteIndex()
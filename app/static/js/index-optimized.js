@@ -322,7 +322,7 @@ function debouncedFavoriteSearch(keyword) {
 /**
  * 优化的图像分析
  */
-async function analyzeImageOptimized(imagePath, enableAreaRatio = true, enableColorCount = false, method = 'opencv') {
+async function analyzeImageOptimized(imagePath, enableAreaRatio = true, enableColorCount = false, method = 'opencv', roi = null, rembgModel = null) {
     Loading.show('分析中...', '请耐心等待');
     
     try {
@@ -332,7 +332,9 @@ async function analyzeImageOptimized(imagePath, enableAreaRatio = true, enableCo
             promises.push(
                 Http.post('/api/analyze/area-ratio', {
                     image_path: imagePath,
-                    method: method
+                    method: method,
+                    rembg_model: rembgModel,
+                    roi: roi
                 }, {
                     timeout: method === 'rembg' ? 300000 : 120000
                 }).then(result => ({ type: 'area', result }))
@@ -343,7 +345,9 @@ async function analyzeImageOptimized(imagePath, enableAreaRatio = true, enableCo
             promises.push(
                 Http.post('/api/analyze/colors', {
                     image_path: imagePath,
-                    method: method
+                    method: method,
+                    rembg_model: rembgModel,
+                    roi: roi
                 }, {
                     timeout: method === 'rembg' ? 300000 : 120000
                 }).then(result => ({ type: 'colors', result }))
@@ -24,6 +24,9 @@ def handle_common_exceptions(
         async def wrapper(*args: Any, **kwargs: Any) -> Any:
             try:
                 return await func(*args, **kwargs)
+            except HTTPException:
+                # 路由自行给出的状态码（如超时 504）原样返回
+                raise
             except FileNotFoundError as e:
                 raise HTTPException(
                     status_code=404, detail=f"{file_not_found_msg}: {str(e)}"
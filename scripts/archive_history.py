@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+将早于保留期的报价历史移入压缩归档表（quotation_history_archive）
+
+使用方法：
+    python scripts/archive_history.py              # 使用 HISTORY_RETENTION_DAYS（默认 180 天）
+    python scripts/archive_history.py --days 90
+"""
+import argparse
+import logging
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+
+def main() -> int:
+    from app.config import settings
+
+    parser = argparse.ArgumentParser(description="归档冷报价历史")
+    parser.add_argument(
+        "--days",
+        type=int,
+        default=settings.HISTORY_RETENTION_DAYS,
+        help="热表保留天数，更早的记录被归档",
+    )
+    args = parser.parse_args()
+
+    from app.db import crud
+    from app.db.session import SessionLocal, init_db
+
+    init_db()
+    db = SessionLocal()
+    try:
+        before = datetime.utcnow() - timedelta(days=args.days)
+        count = crud.archive_histories(db, before)
+        logger.info(f"✓ 归档完成，共移动 {count} 条早于 {before:%Y-%m-%d} 的历史记录")
+        return 0
+    except Exception as e:
+        logger.error(f"✗ 归档失败: {e}")
+        return 1
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
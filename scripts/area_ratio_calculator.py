@@ -52,3 +52,81 @@ class AreaRatioCalculator:
         ratio, rect = self._compute_ratio_from_contour(contour)
         preview = self._draw_preview(base_bgr, contour, rect)
         return ratio, self._ensure_uint8(preview)
+
+    @staticmethod
+    def _reading_order(stats: np.ndarray, labels: np.ndarray) -> np.ndarray:
+        """按行排序：与当前行纵向重叠的零件归为同一行，行内从左到右"""
+        rows: list[list[int]] = []
+        row_bottom = -1
+        for label in sorted(labels, key=lambda i: stats[i, cv2.CC_STAT_TOP]):
+            top = stats[label, cv2.CC_STAT_TOP]
+            bottom = top + stats[label, cv2.CC_STAT_HEIGHT]
+            if rows and top < row_bottom:
+                rows[-1].append(label)
+                row_bottom = max(row_bottom, bottom)
+            else:
+                rows.append([label])
+                row_bottom = bottom
+        order: list[int] = []
+        for row in rows:
+            order.extend(sorted(row, key=lambda i: stats[i, cv2.CC_STAT_LEFT]))
+        return np.array(order, dtype=np.intp)
+
+    def compute_parts(
+        self, *, mask: np.ndarray, base_bgr: np.ndarray, min_part_ratio: float = 0.05
+    ) -> tuple[np.ndarray, list[dict], np.ndarray]:
+        """多零件模式：对前景做连通域标记，逐个零件计算面积比例与尺寸。
+
+        面积小于最大零件 min_part_ratio 倍的连通域视为噪点丢弃。零件按行（外接框
+        纵向重叠者为同一行）从上到下、行内从左到右编号。
+
+        返回 (labels, parts, preview)：labels 中 0 为背景、i 为第 i 个零件；
+        parts 每项含 bbox（x, y, w, h）、rect_size（最小外接矩形长边、短边）、
+        pixel_area 与 area_ratio（尺寸单位均为像素）。
+        """
+        binary = (mask > 0).astype(np.uint8)
+        num, raw_labels, stats, _ = cv2.connectedComponentsWithStats(
+            binary, connectivity=8
+        )
+        areas = stats[1:, cv2.CC_STAT_AREA]
+        if len(areas) == 0:
+            raise ValueError("未能检测到有效前景轮廓")
+        keep = np.flatnonzero(areas >= areas.max() * min_part_ratio) + 1
+        order = self._reading_order(stats, keep)
+        # 原连通域编号 -> 零件编号（丢弃的为 0）
+        lut = np.zeros(num, dtype=np.int32)
+        lut[order] = np.arange(1, len(order) + 1)
+        labels = lut[raw_labels]
+
+        preview = base_bgr.copy()
+        parts = []
+        for index, label in enumerate(order, start=1):
+            x, y, w, h, pixel_area = (int(v) for v in stats[label])
+            part_mask = (raw_labels[y : y + h, x : x + w] == label).astype(np.uint8)
+            contours, _ = cv2.findContours(
+                part_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(x, y)
+            )
+            contour = max(contours, key=cv2.contourArea)
+            ratio, rect = self._compute_ratio_from_contour(contour)
+            parts.append(
+                {
+                    "index": index,
+                    "bbox": [x, y, w, h],
+                    "rect_size": sorted(map(float, rect[1]), reverse=True),
+                    "pixel_area": pixel_area,
+                    "area_ratio": ratio,
+                }
+            )
+            cv2.drawContours(preview, [contour], -1, (0, 255, 0), 2)
+            cv2.polylines(preview, [np.intp(cv2.boxPoints(rect))], True, (0, 0, 255), 2)
+            cv2.putText(
+                preview,
+                str(index),
+                (x, max(y - 4, 12)),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.5,
+                (255, 0, 0),
+                1,
+                cv2.LINE_AA,
+            )
+        return labels, parts, self._ensure_uint8(preview)
@@ -3,6 +3,7 @@ from typing import Literal, Optional
 import logging
 from pathlib import Path
 import os
+import threading
 
 import cv2
 import numpy as np
@@ -10,56 +11,153 @@ from PIL import Image
 
 logger = logging.getLogger(__name__)
 
+# 可选的 rembg 模型：名称 -> rembg session 名称与模型文件名（约略大小仅供参考）
+# - u2net：默认，精度最高，约 176MB
+# - u2netp：u2net 的轻量版，约 4.7MB，速度快数倍，边缘较粗
+# - silueta：u2net 裁剪版，约 43MB，精度接近 u2net
+# - isnet：isnet-general-use，约 179MB，细节更好但更慢
+# - u2net_int8：由 models/u2net.onnx 离线量化得到（scripts/quantize_rembg_model.py），约 44MB，
+#   不能下载，只从 models/ 目录加载
+REMBG_MODELS = {
+    "u2net": {"session": "u2net", "file": "u2net.onnx"},
+    "u2netp": {"session": "u2netp", "file": "u2netp.onnx"},
+    "silueta": {"session": "silueta", "file": "silueta.onnx"},
+    "isnet": {"session": "isnet-general-use", "file": "isnet-general-use.onnx"},
+    "u2net_int8": {
+        "session": "u2net_custom",
+        "file": "u2net_int8.onnx",
+        "offline": True,
+    },
+}
+DEFAULT_REMBG_MODEL = "u2net"
+
+# opencv 可信度的交叉校验：按像素多少选出的前景与按边缘选出的不一致，且按边缘选出的
+# 前景占图片边缘像素超过该比例时，视为前景与背景难以区分
+AMBIGUOUS_BORDER_CONTACT = 0.05
+
 # 延迟导入 rembg，避免在不需要时加载
 _rembg_remove = None
-_rembg_session = None
+# 已加载的模型 session（按模型名称），进程内共享
+_rembg_sessions: dict = {}
+# 每个模型的加载锁；_rembg_sessions_lock 只保护锁表本身
+_rembg_model_locks: dict[str, threading.Lock] = {}
+_rembg_sessions_lock = threading.Lock()
 
-def _get_repo_model_path():
-    """获取仓库中的模型路径"""
+
+def _get_models_dir() -> Path:
     # 从当前文件位置向上两级到项目根目录
-    repo_root = Path(__file__).resolve().parents[1]
-    models_dir = repo_root / "models"
-    model_file = models_dir / "u2net.onnx"
+    return Path(__file__).resolve().parents[1] / "models"
+
+
+def _get_repo_model_path(model: str = DEFAULT_REMBG_MODEL):
+    """获取仓库中的模型路径"""
+    model_file = _get_models_dir() / REMBG_MODELS[model]["file"]
     return model_file if model_file.exists() else None
 
+
+def resolve_rembg_model(model: Optional[str] = None) -> str:
+    """校验模型名称；未指定时使用部署配置（环境变量 REMBG_MODEL），默认 u2net
+
+    Raises:
+        ValueError: 未知的模型名称
+    """
+    model = (model or os.getenv("REMBG_MODEL") or DEFAULT_REMBG_MODEL).lower()
+    if model not in REMBG_MODELS:
+        raise ValueError(f"未知的抠图模型: {model}（可选：{'、'.join(REMBG_MODELS)}）")
+    return model
+
+
 def _get_rembg_remove():
-    """延迟加载 rembg，优先使用本地模型文件"""
-    global _rembg_remove, _rembg_session
-    
+    """延迟加载 rembg"""
+    global _rembg_remove
+
     if _rembg_remove is None:
         try:
             from rembg import remove as _remove
-            from rembg import new_session
-            import os
-            
-            # 优先使用仓库中的模型文件
-            repo_model_path = _get_repo_model_path()
-            if repo_model_path:
-                logger.info(f"使用仓库中的模型文件: {repo_model_path}")
-                # 设置 U2NET_HOME 环境变量指向 models 目录
-                models_dir = repo_model_path.parent
-                os.environ['U2NET_HOME'] = str(models_dir)
-            else:
-                logger.info("仓库中未找到模型文件，将使用默认路径（可能需要下载）")
-            
-            # 设置环境变量增加超时时间（如果支持）
-            os.environ.setdefault('REQUESTS_TIMEOUT', '300')
-            
-            # 尝试预加载模型（如果失败会抛出异常）
-            logger.info("正在加载 rembg 模型...")
-            try:
-                # 预创建 session 以便提前下载模型（如果本地没有）
-                _rembg_session = new_session("u2net")
-                logger.info("rembg 模型加载成功")
-            except Exception as e:
-                logger.warning(f"rembg 模型预加载失败: {e}，将在使用时重试")
-            
-            _rembg_remove = _remove
         except ImportError:
             raise ImportError("rembg 模块未安装，请安装: pip install rembg")
+        # 设置环境变量增加超时时间（如果支持）
+        os.environ.setdefault('REQUESTS_TIMEOUT', '300')
+        _rembg_remove = _remove
     return _rembg_remove
 
 
+def _repo_session(session_name: str, models_dir: Path):
+    """创建从 models_dir 查找模型文件的 session（只对本 session 生效，不修改 U2NET_HOME）"""
+    import onnxruntime as ort
+    from rembg.sessions import sessions_class
+
+    base = next(sc for sc in sessions_class if sc.name() == session_name)
+
+    class RepoSession(base):
+        @classmethod
+        def u2net_home(cls, *args, **kwargs):
+            return str(models_dir)
+
+    # 与 rembg.new_session 相同：按 OMP_NUM_THREADS 设置 onnxruntime 的线程数
+    sess_opts = ort.SessionOptions()
+    if "OMP_NUM_THREADS" in os.environ:
+        sess_opts.inter_op_num_threads = int(os.environ["OMP_NUM_THREADS"])
+        sess_opts.intra_op_num_threads = int(os.environ["OMP_NUM_THREADS"])
+    return RepoSession(session_name, sess_opts)
+
+
+def _new_rembg_session(model: str):
+    """创建模型 session，优先使用仓库 models/ 目录中的模型文件"""
+    from rembg import new_session
+
+    spec = REMBG_MODELS[model]
+    repo_model_path = _get_repo_model_path(model)
+    if spec.get("offline"):
+        if repo_model_path is None:
+            raise ValueError(
+                f"模型文件不存在: models/{spec['file']}，"
+                "请先运行 python scripts/quantize_rembg_model.py 生成"
+            )
+        return new_session(spec["session"], model_path=str(repo_model_path))
+    if repo_model_path:
+        logger.info(f"使用仓库中的模型文件: {repo_model_path}")
+        return _repo_session(spec["session"], repo_model_path.parent)
+    logger.info("仓库中未找到模型文件，将使用默认路径（可能需要下载）")
+    return new_session(spec["session"])
+
+
+def _model_lock(model: str) -> threading.Lock:
+    with _rembg_sessions_lock:
+        return _rembg_model_locks.setdefault(model, threading.Lock())
+
+
+def load_rembg_session(model: Optional[str] = None):
+    """返回进程内共享的模型 session，首次使用时加载（失败时抛出异常）
+
+    每个模型一把锁：加载（可能需要下载）一个模型时不阻塞其他模型
+    """
+    model = resolve_rembg_model(model)
+    _get_rembg_remove()
+    with _model_lock(model):
+        if model not in _rembg_sessions:
+            logger.info(f"正在加载 rembg 模型 {model}...")
+            _rembg_sessions[model] = _new_rembg_session(model)
+            logger.info(f"rembg 模型 {model} 加载成功")
+        return _rembg_sessions[model]
+
+
+def get_rembg_session(model: Optional[str] = None):
+    """预加载并返回模型 session（加载失败时为 None，使用时会重试）
+
+    Raises:
+        ValueError: 未知的模型名称
+    """
+    resolve_rembg_model(model)
+    try:
+        return load_rembg_session(model)
+    except ImportError:
+        raise
+    except Exception as e:
+        logger.warning(f"rembg 模型预加载失败: {e}，将在使用时重试")
+        return None
+
+
 class BackgroundRemover:
     """前景抠图与RGB合成。
 
@@ -76,12 +174,18 @@ class BackgroundRemover:
         mask = cv2.erode(mask, k3, iterations=1)
         return mask
 
+    def __init__(self, rembg_model: Optional[str] = None):
+        """rembg_model 为 REMBG_MODELS 中的名称，未指定时使用部署配置"""
+        self.rembg_model = resolve_rembg_model(rembg_model)
+
     def rembg_mask_and_rgb(self, image_bytes: bytes) -> tuple[np.ndarray, np.ndarray]:
         """使用 rembg 进行背景移除"""
         try:
             remove_func = _get_rembg_remove()
-            logger.info("调用 rembg.remove() 处理图片...")
-            result_bytes = remove_func(image_bytes)
+            # 复用进程内已加载的 session，避免每次调用都重新加载模型
+            session = load_rembg_session(self.rembg_model)
+            logger.info(f"调用 rembg.remove() 处理图片（模型 {self.rembg_model}）...")
+            result_bytes = remove_func(image_bytes, session=session)
             logger.info("rembg 处理完成")
         except Exception as e:
             error_msg = str(e)
@@ -109,29 +213,102 @@ class BackgroundRemover:
         rgb = cv2.GaussianBlur(rgb, (3, 3), 0)
         return mask, rgb
 
+    @staticmethod
+    def _border_count(mask: np.ndarray) -> int:
+        return int(
+            np.count_nonzero(mask[0])
+            + np.count_nonzero(mask[-1])
+            + np.count_nonzero(mask[:, 0])
+            + np.count_nonzero(mask[:, -1])
+        )
+
     def opencv_mask_and_rgb(
-        self, image_bgr: np.ndarray
+        self, image_bgr: np.ndarray, background_from_border: bool = False
     ) -> tuple[np.ndarray, np.ndarray]:
+        """OTSU 阈值抠图
+
+        默认取像素较多的一侧为前景（产品照主体占满画面）；background_from_border
+        为 True 时取较少接触图片边缘的一侧为前景，适用于主体稀疏分布的零件排版图。
+        """
         bgr = image_bgr
-        gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
-        gray = cv2.GaussianBlur(gray, (5, 5), 0)
-        _, thr1 = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        _, thr2 = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-        c1 = np.count_nonzero(thr1)
-        c2 = np.count_nonzero(thr2)
-        mask = thr1 if c1 >= c2 else thr2
+        thr1, thr2 = self._otsu_masks(bgr)
+        mask = self._pick_foreground(thr1, thr2, background_from_border)
         mask = (mask > 0).astype(np.uint8)
         mask = self._refine_mask(mask)
         rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
         rgb = cv2.GaussianBlur(rgb, (3, 3), 0)
         return mask, rgb
 
+    @staticmethod
+    def _otsu_masks(image_bgr: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        gray = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(gray, (5, 5), 0)
+        _, thr1 = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        _, thr2 = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        return thr1, thr2
+
+    def _pick_foreground(
+        self, thr1: np.ndarray, thr2: np.ndarray, background_from_border: bool
+    ) -> np.ndarray:
+        if background_from_border:
+            b1 = self._border_count(thr1)
+            b2 = self._border_count(thr2)
+            return thr1 if b1 <= b2 else thr2
+        c1 = np.count_nonzero(thr1)
+        c2 = np.count_nonzero(thr2)
+        return thr1 if c1 >= c2 else thr2
+
+    def opencv_quality(self, image_bgr: np.ndarray) -> dict[str, float]:
+        """评估 OTSU 抠图结果是否可信（auto 方法据此决定是否改用 rembg）
+
+        前景按接触图片边缘较少的一侧选取（与 opencv_mask_and_rgb(background_from_border=True)
+        相同），白底上的小产品同样能取到主体：
+        - solidity：最大前景轮廓面积 / 其凸包面积；主体完整时接近 1，
+          背景纹理或阴影被并入、主体被切碎时明显偏低
+        - foreground_fraction：细化后的前景占比；过小（只抓到噪点）或
+          接近整幅（背景被当作前景）都不可信
+        - border_contact：前景占图片边缘像素的比例
+        - polarity_agreement：按像素多少选出的前景是否为同一侧，仅作交叉校验；
+          不一致且前景明显接触边缘（border_contact 超过 AMBIGUOUS_BORDER_CONTACT）
+          说明前景与背景难以区分
+        score 为 solidity、前景占比可信度与交叉校验（难以区分记 0.5）的乘积，取值 0~1。
+        """
+        thr1, thr2 = self._otsu_masks(image_bgr)
+        mask = self._pick_foreground(thr1, thr2, background_from_border=True)
+        other = self._pick_foreground(thr1, thr2, background_from_border=False)
+        agreement = 1.0 if mask is other else 0.0
+        border_contact = self._border_count(mask) / (2 * sum(mask.shape[:2]))
+        ambiguous = not agreement and border_contact > AMBIGUOUS_BORDER_CONTACT
+        mask = self._refine_mask((mask > 0).astype(np.uint8))
+
+        fraction = float(np.count_nonzero(mask)) / mask.size
+        # 前景占比在 [5%, 95%] 内视为可信，越出范围线性衰减到 0
+        fraction_score = min(1.0, fraction / 0.05, (1.0 - fraction) / 0.05)
+
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        solidity = 0.0
+        if contours:
+            largest = max(contours, key=cv2.contourArea)
+            hull_area = cv2.contourArea(cv2.convexHull(largest))
+            if hull_area > 0:
+                solidity = min(1.0, cv2.contourArea(largest) / hull_area)
+
+        score = solidity * fraction_score * (0.5 if ambiguous else 1.0)
+        return {
+            "score": round(score, 4),
+            "solidity": round(solidity, 4),
+            "foreground_fraction": round(fraction, 4),
+            "border_contact": round(border_contact, 4),
+            "polarity_agreement": agreement,
+        }
+
     def get_mask_and_rgb(
         self,
         *,
         method: Literal["rembg", "opencv"],
         image_bgr: Optional[np.ndarray],
         image_bytes: Optional[bytes],
+        background_from_border: bool = False,
     ) -> tuple[np.ndarray, np.ndarray]:
         if method == "rembg":
             if image_bytes is None:
@@ -140,5 +317,5 @@ class BackgroundRemover:
         if method == "opencv":
             if image_bgr is None:
                 raise ValueError("opencv 需要 image_bgr")
-            return self.opencv_mask_and_rgb(image_bgr)
+            return self.opencv_mask_and_rgb(image_bgr, background_from_border)
         raise ValueError("不支持的抠图方法")
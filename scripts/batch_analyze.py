@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+批量图片分析：遍历产品图片目录，多进程完成抠图、面积比例与颜色统计，结果逐条写入清单
+
+清单按图片内容的 SHA-256 记录结果（.jsonl 逐行追加，.db / .sqlite 写入 SQLite），
+重新运行时跳过清单中已有的图片，中断后再次执行同一命令即可从中断处继续。
+rembg / auto 使用 u2net 以外的模型时，清单中的 method 记为 "方法/模型"（如 rembg/u2netp），
+与其他模型的结果分开保存。
+
+使用方法：
+    python scripts/batch_analyze.py photos/ -o analysis.jsonl
+    python scripts/batch_analyze.py photos/ -o analysis.db --method rembg --workers 4
+    python scripts/batch_analyze.py photos/ -o analysis.jsonl --method auto    # opencv 不可靠时才用 rembg
+    python scripts/batch_analyze.py photos/ -o analysis.db --method rembg --rembg-model u2netp
+    python scripts/batch_analyze.py photos/ -o analysis.jsonl --retry-errors   # 重试失败的图片
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from collections.abc import Iterator
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# 清单格式（按扩展名识别）
+MANIFEST_FORMATS = {".jsonl": "jsonl", ".db": "sqlite", ".sqlite": "sqlite"}
+# 每处理多少张输出一次进度
+_PROGRESS_EVERY = 50
+# 计算图片 SHA-256 时每次读取的字节数
+_HASH_READ_SIZE = 1024 * 1024
+
+# 工作进程内复用的抠图器（rembg 模型 session 每个进程只加载一次），由 _init_worker 设置
+_worker_state: dict[str, Any] = {}
+
+
+def iter_images(root: Path) -> Iterator[Path]:
+    """递归列出目录下允许的图片文件（按路径排序，保证每次运行顺序一致）"""
+    from app.config import settings
+
+    extensions = {ext.lower() for ext in settings.ALLOWED_IMAGE_EXTENSIONS}
+    for path in sorted(root.rglob("*")):
+        if path.is_file() and path.suffix.lower() in extensions:
+            yield path
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(_HASH_READ_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class JsonlManifest:
+    """逐行追加的 JSONL 清单；每条结果写入后立即刷盘"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = None
+
+    def load(self) -> dict[tuple[str, str], Optional[str]]:
+        """读取已有记录：(sha256, method) -> 错误信息（成功为 None），同一图片以最后一条为准"""
+        done: dict[tuple[str, str], Optional[str]] = {}
+        if not self.path.exists():
+            return done
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 中断时可能留下写了一半的最后一行
+                    continue
+                done[(record["sha256"], record["method"])] = record.get("error")
+        return done
+
+    def open(self) -> None:
+        needs_newline = False
+        if self.path.exists() and self.path.stat().st_size:
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b"\n"
+        self._file = open(self.path, "a", encoding="utf-8")
+        if needs_newline:
+            self._file.write("\n")
+
+    def write(self, record: dict[str, Any]) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+
+class SqliteManifest:
+    """SQLite 清单；(sha256, method) 为主键，重试成功后覆盖失败记录"""
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS image_analysis (
+            sha256 TEXT NOT NULL,
+            method TEXT NOT NULL,
+            used_method TEXT,
+            auto_score REAL,
+            path TEXT NOT NULL,
+            area_ratio REAL,
+            color_count INTEGER,
+            palette TEXT,
+            error TEXT,
+            seconds REAL,
+            analyzed_at TEXT NOT NULL,
+            PRIMARY KEY (sha256, method)
+        )
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._conn = None
+
+    def load(self) -> dict[tuple[str, str], Optional[str]]:
+        if not self.path.exists():
+            return {}
+        self.open()
+        rows = self._conn.execute("SELECT sha256, method, error FROM image_analysis")
+        return {(sha256, method): error for sha256, method, error in rows}
+
+    def open(self) -> None:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute(self._SCHEMA)
+            # 旧版清单没有 auto 方法的两列
+            columns = {
+                row[1]
+                for row in self._conn.execute("PRAGMA table_info(image_analysis)")
+            }
+            for column, sql_type in (("used_method", "TEXT"), ("auto_score", "REAL")):
+                if column not in columns:
+                    self._conn.execute(
+                        f"ALTER TABLE image_analysis ADD COLUMN {column} {sql_type}"
+                    )
+
+    def write(self, record: dict[str, Any]) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO image_analysis "
+            "(sha256, method, used_method, auto_score, path, area_ratio, color_count, "
+            "palette, error, seconds, analyzed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                record["sha256"],
+                record["method"],
+                record["used_method"],
+                record["auto_score"],
+                record["path"],
+                record["area_ratio"],
+                record["color_count"],
+                None if record["palette"] is None else json.dumps(record["palette"]),
+                record["error"],
+                record["seconds"],
+                record["analyzed_at"],
+            ),
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+
+
+def open_manifest(path: str):
+    fmt = MANIFEST_FORMATS.get(Path(path).suffix.lower())
+    if fmt is None:
+        raise ValueError(f"不支持的清单格式: {path}（仅支持 .jsonl / .db / .sqlite）")
+    return JsonlManifest(Path(path)) if fmt == "jsonl" else SqliteManifest(Path(path))
+
+
+def method_label(method: str, rembg_model: str) -> str:
+    """清单中的 method 值；默认模型 u2net 保持原样，与旧清单兼容"""
+    if method == "opencv" or rembg_model == "u2net":
+        return method
+    return f"{method}/{rembg_model}"
+
+
+def _init_worker(method: str, rembg_model: str) -> None:
+    """每个工作进程创建一次抠图器；rembg 在此加载模型 session，之后的图片复用"""
+    import cv2
+
+    from scripts.background_remover import BackgroundRemover, get_rembg_session
+
+    # 并行度由进程数提供，避免每个进程再开满线程互相争抢
+    cv2.setNumThreads(1)
+    if method == "rembg":
+        get_rembg_session(rembg_model)
+    _worker_state.update(
+        method=method,
+        label=method_label(method, rembg_model),
+        remover=BackgroundRemover(rembg_model),
+    )
+
+
+def _analyze_in_worker(task: tuple[str, str]) -> dict[str, Any]:
+    """分析一张图片；失败时记录错误信息而不中断整批"""
+    import cv2
+    import numpy as np
+
+    from app.services.image_analysis_service import analyze_image
+
+    path, sha256 = task
+    method = _worker_state["method"]
+    record: dict[str, Any] = {
+        "sha256": sha256,
+        "method": _worker_state["label"],
+        "used_method": None,
+        "auto_score": None,
+        "path": path,
+        "area_ratio": None,
+        "color_count": None,
+        "palette": None,
+        "error": None,
+    }
+    started = time.perf_counter()
+    try:
+        data = Path(path).read_bytes()
+        image_bgr = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image_bgr is None:
+            raise ValueError("无法读取图片内容")
+        result = analyze_image(image_bgr, data, method, _worker_state["remover"])
+        record.update(
+            area_ratio=round(float(result["area_ratio"]), 6),
+            color_count=result["color_count"],
+            palette=result["palette"],
+            used_method=result["method"],
+        )
+        if "auto" in result:
+            record["auto_score"] = result["auto"]["score"]
+    except Exception as e:
+        record["error"] = str(e) or type(e).__name__
+    record["seconds"] = round(time.perf_counter() - started, 3)
+    record["analyzed_at"] = datetime.now().isoformat(timespec="seconds")
+    return record
+
+
+def _imap_unordered(pool: ProcessPoolExecutor, fn, items, window: int) -> Iterator:
+    """按完成顺序返回结果，同时在途的任务不超过 window 个"""
+    pending = set()
+    for item in items:
+        pending.add(pool.submit(fn, item))
+        if len(pending) >= window:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield future.result()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="批量图片分析（抠图、面积比例、颜色统计）"
+    )
+    parser.add_argument("directory", help="图片目录（递归查找）")
+    parser.add_argument(
+        "-o", "--output", required=True, help="结果清单路径（.jsonl / .db / .sqlite）"
+    )
+    parser.add_argument(
+        "--method",
+        choices=["opencv", "rembg", "auto"],
+        default="opencv",
+        help="抠图方法（auto：先用 opencv，可信度不足时改用 rembg）",
+    )
+    parser.add_argument(
+        "--rembg-model",
+        default=None,
+        help="rembg 使用的模型（u2net、u2netp、silueta、isnet、u2net_int8），默认为部署配置 REMBG_MODEL",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="工作进程数（1 表示在当前进程内分析），默认 CPU 核数",
+    )
+    parser.add_argument(
+        "--retry-errors", action="store_true", help="重新分析清单中记录为失败的图片"
+    )
+    args = parser.parse_args()
+
+    root = Path(args.directory)
+    if not root.is_dir():
+        logger.error(f"✗ 目录不存在: {root}")
+        return 1
+    try:
+        from scripts.background_remover import resolve_rembg_model
+
+        rembg_model = resolve_rembg_model(args.rembg_model)
+        label = method_label(args.method, rembg_model)
+        manifest = open_manifest(args.output)
+        done = manifest.load()
+    except Exception as e:
+        logger.error(f"✗ {e}")
+        return 1
+
+    tasks = []
+    seen = set()
+    skipped = duplicates = 0
+    for path in iter_images(root):
+        sha256 = file_sha256(path)
+        if sha256 in seen:
+            duplicates += 1
+            continue
+        seen.add(sha256)
+        key = (sha256, label)
+        if key in done and (done[key] is None or not args.retry_errors):
+            skipped += 1
+            continue
+        tasks.append((str(path), sha256))
+    logger.info(
+        f"共 {len(seen) + duplicates} 张图片：待分析 {len(tasks)}，"
+        f"清单中已有 {skipped}，重复内容 {duplicates}"
+    )
+    if not tasks:
+        manifest.close()
+        logger.info(f"✓ 无需分析，清单已是最新: {args.output}")
+        return 0
+
+    counts = {"ok": 0, "error": 0}
+    used_methods: dict[str, int] = {}
+    started = time.perf_counter()
+
+    def record_all(records) -> None:
+        for record in records:
+            manifest.write(record)
+            if record["error"] is None:
+                counts["ok"] += 1
+                used = record["used_method"]
+                used_methods[used] = used_methods.get(used, 0) + 1
+            else:
+                counts["error"] += 1
+                logger.warning(f"✗ {record['path']}: {record['error']}")
+            finished = counts["ok"] + counts["error"]
+            if finished % _PROGRESS_EVERY == 0:
+                elapsed = time.perf_counter() - started
+                logger.info(
+                    f"进度 {finished}/{len(tasks)}，{finished / elapsed:.1f} 张/秒"
+                )
+
+    manifest.open()
+    pool = None
+    try:
+        if args.workers <= 1:
+            _init_worker(args.method, rembg_model)
+            record_all(map(_analyze_in_worker, tasks))
+        else:
+            pool = ProcessPoolExecutor(
+                max_workers=args.workers,
+                initializer=_init_worker,
+                initargs=(args.method, rembg_model),
+            )
+            record_all(
+                _imap_unordered(
+                    pool, _analyze_in_worker, tasks, window=args.workers * 2
+                )
+            )
+    except KeyboardInterrupt:
+        logger.warning(
+            f"已中断：{counts['ok'] + counts['error']} 张结果已写入 {args.output}，"
+            "重新运行同一命令即可继续"
+        )
+        return 130
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        manifest.close()
+    elapsed = time.perf_counter() - started
+
+    logger.info(
+        f"✓ 已分析 {counts['ok'] + counts['error']} 张（失败 {counts['error']}），"
+        f"耗时 {elapsed:.2f}s，{len(tasks) / elapsed:.1f} 张/秒（{args.workers} 个进程）"
+    )
+    if args.method == "auto":
+        logger.info(
+            f"auto：opencv {used_methods.get('opencv', 0)} 张，"
+            f"改用 rembg {used_methods.get('rembg', 0)} 张"
+        )
+    logger.info(f"✓ 结果清单: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+批量报价：读取产品表（CSV / Parquet），按当前系统设置多进程向量化计算，写出价格表
+
+输入表头与 /api/quote/import 相同（英文字段名或历史导出的中文表头），
+输出为原表各列加上 单价(元) / 总价(元) / 错误 三列。
+
+使用方法：
+    python scripts/batch_quote.py products.csv -o price_list.csv
+    python scripts/batch_quote.py products.parquet -o price_list.parquet --workers 8
+    python scripts/batch_quote.py products.csv -o price_list.csv --verify   # 同时逐条计算并核对
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from typing import Any, Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# 每块报价的行数（即每次分派给工作进程的任务大小）
+DEFAULT_CHUNK_SIZE = 5000
+# 核对模式下最多列出的不一致行数
+_MAX_REPORTED_MISMATCHES = 10
+
+# 工作进程内的计算器与列映射，由 _init_worker 在进程启动时设置一次
+_worker_state: dict[str, Any] = {}
+
+
+def _file_format(path: str) -> str:
+    ext = Path(path).suffix.lower()
+    if ext not in (".csv", ".parquet"):
+        raise ValueError(f"不支持的文件格式: {path}（仅支持 .csv / .parquet）")
+    return ext[1:]
+
+
+def _require_pyarrow() -> None:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise ValueError("Parquet 读写需要安装 pyarrow: pip install pyarrow") from e
+
+
+@contextmanager
+def read_rows(
+    path: str, batch_size: int
+) -> Iterator[tuple[list[str], Iterator[tuple]]]:
+    """打开输入文件，给出表头与逐行迭代器（按批读取，不整体载入）；退出时关闭文件"""
+    from app.services import import_service
+
+    if _file_format(path) == "csv":
+        with open(path, "rb") as f:
+            rows = import_service.iter_sheet_rows(f, "csv")
+            header = next(rows, None)
+            if header is None:
+                raise ValueError("输入文件为空")
+            yield list(header), rows
+        return
+
+    _require_pyarrow()
+    import pyarrow.parquet as pq
+
+    with pq.ParquetFile(path) as parquet:
+
+        def iter_parquet() -> Iterator[tuple]:
+            for batch in parquet.iter_batches(batch_size=batch_size):
+                yield from zip(*(column.to_pylist() for column in batch.columns))
+
+        yield parquet.schema_arrow.names, iter_parquet()
+
+
+def write_rows(path: str, header: list[str], rows: Iterable[list]) -> None:
+    """流式写出结果；Parquet 按块写入行组"""
+    from app.services import import_service
+
+    if _file_format(path) == "csv":
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            for text in import_service.iter_csv_output(header, rows):
+                f.write(text)
+        return
+
+    _require_pyarrow()
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    names = [str(h) for h in header] + list(import_service.RESULT_HEADERS)
+    result_types = {
+        "单价(元)": pa.float64(),
+        "总价(元)": pa.float64(),
+        "错误": pa.string(),
+    }
+    writer = None
+    try:
+        for chunk in import_service.iter_chunks(rows, DEFAULT_CHUNK_SIZE):
+            columns = list(zip(*chunk))
+            arrays = [
+                pa.array(values, type=result_types.get(name))
+                for name, values in zip(names, columns)
+            ]
+            table = pa.Table.from_arrays(arrays, names=names)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table.cast(writer.schema))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _init_worker(calc, columns: dict[str, int], verify: bool) -> None:
+    _worker_state.update(calc=calc, columns=columns, verify=verify)
+
+
+def _quote_chunk_in_worker(chunk: list[tuple]) -> dict[str, Any]:
+    """向量化报价一块；核对模式下再逐条计算同一块并比较"""
+    from pydantic import ValidationError
+
+    from app.services import import_service
+
+    calc, columns = _worker_state["calc"], _worker_state["columns"]
+    started = time.perf_counter()
+    rows = import_service.quote_chunk(calc, chunk, columns)
+    report = {"rows": rows, "batch_seconds": time.perf_counter() - started}
+    if not _worker_state["verify"]:
+        return report
+
+    started = time.perf_counter()
+    verified = 0
+    mismatches = []
+    for source, row in zip(chunk, rows):
+        unit_price, total_price, error = row[-3:]
+        try:
+            req = import_service.parse_row(source, columns)
+        except ValidationError:
+            # 参数校验未通过的行两种引擎都不计算
+            continue
+        try:
+            scalar = calc.calculate_quote(
+                **req.model_dump(include=set(import_service.IMPORT_COLUMN_ALIASES))
+            )
+        except ValueError as e:
+            scalar = {"error": str(e)}
+        verified += 1
+        expected = (
+            scalar.get("产品单价"),
+            scalar.get("订单货款总额"),
+            scalar.get("error"),
+        )
+        if (unit_price, total_price, error) != expected:
+            mismatches.append(
+                {"row": list(source), "batch": row[-3:], "scalar": expected}
+            )
+    report.update(
+        scalar_seconds=time.perf_counter() - started,
+        verified=verified,
+        mismatches=mismatches,
+    )
+    return report
+
+
+def _imap_ordered(
+    pool: ProcessPoolExecutor, fn: Callable, items: Iterable, window: int
+) -> Iterator:
+    """按输入顺序返回结果，同时在途的任务不超过 window 个，避免整表堆积在内存中"""
+    pending: deque = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _load_calculator(use_defaults: bool):
+    from quotation import QuotationCalculator
+
+    if use_defaults:
+        logger.info("使用 quotation.py 默认参数")
+        return QuotationCalculator()
+
+    from app.db.session import SessionLocal
+    from app.services.calculator_service import build_calculator_from_db
+
+    db = SessionLocal()
+    try:
+        calc = build_calculator_from_db(db)
+    finally:
+        db.close()
+    logger.info(
+        f"已加载系统设置：利润率 {calc.PROFIT_MARGIN:.1%}，废品率 {calc.WASTE_RATE:.1%}"
+    )
+    return calc
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="批量报价（CSV / Parquet）")
+    parser.add_argument("input", help="产品表路径（.csv / .parquet）")
+    parser.add_argument(
+        "-o", "--output", required=True, help="结果路径（.csv / .parquet）"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="工作进程数（1 表示在当前进程内计算），默认 CPU 核数",
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="每个任务的行数"
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="同时用逐条计算（calculate_quote）重算每一行并核对结果",
+    )
+    parser.add_argument(
+        "--default-settings",
+        action="store_true",
+        help="不读取数据库，使用 quotation.py 中的默认参数",
+    )
+    args = parser.parse_args()
+
+    from app.services import import_service
+
+    # 输入文件在整个报价过程中保持打开，结束（或出错）时关闭
+    with ExitStack() as inputs:
+        try:
+            if _file_format(args.output) == "parquet":
+                _require_pyarrow()
+            calc = _load_calculator(args.default_settings)
+            header, rows = import_service.strip_result_columns(
+                *inputs.enter_context(read_rows(args.input, args.chunk_size))
+            )
+            columns = import_service.map_columns(header)
+        except Exception as e:
+            logger.error(f"✗ {e}")
+            return 1
+
+        totals = {"rows": 0, "batch_seconds": 0.0, "scalar_seconds": 0.0, "verified": 0}
+        mismatches: list[dict] = []
+
+        def collect(reports: Iterable[dict]) -> Iterator[list]:
+            for report in reports:
+                totals["rows"] += len(report["rows"])
+                totals["batch_seconds"] += report["batch_seconds"]
+                totals["scalar_seconds"] += report.get("scalar_seconds", 0.0)
+                totals["verified"] += report.get("verified", 0)
+                mismatches.extend(report.get("mismatches", ()))
+                yield from report["rows"]
+
+        chunks = import_service.iter_chunks(rows, args.chunk_size)
+        started = time.perf_counter()
+        if args.workers <= 1:
+            _init_worker(calc, columns, args.verify)
+            write_rows(
+                args.output, header, collect(map(_quote_chunk_in_worker, chunks))
+            )
+        else:
+            with ProcessPoolExecutor(
+                max_workers=args.workers,
+                initializer=_init_worker,
+                initargs=(calc, columns, args.verify),
+            ) as pool:
+                reports = _imap_ordered(
+                    pool, _quote_chunk_in_worker, chunks, window=args.workers * 2
+                )
+                write_rows(args.output, header, collect(reports))
+        elapsed = time.perf_counter() - started
+
+    logger.info(
+        f"✓ 已写出 {totals['rows']} 行到 {args.output}，耗时 {elapsed:.2f}s，"
+        f"吞吐 {totals['rows'] / elapsed if elapsed else 0:,.0f} 行/秒（{args.workers} 个进程）"
+    )
+    if not args.verify:
+        return 0
+
+    batch_rate = (
+        totals["verified"] / totals["batch_seconds"] if totals["batch_seconds"] else 0
+    )
+    scalar_rate = (
+        totals["verified"] / totals["scalar_seconds"] if totals["scalar_seconds"] else 0
+    )
+    logger.info(
+        f"核对 {totals['verified']} 行：向量化（含逐行参数校验）{batch_rate:,.0f} 行/秒，"
+        f"逐条计算 {scalar_rate:,.0f} 行/秒（单进程 CPU 时间口径）"
+    )
+    if mismatches:
+        logger.error(f"✗ {len(mismatches)} 行结果不一致")
+        for mismatch in mismatches[:_MAX_REPORTED_MISMATCHES]:
+            logger.error(
+                f"  {mismatch['row']}: 向量化 {mismatch['batch']}，逐条 {mismatch['scalar']}"
+            )
+        return 1
+    logger.info("✓ 向量化与逐条计算结果完全一致")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+auto 抠图基准测试：逐张比较 opencv、rembg 与 auto 的 CPU 时间和面积比例，统计 auto 节省的 CPU
+
+CPU 时间按 time.process_time 统计（包含 rembg 推理线程），rembg 模型 session 在计时前预先加载。
+rembg 不可用（未安装或模型未下载）时只统计 auto 的可信度与选择结果。
+
+使用方法：
+    python scripts/benchmark_auto_segmentation.py
+    python scripts/benchmark_auto_segmentation.py photos/ --threshold 0.8
+    python scripts/benchmark_auto_segmentation.py photos/ --skip-rembg   # 只看 auto 会选择哪条路径
+"""
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLES_DIR = Path(__file__).resolve().parents[1] / "samples"
+
+
+def _timed(fn, *args, **kwargs) -> tuple[object, float]:
+    started = time.process_time()
+    result = fn(*args, **kwargs)
+    return result, time.process_time() - started
+
+
+def _load_rembg() -> bool:
+    from scripts.background_remover import get_rembg_session
+
+    try:
+        session = get_rembg_session()
+    except Exception as e:
+        logger.warning(f"rembg 不可用，跳过 rembg 计时: {e}")
+        return False
+    if session is None:
+        logger.warning("rembg 模型加载失败，跳过 rembg 计时")
+    return session is not None
+
+
+def benchmark_image(path: Path, remover, threshold: float, with_rembg: bool) -> dict:
+    """单张图片：auto 的可信度与选择，以及三种方法的 CPU 时间与面积比例"""
+    import cv2
+    import numpy as np
+
+    from app.services.image_analysis_service import analyze_image, choose_method
+
+    data = path.read_bytes()
+    image_bgr = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image_bgr is None:
+        raise ValueError("无法读取图片内容")
+
+    used, quality = choose_method(image_bgr, remover, threshold=threshold)
+    row = {"path": path, "used": used, "score": quality["score"]}
+    for method in ("opencv", "rembg") if with_rembg else ("opencv",):
+        result, row[f"{method}_cpu"] = _timed(
+            analyze_image, image_bgr, data, method, remover
+        )
+        row[f"{method}_ratio"] = result["area_ratio"]
+    # auto = 评估 + 所选方法的分析；auto 选用 opencv 时按边缘规则取前景，需单独运行
+    if used == "opencv" or with_rembg:
+        result, row["auto_cpu"] = _timed(
+            analyze_image, image_bgr, data, "auto", remover, threshold=threshold
+        )
+        row["auto_ratio"] = result["area_ratio"]
+    return row
+
+
+def main() -> int:
+    from app.services.image_analysis_service import AUTO_CONFIDENCE_THRESHOLD
+
+    parser = argparse.ArgumentParser(description="auto 抠图基准测试")
+    parser.add_argument(
+        "directory",
+        nargs="?",
+        default=str(DEFAULT_SAMPLES_DIR),
+        help="图片目录（递归查找），默认 samples/",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=AUTO_CONFIDENCE_THRESHOLD,
+        help=f"opencv 可信度阈值，低于该值改用 rembg（默认 {AUTO_CONFIDENCE_THRESHOLD}）",
+    )
+    parser.add_argument(
+        "--skip-rembg", action="store_true", help="不运行 rembg，只统计 auto 的选择结果"
+    )
+    args = parser.parse_args()
+
+    from app.services.image_analysis_service import get_background_remover
+    from scripts.batch_analyze import iter_images
+
+    root = Path(args.directory)
+    if not root.is_dir():
+        logger.error(f"✗ 目录不存在: {root}")
+        return 1
+    paths = list(iter_images(root))
+    if not paths:
+        logger.error(f"✗ 目录中没有图片: {root}")
+        return 1
+
+    with_rembg = not args.skip_rembg and _load_rembg()
+    remover = get_background_remover("opencv")
+    rows = []
+    for path in paths:
+        try:
+            row = benchmark_image(path, remover, args.threshold, with_rembg)
+        except Exception as e:
+            logger.warning(f"✗ {path}: {e}")
+            continue
+        rows.append(row)
+        line = (
+            f"{path.name}: 可信度 {row['score']:.3f} -> {row['used']}，"
+            f"opencv {row['opencv_cpu']:.2f}s（面积 {row['opencv_ratio']:.4f}）"
+        )
+        if with_rembg:
+            line += (
+                f"，rembg {row['rembg_cpu']:.2f}s（面积 {row['rembg_ratio']:.4f}），"
+                f"auto {row['auto_cpu']:.2f}s"
+            )
+        logger.info(line)
+    if not rows:
+        logger.error("✗ 没有分析成功的图片")
+        return 1
+
+    escalated = sum(row["used"] == "rembg" for row in rows)
+    logger.info(
+        f"共 {len(rows)} 张（阈值 {args.threshold}）：opencv {len(rows) - escalated} 张，"
+        f"改用 rembg {escalated} 张"
+    )
+    if not with_rembg:
+        logger.info("未运行 rembg，无法统计节省的 CPU 时间")
+        return 0
+
+    rembg_total = sum(row["rembg_cpu"] for row in rows)
+    auto_total = sum(row["auto_cpu"] for row in rows)
+    saved = rembg_total - auto_total
+    logger.info(
+        f"CPU 时间：全部 rembg {rembg_total:.2f}s，auto {auto_total:.2f}s，"
+        f"节省 {saved:.2f}s（{saved / rembg_total if rembg_total else 0:.1%}）"
+    )
+    deviation = [abs(row["auto_ratio"] - row["rembg_ratio"]) for row in rows]
+    logger.info(
+        f"auto 与 rembg 面积比例偏差：平均 {sum(deviation) / len(deviation):.4f}，"
+        f"最大 {max(deviation):.4f}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
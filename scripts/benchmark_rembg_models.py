@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+rembg 模型基准测试：逐个模型统计加载时间、单张抠图延迟、内存峰值（RSS）与相对 u2net 的 mask IoU
+
+每个模型在独立的子进程中加载和运行，内存峰值互不影响；延迟取每张图片多次运行的中位数
+（每个模型先预热一次）。未下载或未生成的模型会跳过。
+
+使用方法：
+    python scripts/benchmark_rembg_models.py
+    python scripts/benchmark_rembg_models.py photos/ --models u2net u2netp u2net_int8 --repeat 5
+    python scripts/benchmark_rembg_models.py --threads 1    # 单线程推理（对应多进程批量分析的场景）
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLES_DIR = Path(__file__).resolve().parents[1] / "samples"
+# IoU 的参照模型
+REFERENCE_MODEL = "u2net"
+
+
+def _peak_rss_mb() -> float:
+    import resource
+
+    # Linux 上 ru_maxrss 单位为 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_model(model: str, paths: list[str], repeat: int, threads: int) -> dict:
+    """在子进程中加载模型并逐张抠图，返回耗时、内存峰值与各图片的 mask"""
+    if threads:
+        # rembg 按 OMP_NUM_THREADS 设置 onnxruntime 的线程数
+        os.environ["OMP_NUM_THREADS"] = str(threads)
+    from scripts.background_remover import BackgroundRemover, load_rembg_session
+
+    baseline_rss = _peak_rss_mb()
+    started = time.perf_counter()
+    load_rembg_session(model)
+    load_seconds = time.perf_counter() - started
+
+    remover = BackgroundRemover(model)
+    images = [Path(path).read_bytes() for path in paths]
+    remover.rembg_mask_and_rgb(images[0])  # 预热
+    latencies, masks = [], []
+    for data in images:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            mask, _ = remover.rembg_mask_and_rgb(data)
+            timings.append(time.perf_counter() - started)
+        latencies.append(statistics.median(timings))
+        masks.append(mask)
+    return {
+        "load_seconds": load_seconds,
+        "latencies": latencies,
+        "model_rss_mb": _peak_rss_mb() - baseline_rss,
+        "peak_rss_mb": _peak_rss_mb(),
+        "masks": masks,
+    }
+
+
+def mask_iou(a, b) -> float:
+    import numpy as np
+
+    union = np.count_nonzero(a | b)
+    return 1.0 if union == 0 else np.count_nonzero(a & b) / union
+
+
+def main() -> int:
+    from scripts.background_remover import REMBG_MODELS
+
+    parser = argparse.ArgumentParser(description="rembg 模型基准测试")
+    parser.add_argument(
+        "directory",
+        nargs="?",
+        default=str(DEFAULT_SAMPLES_DIR),
+        help="图片目录（递归查找），默认 samples/",
+    )
+    parser.add_argument(
+        "--models",
+        nargs="+",
+        choices=list(REMBG_MODELS),
+        default=list(REMBG_MODELS),
+        help="参与测试的模型，默认全部",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="每张图片运行次数（取中位数）"
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=0,
+        help="onnxruntime 线程数，默认由 onnxruntime 决定",
+    )
+    args = parser.parse_args()
+
+    from scripts.batch_analyze import iter_images
+
+    root = Path(args.directory)
+    if not root.is_dir():
+        logger.error(f"✗ 目录不存在: {root}")
+        return 1
+    paths = [str(path) for path in iter_images(root)]
+    if not paths:
+        logger.error(f"✗ 目录中没有图片: {root}")
+        return 1
+
+    models = list(dict.fromkeys([REFERENCE_MODEL, *args.models]))
+    results = {}
+    for model in models:
+        # 每个模型一个全新的子进程（spawn），内存峰值只包含该模型
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            try:
+                results[model] = pool.submit(
+                    _run_model, model, paths, args.repeat, args.threads
+                ).result()
+            except Exception as e:
+                logger.warning(f"✗ {model} 无法运行，跳过: {e}")
+    if not results:
+        logger.error(
+            "✗ 没有可运行的模型（请先下载模型，见 scripts/download_model_to_repo.py）"
+        )
+        return 1
+
+    reference = results.get(REFERENCE_MODEL)
+    if reference is None:
+        logger.warning(f"{REFERENCE_MODEL} 无法运行，不计算 IoU 与相对吞吐量")
+    logger.info(f"共 {len(paths)} 张图片，每张运行 {args.repeat} 次取中位数")
+    for model in models:
+        if model not in results or model not in args.models:
+            continue
+        result = results[model]
+        latency = statistics.mean(result["latencies"])
+        line = (
+            f"{model}: 加载 {result['load_seconds']:.2f}s，"
+            f"延迟 {latency * 1000:.0f} ms/张（{1 / latency:.2f} 张/秒），"
+            f"模型内存 {result['model_rss_mb']:.0f} MB（峰值 RSS {result['peak_rss_mb']:.0f} MB）"
+        )
+        if reference is not None:
+            speedup = statistics.mean(reference["latencies"]) / latency
+            ious = [
+                mask_iou(mask > 0, ref > 0)
+                for mask, ref in zip(result["masks"], reference["masks"])
+            ]
+            line += (
+                f"，吞吐量 {speedup:.2f}x，IoU 平均 {statistics.mean(ious):.4f} "
+                f"最低 {min(ious):.4f}"
+            )
+        logger.info(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -142,6 +142,27 @@ def _cluster_lab_pixels(
 ):
     if pixels_lab is None or len(pixels_lab) == 0:
         return 0, [], []
+    kmeans = _fit_kmeans_elbow(pixels_lab, k_range)
+    # 过滤并转回RGB
+    total_pixels = len(kmeans.labels_)
+    counts = np.bincount(kmeans.labels_)
+    filtered_colors_lab = []
+    filtered_percentages = []
+    for i, count in enumerate(counts):
+        percentage = (count / total_pixels) * 100
+        if percentage >= min_percentage:
+            filtered_colors_lab.append(kmeans.cluster_centers_[i])
+            filtered_percentages.append(percentage)
+    if not filtered_colors_lab:
+        return 0, [], []
+    lab_array = np.uint8(np.array(filtered_colors_lab).reshape(1, -1, 3))
+    rgb_array = cv2.cvtColor(lab_array, cv2.COLOR_LAB2RGB).reshape(-1, 3)
+    filtered_colors_rgb = [tuple(color) for color in rgb_array]
+    return len(filtered_colors_rgb), filtered_colors_rgb, filtered_percentages
+
+
+def _fit_kmeans_elbow(pixels_lab: np.ndarray, k_range=(2, 10)) -> KMeans:
+    """肘部法选 K（采样），再对全部像素聚类"""
     # 肘部法
     if len(pixels_lab) > 20000:
         pixels_sample = pixels_lab[
@@ -162,22 +183,50 @@ def _cluster_lab_pixels(
     # 全量聚类
     kmeans = KMeans(n_clusters=best_k, random_state=42, n_init="auto")
     kmeans.fit(pixels_lab)
-    # 过滤并转回RGB
-    total_pixels = len(kmeans.labels_)
-    counts = np.bincount(kmeans.labels_)
-    filtered_colors_lab = []
-    filtered_percentages = []
-    for i, count in enumerate(counts):
-        percentage = (count / total_pixels) * 100
-        if percentage >= min_percentage:
-            filtered_colors_lab.append(kmeans.cluster_centers_[i])
-            filtered_percentages.append(percentage)
-    if not filtered_colors_lab:
-        return 0, [], []
-    lab_array = np.uint8(np.array(filtered_colors_lab).reshape(1, -1, 3))
-    rgb_array = cv2.cvtColor(lab_array, cv2.COLOR_LAB2RGB).reshape(-1, 3)
-    filtered_colors_rgb = [tuple(color) for color in rgb_array]
-    return len(filtered_colors_rgb), filtered_colors_rgb, filtered_percentages
+    return kmeans
+
+
+def count_part_colors_from_labels(
+    labels: np.ndarray,
+    num_parts: int,
+    rgb: np.ndarray,
+    k_range=(2, 10),
+    min_percentage: float = 5.0,
+):
+    """多零件图的颜色统计：全部零件像素只聚类一次，再按零件 bincount 统计各自的颜色占比。
+
+    :param labels: 与 rgb 同尺寸的零件编号图，0 为背景，1..num_parts 为零件
+    :return: 每个零件一组 (颜色数, RGB颜色列表, 占比列表)，顺序与零件编号一致
+    """
+    fg = labels > 0
+    if num_parts == 0 or not np.any(fg):
+        return [(0, [], []) for _ in range(num_parts)]
+    part_of_pixel = labels[fg].astype(np.intp) - 1
+    sel_bgr = rgb[fg][:, ::-1]
+    pixels_lab = cv2.cvtColor(sel_bgr.reshape(1, -1, 3), cv2.COLOR_BGR2Lab).reshape(
+        -1, 3
+    )
+    kmeans = _fit_kmeans_elbow(pixels_lab, k_range=k_range)
+    k = kmeans.n_clusters
+    # 按 (零件, 颜色簇) 一次计数
+    counts = np.bincount(
+        part_of_pixel * k + kmeans.labels_, minlength=num_parts * k
+    ).reshape(num_parts, k)
+    totals = counts.sum(axis=1, keepdims=True)
+    percentages = counts / np.maximum(totals, 1) * 100
+    lab_array = np.uint8(kmeans.cluster_centers_.reshape(1, -1, 3))
+    centers_rgb = cv2.cvtColor(lab_array, cv2.COLOR_LAB2RGB).reshape(-1, 3)
+    results = []
+    for row in percentages:
+        keep = np.flatnonzero(row >= min_percentage)
+        results.append(
+            (
+                len(keep),
+                [tuple(centers_rgb[i]) for i in keep],
+                [float(row[i]) for i in keep],
+            )
+        )
+    return results
 
 
 def count_product_colors_from_bgr(
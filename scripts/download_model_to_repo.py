@@ -1,16 +1,27 @@
 #!/usr/bin/env python3
 """
 下载 rembg 模型文件到本地 models 目录
+
+使用方法：
+    python scripts/download_model_to_repo.py                  # 部署配置 REMBG_MODEL 指定的模型（默认 u2net）
+    python scripts/download_model_to_repo.py --model silueta
+    python scripts/download_model_to_repo.py --model all      # 所有可下载的模型
 """
+import argparse
 import logging
 import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def download_model_to_repo():
+def download_model_to_repo(model: str = "u2net"):
     """下载模型到仓库的 models 目录"""
+    from scripts.background_remover import REMBG_MODELS
+
+    spec = REMBG_MODELS[model]
     try:
         # 获取项目根目录
         repo_root = Path(__file__).resolve().parents[1]
@@ -28,11 +39,11 @@ def download_model_to_repo():
         logger.info(f"设置 U2NET_HOME={models_dir}")
         
         # 下载模型（会保存到指定目录）
-        logger.info("正在下载 u2net 模型（可能需要几分钟）...")
-        session = new_session("u2net")
+        logger.info(f"正在下载 {model} 模型（可能需要几分钟）...")
+        session = new_session(spec["session"])
         
         # 验证文件是否下载成功
-        model_file = models_dir / "u2net.onnx"
+        model_file = models_dir / spec["file"]
         if model_file.exists():
             file_size = model_file.stat().st_size / (1024 * 1024)  # MB
             logger.info(f"✓ 模型下载成功！")
@@ -53,11 +64,40 @@ def download_model_to_repo():
             logger.error("1. 检查网络连接")
             logger.error("2. 使用代理：export HTTP_PROXY=...")
             logger.error("3. 手动下载：")
-            logger.error(f"   curl -L https://github.com/danielgatis/rembg/releases/download/v0.0.0/u2net.onnx -o {models_dir}/u2net.onnx")
+            logger.error(f"   curl -L https://github.com/danielgatis/rembg/releases/download/v0.0.0/{spec['file']} -o {models_dir}/{spec['file']}")
         
         return False
 
+def main() -> int:
+    from scripts.background_remover import REMBG_MODELS, resolve_rembg_model
+
+    parser = argparse.ArgumentParser(description="下载 rembg 模型到 models 目录")
+    parser.add_argument(
+        "--model",
+        default=None,
+        help=f"模型名称（{'、'.join(REMBG_MODELS)}）或 all，默认为部署配置 REMBG_MODEL",
+    )
+    args = parser.parse_args()
+
+    if args.model == "all":
+        models = [m for m, spec in REMBG_MODELS.items() if not spec.get("offline")]
+    else:
+        try:
+            models = [resolve_rembg_model(args.model)]
+        except ValueError as e:
+            logger.error(f"✗ {e}")
+            return 1
+    ok = True
+    for model in models:
+        if REMBG_MODELS[model].get("offline"):
+            # 量化模型无法下载，需由 models/u2net.onnx 离线生成
+            logger.error(f"✗ {model} 不能下载，请运行 python scripts/quantize_rembg_model.py 生成")
+            ok = False
+            continue
+        ok = download_model_to_repo(model) and ok
+    return 0 if ok else 1
+
+
 if __name__ == "__main__":
-    success = download_model_to_repo()
-    sys.exit(0 if success else 1)
+    sys.exit(main())
 
@@ -4,17 +4,24 @@
 解决首次使用时网络超时问题
 
 使用方法：
-    python scripts/preload_rembg_model.py
+    python scripts/preload_rembg_model.py                  # 部署配置 REMBG_MODEL 指定的模型（默认 u2net）
+    python scripts/preload_rembg_model.py --model u2netp
+    python scripts/preload_rembg_model.py --model all      # 所有可下载的模型
 """
+import argparse
 import logging
 import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def preload_rembg_model():
+def preload_rembg_model(model: str = "u2net"):
     """预下载 rembg 模型"""
+    from scripts.background_remover import REMBG_MODELS
+
     try:
         logger.info("开始预下载 rembg 模型...")
         from rembg import new_session
@@ -24,8 +31,8 @@ def preload_rembg_model():
         os.environ.setdefault('REQUESTS_TIMEOUT', '300')
         
         # 创建 session 会触发模型下载
-        logger.info("正在下载 u2net 模型（可能需要几分钟）...")
-        session = new_session("u2net")
+        logger.info(f"正在下载 {model} 模型（可能需要几分钟）...")
+        session = new_session(REMBG_MODELS[model]["session"])
         logger.info("✓ rembg 模型下载成功！")
         logger.info(f"模型位置: {Path.home() / '.u2net'}")
         return True
@@ -37,12 +44,41 @@ def preload_rembg_model():
             logger.error("")
             logger.error("网络连接失败。建议：")
             logger.error("1. 检查网络连接或使用代理")
-            logger.error("2. 手动下载模型文件到 ~/.u2net/u2net.onnx")
+            logger.error(f"2. 手动下载模型文件到 ~/.u2net/{REMBG_MODELS[model]['file']}")
             logger.error("3. 或使用 opencv 方法（不需要下载模型）")
         
         return False
 
+def main() -> int:
+    from scripts.background_remover import REMBG_MODELS, resolve_rembg_model
+
+    parser = argparse.ArgumentParser(description="预下载 rembg 模型")
+    parser.add_argument(
+        "--model",
+        default=None,
+        help=f"模型名称（{'、'.join(REMBG_MODELS)}）或 all，默认为部署配置 REMBG_MODEL",
+    )
+    args = parser.parse_args()
+
+    if args.model == "all":
+        models = [m for m, spec in REMBG_MODELS.items() if not spec.get("offline")]
+    else:
+        try:
+            models = [resolve_rembg_model(args.model)]
+        except ValueError as e:
+            logger.error(f"✗ {e}")
+            return 1
+    ok = True
+    for model in models:
+        if REMBG_MODELS[model].get("offline"):
+            # 量化模型无法下载，需由 models/u2net.onnx 离线生成
+            logger.error(f"✗ {model} 不能下载，请运行 python scripts/quantize_rembg_model.py 生成")
+            ok = False
+            continue
+        ok = preload_rembg_model(model) and ok
+    return 0 if ok else 1
+
+
 if __name__ == "__main__":
-    success = preload_rembg_model()
-    sys.exit(0 if success else 1)
+    sys.exit(main())
 
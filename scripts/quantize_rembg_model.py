@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+离线量化 rembg 模型：由 models/u2net.onnx 生成 int8 模型 models/u2net_int8.onnx
+
+默认静态量化（QDQ，按通道量化卷积权重），用图片目录做激活值校准；卷积网络静态量化后
+才能用上 int8 卷积核，动态量化（--dynamic）只量化权重，生成快但推理提速有限。
+需要 onnx（已列入 requirements.txt）
+
+使用方法：
+    python scripts/download_model_to_repo.py --model u2net    # 先准备 models/u2net.onnx
+    python scripts/quantize_rembg_model.py                    # 用 samples/ 校准
+    python scripts/quantize_rembg_model.py --calibration photos/ --max-images 200
+    python scripts/quantize_rembg_model.py --dynamic
+"""
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+_REPO_ROOT = Path(__file__).resolve().parents[1]
+# u2net 的输入尺寸与归一化参数（与 rembg 的 u2net session 一致）
+_INPUT_SIZE = (320, 320)
+_MEAN = (0.485, 0.456, 0.406)
+_STD = (0.229, 0.224, 0.225)
+
+
+def preprocess(path: Path):
+    """按 rembg u2net session 的方式把图片转成模型输入 (1, 3, 320, 320)"""
+    import numpy as np
+    from PIL import Image
+
+    image = (
+        Image.open(path).convert("RGB").resize(_INPUT_SIZE, Image.Resampling.LANCZOS)
+    )
+    array = np.array(image, dtype=np.float32)
+    array /= max(float(array.max()), 1e-6)
+    array = (array - np.array(_MEAN, dtype=np.float32)) / np.array(
+        _STD, dtype=np.float32
+    )
+    return array.transpose(2, 0, 1)[np.newaxis].astype(np.float32)
+
+
+def _calibration_reader(model_path: Path, images: list[Path]):
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationDataReader
+
+    input_name = (
+        ort.InferenceSession(str(model_path), providers=["CPUExecutionProvider"])
+        .get_inputs()[0]
+        .name
+    )
+
+    class ImageReader(CalibrationDataReader):
+        def __init__(self):
+            self._images = iter(images)
+
+        def get_next(self):
+            path = next(self._images, None)
+            return None if path is None else {input_name: preprocess(path)}
+
+    return ImageReader()
+
+
+def main() -> int:
+    from scripts.background_remover import REMBG_MODELS
+
+    models_dir = _REPO_ROOT / "models"
+    parser = argparse.ArgumentParser(description="离线量化 rembg u2net 模型为 int8")
+    parser.add_argument(
+        "--input",
+        default=str(models_dir / REMBG_MODELS["u2net"]["file"]),
+        help="原始模型",
+    )
+    parser.add_argument(
+        "--output",
+        default=str(models_dir / REMBG_MODELS["u2net_int8"]["file"]),
+        help="量化后的模型（默认即 u2net_int8 的加载路径）",
+    )
+    parser.add_argument(
+        "--calibration",
+        default=str(_REPO_ROOT / "samples"),
+        help="校准图片目录（递归查找），默认 samples/；应尽量接近实际产品图",
+    )
+    parser.add_argument(
+        "--max-images", type=int, default=100, help="最多使用的校准图片数"
+    )
+    parser.add_argument(
+        "--dynamic", action="store_true", help="动态量化（只量化权重，不需要校准图片）"
+    )
+    args = parser.parse_args()
+
+    source, target = Path(args.input), Path(args.output)
+    if not source.exists():
+        logger.error(
+            f"✗ 模型不存在: {source}，请先运行 python scripts/download_model_to_repo.py"
+        )
+        return 1
+    try:
+        from onnxruntime.quantization import (
+            QuantFormat,
+            QuantType,
+            quantize_dynamic,
+            quantize_static,
+        )
+    except ImportError as e:
+        logger.error(f"✗ 量化需要安装 onnx: pip install onnx（{e}）")
+        return 1
+
+    started = time.perf_counter()
+    if args.dynamic:
+        quantize_dynamic(str(source), str(target), weight_type=QuantType.QUInt8)
+    else:
+        from scripts.batch_analyze import iter_images
+
+        images = list(iter_images(Path(args.calibration)))[: args.max_images]
+        if not images:
+            logger.error(f"✗ 校准目录中没有图片: {args.calibration}")
+            return 1
+        logger.info(f"使用 {len(images)} 张图片校准激活值范围...")
+        quantize_static(
+            str(source),
+            str(target),
+            _calibration_reader(source, images),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+        )
+    elapsed = time.perf_counter() - started
+
+    logger.info(
+        f"✓ 已生成 {target}（{target.stat().st_size / 1024 / 1024:.1f} MB，"
+        f"原模型 {source.stat().st_size / 1024 / 1024:.1f} MB），耗时 {elapsed:.1f}s"
+    )
+    logger.info(
+        "使用：REMBG_MODEL=u2net_int8，或在分析请求中指定 rembg_model=u2net_int8"
+    )
+    logger.info(
+        "建议运行 python scripts/benchmark_rembg_models.py 核对与 u2net 的一致性（IoU）"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+从原始报价历史全量重算日汇总表（quotation_history_daily_stats）
+
+使用方法：
+    python scripts/rebuild_history_stats.py            # 重算全部用户
+    python scripts/rebuild_history_stats.py --user-id 3
+"""
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="重算报价历史日汇总")
+    parser.add_argument("--user-id", type=int, default=None, help="仅重算指定用户")
+    args = parser.parse_args()
+
+    from app.db import crud
+    from app.db.session import SessionLocal, init_db
+
+    init_db()
+    db = SessionLocal()
+    try:
+        count = crud.rebuild_history_stats(db, user_id=args.user_id)
+        logger.info(f"✓ 重算完成，共 {count} 条汇总记录")
+        return 0
+    except Exception as e:
+        logger.error(f"✗ 重算失败: {e}")
+        return 1
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,589 @@
+"""Tests for quotation history queries."""
+
+import json
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.db import crud
+from app.db.models import QuotationHistory
+
+
+def _make_user(db: Session):
+    return crud.create_user(
+        db, username=f"hist_{uuid.uuid4().hex[:8]}", password_hash="x"
+    )
+
+
+def _make_histories(db: Session, user_id: int, count: int) -> list[QuotationHistory]:
+    base = datetime(2024, 1, 1)
+    histories = []
+    for i in range(count):
+        history = QuotationHistory(
+            user_id=user_id,
+            request_payload={"order_quantity": 100 + i},
+            result_payload={"产品单价": 1.0 + i},
+            worker_type="standard",
+            unit_price=1.0 + i,
+            total_price=100.0 + i,
+            # 每两条共享同一时间戳，覆盖 id 作为次级排序键的情况
+            computed_at=base + timedelta(minutes=i // 2),
+        )
+        db.add(history)
+        histories.append(history)
+    db.commit()
+    return histories
+
+
+class TestHistoryCursor:
+    """Test keyset pagination helpers."""
+
+    def test_cursor_roundtrip(self, test_db_session: Session):
+        user = _make_user(test_db_session)
+        history = _make_histories(test_db_session, user.id, 1)[0]
+        cursor = crud.encode_history_cursor(history)
+        assert crud.decode_history_cursor(cursor) == (history.computed_at, history.id)
+
+    def test_invalid_cursor(self):
+        with pytest.raises(ValueError):
+            crud.decode_history_cursor("not-a-cursor")
+
+    def test_pages_cover_all_rows_in_order(self, test_db_session: Session):
+        user = _make_user(test_db_session)
+        _make_histories(test_db_session, user.id, 7)
+        q = test_db_session.query(QuotationHistory).filter(
+            QuotationHistory.user_id == user.id
+        )
+
+        seen = []
+        cursor = None
+        while True:
+            rows, cursor = crud.get_history_page(q, limit=3, cursor=cursor)
+            seen.extend(rows)
+            if cursor is None:
+                break
+
+        keys = [(h.computed_at, h.id) for h in seen]
+        assert len(seen) == 7
+        assert keys == sorted(keys, reverse=True)
+        assert [h.id for h in crud.iter_histories(q, chunk_size=2)] == [
+            h.id for h in seen
+        ]
+
+
+class TestHistoryFavorites:
+    """Test batched favorite lookups."""
+
+    def test_favorited_ids_and_detail(self, test_db_session: Session):
+        user = _make_user(test_db_session)
+        histories = _make_histories(test_db_session, user.id, 3)
+        crud.create_favorite(test_db_session, user.id, histories[1].id)
+
+        ids = [h.id for h in histories]
+        assert crud.get_favorited_history_ids(test_db_session, user.id, ids) == {
+            histories[1].id
+        }
+        assert crud.get_favorited_history_ids(test_db_session, user.id, []) == set()
+
+        history, is_favorited = crud.get_history_with_favorite(
+            test_db_session, histories[1].id, user.id
+        )
+        assert history.id == histories[1].id and is_favorited
+        _, is_favorited = crud.get_history_with_favorite(
+            test_db_session, histories[0].id, user.id
+        )
+        assert not is_favorited
+        assert crud.get_history_with_favorite(
+            test_db_session, histories[0].id, user.id + 1000
+        ) == (None, False)
+
+
+class TestHistoryPromotedFields:
+    """Test promoted scalar columns on QuotationHistory."""
+
+    def test_create_history_fills_promoted_fields(self, test_db_session: Session):
+        user = _make_user(test_db_session)
+        history = crud.create_history(
+            test_db_session,
+            user_id=user.id,
+            request_payload={
+                "order_quantity": 5000,
+                "length": 3.0,
+                "width": 2.5,
+                "thickness": 0.4,
+                "color_count": 4,
+                "area_ratio": 0.8,
+            },
+            result_payload={},
+            worker_type="standard",
+            unit_price=0.5,
+            total_price=2500.0,
+        )
+        assert history.order_quantity == 5000
+        assert (history.length, history.width, history.color_count) == (3.0, 2.5, 4)
+
+    def test_backfill_promoted_fields(self, test_db_session: Session, test_engine):
+        from sqlalchemy import create_mock_engine
+
+        from app.db.migrations import backfill_history_promoted_fields
+
+        user = _make_user(test_db_session)
+        legacy, partial = _make_histories(test_db_session, user.id, 2)
+        assert legacy.order_quantity is None
+        # 升级前以 JSON 文本存储的快照
+        test_db_session.execute(
+            text("UPDATE quotation_history SET request_payload = :req WHERE id = :id"),
+            {"req": '{"order_quantity": 100, "length": 3.0}', "id": legacy.id},
+        )
+        # 已有提升列的记录不会被覆盖
+        partial.length = 9.0
+        test_db_session.commit()
+
+        assert backfill_history_promoted_fields(test_engine) >= 1
+        test_db_session.refresh(legacy)
+        test_db_session.refresh(partial)
+        assert (legacy.order_quantity, legacy.length, legacy.width) == (100, 3.0, None)
+        assert (partial.order_quantity, partial.length) == (None, 9.0)
+
+        # 其他数据库不执行 SQLite 专用的 JSON 函数
+        postgres = create_mock_engine("postgresql://", executor=None)
+        assert backfill_history_promoted_fields(postgres) == 0
+
+
+class TestHistoryBatchDelete:
+    """Test set-based batch deletion."""
+
+    def test_delete_histories(self, test_db_session: Session):
+        user = _make_user(test_db_session)
+        other = _make_user(test_db_session)
+        mine = _make_histories(test_db_session, user.id, 3)
+        theirs = _make_histories(test_db_session, other.id, 1)
+        crud.create_favorite(test_db_session, user.id, mine[0].id)
+
+        mine_ids = [h.id for h in mine]
+        their_id = theirs[0].id
+        ids = [mine_ids[0], their_id, mine_ids[1], 999999]
+        deleted, failed = crud.delete_histories(test_db_session, ids, user.id)
+
+        assert deleted == [mine_ids[0], mine_ids[1]]
+        assert failed == [their_id, 999999]
+        assert crud.get_history_by_id(test_db_session, mine_ids[2], user.id)
+        assert crud.get_history_by_id(test_db_session, their_id, other.id)
+        assert (
+            crud.get_favorited_history_ids(test_db_session, user.id, [mine_ids[0]])
+            == set()
+        )
+
+
+class TestHistoryStats:
+    """Test incremental daily rollups."""
+
+    def test_rollups_track_inserts_and_deletes(self, test_db_session: Session):
+        user = _make_user(test_db_session)
+        ids = []
+        for worker_type, colors, price in [
+            ("standard", 2, 1.0),
+            ("standard", 3, 2.0),
+            ("skilled", 2, 3.0),
+        ]:
+            history = crud.create_history(
+                test_db_session,
+                user_id=user.id,
+                request_payload={"order_quantity": 10, "color_count": colors},
+                result_payload={},
+                worker_type=worker_type,
+                unit_price=price,
+                total_price=price * 10,
+            )
+            ids.append(history.id)
+
+        by_worker = crud.get_history_stats(test_db_session, user.id, "worker_type")
+        assert [(s["key"], s["quote_count"]) for s in by_worker] == [
+            ("skilled", 1),
+            ("standard", 2),
+        ]
+        by_colors = crud.get_history_stats(test_db_session, user.id, "color_count")
+        assert [(s["key"], s["avg_unit_price"]) for s in by_colors] == [
+            (2, 2.0),
+            (3, 2.0),
+        ]
+
+        crud.delete_history(test_db_session, ids[0], user.id)
+        crud.delete_histories(test_db_session, [ids[1]], user.id)
+        (day,) = crud.get_history_stats(test_db_session, user.id, "day")
+        assert (day["quote_count"], day["total_revenue"]) == (1, 30.0)
+
+    def test_rebuild_matches_incremental(self, test_db_session: Session):
+        user = _make_user(test_db_session)
+        _make_histories(test_db_session, user.id, 4)  # 直接插入，不经过汇总维护
+        assert crud.get_history_stats(test_db_session, user.id) == []
+
+        assert crud.rebuild_history_stats(test_db_session, user_id=user.id) == 1
+        (day,) = crud.get_history_stats(test_db_session, user.id)
+        assert day["key"].isoformat() == "2024-01-01"
+        assert day["quote_count"] == 4
+        assert day["total_revenue"] == 100.0 + 101.0 + 102.0 + 103.0
+
+
+class TestHistoryArchive:
+    """Test cold-history archival."""
+
+    def test_archive_moves_cold_rows(self, test_db_session: Session):
+        user = _make_user(test_db_session)
+        histories = _make_histories(test_db_session, user.id, 4)
+        ids = [h.id for h in histories]
+        crud.create_favorite(test_db_session, user.id, ids[1])
+
+        assert crud.archive_histories(test_db_session, datetime(2030, 1, 1)) >= 3
+        # 收藏记录留在热表
+        assert crud.get_history_by_id(test_db_session, ids[1], user.id)
+        assert crud.get_history_by_id(test_db_session, ids[0], user.id) is None
+        assert crud.get_history_by_id(test_db_session, ids[3], user.id) is None
+
+        archived = crud.get_archived_history(test_db_session, ids[0], user.id)
+        assert archived.request_payload == {"order_quantity": 100}
+        assert archived.result_payload == {"产品单价": 1.0}
+        assert (
+            crud.get_archived_history(test_db_session, ids[0], user.id + 1000) is None
+        )
+
+        # 热表 + 归档表合并重算后汇总不变
+        crud.rebuild_history_stats(test_db_session, user_id=user.id)
+        (day,) = crud.get_history_stats(test_db_session, user.id)
+        assert day["quote_count"] == 4
+
+    def test_new_history_ids_skip_archived(self, test_db_session: Session):
+        user = _make_user(test_db_session)
+        histories = _make_histories(test_db_session, user.id, 3)
+        ids = [h.id for h in histories]
+        max_id = ids[-1]
+        crud.archive_histories(test_db_session, datetime(2030, 1, 1))
+        # 删除同样作用于归档记录
+        assert crud.delete_history(test_db_session, max_id, user.id)
+        assert crud.get_archived_history(test_db_session, max_id, user.id) is None
+        deleted, failed = crud.delete_histories(
+            test_db_session, [ids[0], max_id], user.id
+        )
+        assert (deleted, failed) == ([ids[0]], [max_id])
+        assert crud.get_history_stats(test_db_session, user.id) == []
+
+        history = crud.create_history(
+            test_db_session,
+            user_id=user.id,
+            request_payload={},
+            result_payload={},
+            worker_type="standard",
+            unit_price=1.0,
+            total_price=1.0,
+        )
+        assert history.id > max_id
+        assert crud.get_archived_history(test_db_session, history.id, user.id) is None
+
+    def test_migrate_legacy_table_to_autoincrement(self, tmp_path):
+        from sqlalchemy import create_engine
+        from sqlalchemy.schema import CreateTable
+
+        from app.db.migrations import ensure_history_autoincrement
+        from app.db.models import Base, QuotationHistoryArchive
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+        legacy_ddl = str(CreateTable(QuotationHistory.__table__).compile(engine))
+        with engine.begin() as conn:
+            conn.exec_driver_sql(legacy_ddl.replace(" AUTOINCREMENT", ""))
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(
+                QuotationHistoryArchive.__table__.insert(),
+                {
+                    "id": 50,
+                    "user_id": 1,
+                    "payload_gz": b"",
+                    "worker_type": "standard",
+                    "unit_price": 1.0,
+                    "total_price": 1.0,
+                    "computed_at": datetime(2024, 1, 1),
+                },
+            )
+
+        assert ensure_history_autoincrement(engine)
+        assert not ensure_history_autoincrement(engine)
+        with engine.begin() as conn:
+            new_id = conn.execute(
+                QuotationHistory.__table__.insert(),
+                {
+                    "user_id": 1,
+                    "request_payload": {},
+                    "result_payload": {},
+                    "worker_type": "standard",
+                    "unit_price": 1.0,
+                    "total_price": 1.0,
+                },
+            ).inserted_primary_key[0]
+        assert new_id == 51
+
+
+class TestHistoryExport:
+    """Test streamed CSV/Excel export over the hot and archive tables."""
+
+    @pytest.fixture
+    def closed_sessions(self, test_engine, monkeypatch):
+        """导出使用的独立会话改绑测试库，返回已关闭的会话列表"""
+        from sqlalchemy.orm import sessionmaker
+
+        from app.api.routers import history as history_router
+
+        closed = []
+
+        class TrackedSession(Session):
+            def close(self):
+                closed.append(self)
+                super().close()
+
+        monkeypatch.setattr(
+            history_router,
+            "SessionLocal",
+            sessionmaker(bind=test_engine, class_=TrackedSession),
+        )
+        monkeypatch.setattr(history_router, "_EXPORT_CHUNK_SIZE", 2)
+        return closed
+
+    def _filters(self):
+        from app.api.routers.history import HistoryFilterParams
+
+        return HistoryFilterParams(
+            **dict.fromkeys(
+                (
+                    "from_dt",
+                    "to_dt",
+                    "worker_type",
+                    "min_unit",
+                    "max_unit",
+                    "color_count",
+                    "min_length",
+                    "max_length",
+                    "min_width",
+                    "max_width",
+                )
+            )
+        )
+
+    def test_export_hot_then_archived_rows(
+        self, test_db_session: Session, closed_sessions
+    ):
+        import csv
+        import io
+
+        from openpyxl import load_workbook
+
+        from app.api.routers import history as history_router
+
+        user = _make_user(test_db_session)
+        ids = [h.id for h in _make_histories(test_db_session, user.id, 5)]
+        # 收藏的记录留在热表，其余归档
+        crud.create_favorite(test_db_session, user.id, ids[1])
+        crud.create_favorite(test_db_session, user.id, ids[4])
+        crud.archive_histories(test_db_session, datetime(2030, 1, 1))
+        # 热表在前、归档表在后，各自按时间倒序（单价 1.0 + i 标识第 i 条）
+        expected = [5.0, 2.0, 4.0, 3.0, 1.0]
+
+        fields = ("worker_type", "unit_price", "order_quantity", "total_price")
+        rows = history_router._iter_export_rows(user.id, self._filters(), fields)
+        body = "".join(history_router._iter_csv(rows))
+        lines = list(csv.reader(io.StringIO(body)))
+        assert [float(line[2]) for line in lines[1:]] == expected
+        assert len(closed_sessions) == 1
+
+        fields = (*fields, "length", "width", "thickness", "color_count", "area_ratio")
+        rows = history_router._iter_export_rows(user.id, self._filters(), fields)
+        data = b"".join(history_router._iter_excel(rows))
+        ws = load_workbook(io.BytesIO(data), read_only=True).active
+        values = list(ws.iter_rows(min_row=2, values_only=True))
+        assert [row[2] for row in values] == expected
+        assert len(closed_sessions) == 2
+
+    def test_export_session_closed_on_abort(
+        self, test_db_session: Session, closed_sessions
+    ):
+        from app.api.routers import history as history_router
+
+        user = _make_user(test_db_session)
+        _make_histories(test_db_session, user.id, 3)
+        rows = history_router._iter_export_rows(
+            user.id, self._filters(), ("unit_price",)
+        )
+        next(rows)
+        assert closed_sessions == []
+        # 客户端中止时生成器被关闭，会话随之关闭
+        rows.close()
+        assert len(closed_sessions) == 1
+
+
+class TestHistoryPayloadCodec:
+    """Test compact payload storage."""
+
+    def test_codec_roundtrip(self):
+        from app.db.types import decode_payload, encode_payload
+
+        payload = {
+            "产品单价": 0.12,
+            "settings_snapshot": {"worker_profiles": [{"name": "standard"}]},
+            "~custom": [1, {"未登记键": None}],
+        }
+        encoded = encode_payload(payload)
+        assert decode_payload(encoded) == payload
+        assert len(encoded) < len(json.dumps(payload, ensure_ascii=False).encode())
+        assert decode_payload('{"a": 1}') == {"a": 1}
+
+    def test_convert_legacy_json_rows(self, test_db_session: Session, test_engine):
+        from app.db.migrations import convert_history_payloads
+
+        user = _make_user(test_db_session)
+        history = _make_histories(test_db_session, user.id, 1)[0]
+        # 模拟升级前以 JSON 文本存储的快照
+        test_db_session.execute(
+            text(
+                "UPDATE quotation_history SET request_payload = :req, "
+                "result_payload = :res WHERE id = :id"
+            ),
+            {
+                "req": '{"order_quantity": 7}',
+                "res": '{"产品单价": 2.0}',
+                "id": history.id,
+            },
+        )
+        test_db_session.commit()
+        test_db_session.expire_all()
+        assert history.request_payload == {"order_quantity": 7}
+
+        assert convert_history_payloads(test_engine) >= 1
+        raw = test_db_session.execute(
+            text("SELECT typeof(result_payload) FROM quotation_history WHERE id = :id"),
+            {"id": history.id},
+        ).scalar()
+        assert raw == "blob"
+        test_db_session.expire_all()
+        assert history.result_payload == {"产品单价": 2.0}
+        assert convert_history_payloads(test_engine) == 0
+
+
+class TestHistorySearch:
+    """Test FTS5 search over history and favorite names."""
+
+    def _create(
+        self, db: Session, user_id: int, worker_type: str, colors: int, price: float
+    ):
+        return crud.create_history(
+            db,
+            user_id=user_id,
+            request_payload={
+                "order_quantity": 100,
+                "length": 3.0,
+                "width": 2.0,
+                "thickness": 0.4,
+                "color_count": colors,
+            },
+            result_payload={},
+            worker_type=worker_type,
+            unit_price=price,
+            total_price=price * 100,
+        )
+
+    def test_search_ranks_and_facets(self, test_db_session: Session, test_engine):
+        from app.db.migrations import ensure_history_search_index
+
+        ensure_history_search_index(test_engine)
+        user = _make_user(test_db_session)
+        a = self._create(test_db_session, user.id, "standard", 2, 0.5)
+        b = self._create(test_db_session, user.id, "skilled", 4, 1.5)
+        c = self._create(test_db_session, user.id, "standard", 7, 2.5)
+        crud.create_favorite(test_db_session, user.id, b.id, name="客户甲钥匙扣")
+
+        result = crud.search_histories(test_db_session, user.id, "3x2x0.4cm")
+        assert result["total"] == 3
+        assert {f["value"]: f["count"] for f in result["facets"]["worker_type"]} == {
+            "standard": 2,
+            "skilled": 1,
+        }
+        assert {f["value"] for f in result["facets"]["color_count"]} == {
+            "1-2色",
+            "3-5色",
+            "6-8色",
+        }
+
+        # 收藏名称检索（含短于 3 字的子串匹配），改名后索引同步更新
+        (hit,) = crud.search_histories(test_db_session, user.id, "钥匙扣")["hits"]
+        assert hit["id"] == b.id and hit["score"] > 0
+        assert crud.search_histories(test_db_session, user.id, "客户")["total"] == 1
+        favorite = crud.get_user_favorites(test_db_session, user.id)[0]
+        favorite.name = "样品"
+        test_db_session.commit()
+        assert crud.search_histories(test_db_session, user.id, "钥匙扣")["total"] == 0
+
+        # 价格区间与分面筛选；删除后从索引移除
+        priced = crud.search_histories(
+            test_db_session, user.id, "standard", min_unit=1.0, max_unit=3.0
+        )
+        assert [h["id"] for h in priced["hits"]] == [c.id]
+        crud.delete_history(test_db_session, c.id, user.id)
+        assert (
+            crud.search_histories(test_db_session, user.id, "standard")["hits"][0]["id"]
+            == a.id
+        )
+        other = _make_user(test_db_session)
+        assert (
+            crud.search_histories(test_db_session, other.id, "standard")["total"] == 0
+        )
+
+    def test_rebuild_outdated_search_index(self, tmp_path):
+        from sqlalchemy import create_engine
+
+        from app.db.migrations import ensure_history_search_index
+        from app.db.models import HISTORY_FTS_TABLE, Base
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'fts.db'}")
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            # 升级前的索引结构：没有 user_tok 列
+            conn.exec_driver_sql(
+                f"CREATE VIRTUAL TABLE {HISTORY_FTS_TABLE} USING fts5("
+                "names, spec, user_id UNINDEXED, tokenize = 'trigram')"
+            )
+        with Session(engine) as db:
+            user = _make_user(db)
+            history = self._create(db, user.id, "standard", 2, 0.5)
+            ensure_history_search_index(engine)
+            (hit,) = crud.search_histories(db, user.id, "standard")["hits"]
+            assert hit["id"] == history.id
+
+    def test_search_unavailable_off_sqlite(self, test_db_session: Session, monkeypatch):
+        import asyncio
+        from types import SimpleNamespace
+
+        from fastapi import HTTPException
+
+        from app.api.routers.history import search_history
+
+        user = _make_user(test_db_session)
+        postgres = SimpleNamespace(dialect=SimpleNamespace(name="postgresql"))
+        monkeypatch.setattr(test_db_session, "get_bind", lambda *a, **kw: postgres)
+        with pytest.raises(crud.SearchUnavailableError):
+            crud.search_histories(test_db_session, user.id, "standard")
+
+        # 路由转换为 501
+        with pytest.raises(HTTPException) as excinfo:
+            asyncio.run(
+                search_history(
+                    q="standard",
+                    worker_type=None,
+                    color_count=None,
+                    min_unit=None,
+                    max_unit=None,
+                    limit=20,
+                    db=test_db_session,
+                    current_user=user,
+                )
+            )
+        assert excinfo.value.status_code == 501
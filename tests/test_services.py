@@ -1,5 +1,6 @@
 """Tests for core services."""
 
+import pytest
 from sqlalchemy.orm import Session
 
 from app.db import crud
@@ -43,3 +44,916 @@ class TestCRUDOperations:
         settings = crud.get_app_settings(test_db_session)
         # Should return None if no settings exist
         assert settings is None or hasattr(settings, "id")
+
+
+class TestSimilarQuoteIndex:
+    """Test the in-memory nearest-neighbor quote index."""
+
+    def _history(self, history_id: int, user_id: int, length: float, colors: int):
+        from types import SimpleNamespace
+
+        return SimpleNamespace(
+            id=history_id,
+            user_id=user_id,
+            length=length,
+            width=2.0,
+            thickness=0.4,
+            color_count=colors,
+            area_ratio=0.8,
+            worker_type="standard",
+            unit_price=length / 10,
+            order_quantity=100,
+        )
+
+    def test_incremental_query_matches_brute_force(self, test_db_session: Session):
+        import numpy as np
+
+        from app.services.similarity_service import FEATURES, SimilarQuoteIndex
+
+        rng = np.random.default_rng(0)
+        user = crud.create_user(
+            test_db_session, username="similar_user", password_hash="x"
+        )
+        index = SimilarQuoteIndex()
+
+        def create(i: int):
+            return crud.create_history(
+                test_db_session,
+                user_id=user.id,
+                request_payload={
+                    "length": float(rng.uniform(1, 30)),
+                    "width": float(rng.uniform(1, 30)),
+                    "thickness": float(rng.uniform(0.2, 1)),
+                    "color_count": int(rng.integers(1, 12)),
+                    "area_ratio": float(rng.uniform(0.3, 1)),
+                },
+                result_payload={},
+                worker_type="standard",
+                unit_price=1.0,
+                total_price=100.0,
+            )
+
+        for i in range(100):
+            create(i)
+        index.rebuild(test_db_session)
+        for i in range(300):  # 超过缓冲区阈值，触发分区重建
+            index.add(create(i))
+
+        query = {
+            "length": 7.2,
+            "width": 12.0,
+            "thickness": 0.4,
+            "color_count": 3,
+            "area_ratio": 0.8,
+        }
+        hits = index.query(query, k=5, user_id=user.id)
+
+        rows = test_db_session.query(crud.QuotationHistory).filter_by(user_id=user.id)
+        points = np.array([[getattr(h, f) for f in FEATURES] for h in rows])
+        ids = np.array([h.id for h in rows])
+        target = np.array([query[f] for f in FEATURES])
+        dist = np.sqrt((((points - target) / index._scale) ** 2).sum(axis=1))
+        assert [h["id"] for h in hits] == ids[np.argsort(dist)[:5]].tolist()
+
+    def test_scopes_and_discard(self):
+        from app.services.similarity_service import SimilarQuoteIndex
+
+        index = SimilarQuoteIndex()
+        index.add(self._history(1, 10, 3.0, 2))
+        index.add(self._history(2, 10, 8.0, 2))
+        index.add(self._history(3, 20, 3.1, 2))
+        query = {
+            "length": 3.0,
+            "width": 2.0,
+            "thickness": 0.4,
+            "color_count": 2,
+            "area_ratio": 0.8,
+        }
+
+        assert [h["id"] for h in index.query(query, k=2, user_id=10)] == [1, 2]
+        assert [h["id"] for h in index.query(query, k=2)] == [1, 3]
+        index.discard([1])
+        assert [h["id"] for h in index.query(query, k=2, user_id=10)] == [2]
+        assert index.query(query, user_id=99) == []
+
+    def test_discard_compacts_partitions(self):
+        from app.services.similarity_service import (
+            _TOMBSTONE_REBUILD_SIZE,
+            SimilarQuoteIndex,
+        )
+
+        index = SimilarQuoteIndex()
+        count = _TOMBSTONE_REBUILD_SIZE * 2
+        for i in range(count):
+            index.add(self._history(i, 10, 1.0 + i, 2))
+        query = {
+            "length": 1.0,
+            "width": 2.0,
+            "thickness": 0.4,
+            "color_count": 2,
+            "area_ratio": 0.8,
+        }
+
+        index.discard(list(range(_TOMBSTONE_REBUILD_SIZE + 1)))
+        # 删除标记超过阈值后已从分区中剔除，不再随查询放大候选数
+        for key in (None, 10):
+            partition = index._partitions[key]
+            assert partition.removed == set()
+            assert len(partition.ids) == count - _TOMBSTONE_REBUILD_SIZE - 1
+        hits = index.query(query, k=2, user_id=10)
+        assert [h["id"] for h in hits] == [
+            _TOMBSTONE_REBUILD_SIZE + 1,
+            _TOMBSTONE_REBUILD_SIZE + 2,
+        ]
+
+
+class TestVectorizedPricing:
+    """Test batch pricing against the scalar calculator."""
+
+    def test_matches_scalar_calculator(self):
+        import numpy as np
+
+        from app.services.calculator_service import calculate_quotes_vectorized
+        from quotation import QuotationCalculator
+
+        calc = QuotationCalculator()
+        rng = np.random.default_rng(0)
+        n = 500
+        params = {
+            "length": rng.uniform(0.5, 30, n).round(1),
+            "width": rng.uniform(0.5, 30, n).round(1),
+            "thickness": rng.uniform(0.1, 1, n).round(2),
+            "color_count": rng.integers(0, 21, n),
+            "area_ratio": rng.uniform(0.1, 1, n).round(2),
+            "order_quantity": rng.integers(1, 200000, n),
+            "worker_type": rng.choice(["standard", "skilled", "unknown"], n),
+        }
+        batch = calculate_quotes_vectorized(calc, **params)
+
+        for i in range(n):
+            row = {k: v[i].item() for k, v in params.items()}
+            try:
+                scalar = calc.calculate_quote(**row)
+            except ValueError:
+                scalar = {"error": "unknown worker type"}
+            if "error" in scalar:
+                assert np.isnan(batch["unit_price"][i])
+            else:
+                assert batch["unit_price"][i] == scalar["产品单价"]
+                assert batch["total_price"][i] == scalar["订单货款总额"]
+
+    def test_simulate_settings(self, test_db_session: Session):
+        from app.db.seed import seed_database
+        from app.services.cache_service import invalidate_settings_cache
+        from app.services.settings_service import simulate_settings
+
+        seed_database(test_db_session)
+        invalidate_settings_cache()
+        user = crud.create_user(
+            test_db_session, username="simulate_user", password_hash="x"
+        )
+        for colors in (2, 4, 6):
+            crud.create_history(
+                test_db_session,
+                user_id=user.id,
+                request_payload={
+                    "length": 3.0,
+                    "width": 2.0,
+                    "thickness": 0.4,
+                    "color_count": colors,
+                    "area_ratio": 0.8,
+                    "order_quantity": 1000,
+                },
+                result_payload={},
+                worker_type="standard",
+                unit_price=0.2,
+                total_price=200.0,
+            )
+
+        result = simulate_settings(
+            test_db_session, {"profit_margin": 0.9}, limit=3, worker_type="standard"
+        )
+        assert result["sample_size"] == 3
+        assert result["current"]["count"] == result["draft"]["count"] == 3
+        assert result["change"]["increased"] == 3
+        assert result["draft"]["mean"] > result["current"]["mean"]
+        assert sum(result["stored"]["histogram"]) == 3
+        # 模拟不修改已保存的设置
+        assert crud.get_app_settings(test_db_session).profit_margin != 0.9
+
+
+class TestQuoteRiskSimulation:
+    """Test Monte Carlo cost-risk simulation."""
+
+    def test_percentile_bands(self, test_db_session: Session):
+        from app.db.seed import seed_database
+        from app.schemas.quote import MonteCarloConfig
+        from app.services.calculator_service import simulate_quote_risk
+
+        seed_database(test_db_session)
+        params = (3.0, 2.0, 0.4, 4, 0.8, 1000, "standard")
+
+        config = MonteCarloConfig(samples=2000, seed=1).model_dump()
+        result = simulate_quote_risk(test_db_session, *params, config)
+        cost = result["unit_cost"]
+        assert result["samples"] == 2000
+        assert cost["p5"] < cost["p50"] < cost["p95"]
+        assert cost["p5"] < result["expected_unit_cost"] < cost["p95"]
+        assert result["margin"]["p5"] < result["margin"]["p95"]
+        assert 0.0 <= result["loss_probability"] <= 1.0
+
+        # 零波动时各百分位均等于点估计
+        for key in ("waste_rate", "material_price", "output_per_shift"):
+            config[key]["spread"] = 0.0
+        fixed = simulate_quote_risk(test_db_session, *params, config)
+        assert fixed["unit_cost"]["p5"] == pytest.approx(fixed["expected_unit_cost"])
+        assert fixed["unit_cost"]["p95"] == pytest.approx(fixed["expected_unit_cost"])
+
+
+class TestProductionScheduler:
+    """Test the production capacity scheduler."""
+
+    def test_schedule_orders(self):
+        from app.services.scheduling_service import schedule_orders
+        from quotation import QuotationCalculator
+
+        calc = QuotationCalculator()
+        base = {
+            "length": 3.0,
+            "width": 2.0,
+            "thickness": 0.4,
+            "area_ratio": 0.8,
+            "order_quantity": 1000,
+            "worker_type": "standard",
+        }
+        orders = [
+            {**base, "id": "low", "color_count": 8, "priority": 1},
+            {**base, "id": "a", "color_count": 8},
+            {**base, "id": "b", "color_count": 8},
+            {**base, "id": "too-many-colors", "color_count": 30},
+            {**base, "id": "no-machine", "color_count": 2, "worker_type": "skilled"},
+        ]
+        # 1 名普通工人操作 2 台机台
+        result = schedule_orders(calc, orders, 2, {"standard": 1})
+        scheduled = {s["id"]: s for s in result["scheduled"]}
+        unscheduled = {u["id"] for u in result["unscheduled"]}
+
+        assert unscheduled == {"too-many-colors", "no-machine"}
+        # 两个 9 针订单共用一台 18 针机台，低优先级订单排到另一台
+        assert scheduled["a"]["machine"] == scheduled["b"]["machine"]
+        assert scheduled["low"]["machine"] != scheduled["a"]["machine"]
+        assert all(s["start_shift"] == 0.0 for s in scheduled.values())
+
+        summary = result["summary"]
+        assert summary["machines"] == 2
+        assert summary["scheduled"] == 3
+        assert 0.0 < summary["utilization"] <= 1.0
+        assert summary["utilization"] == pytest.approx(0.75)
+
+        # 只有一台机台时，低优先级订单等待前序订单释放针头
+        result = schedule_orders(calc, orders[:3], 1, {"standard": 1})
+        scheduled = {s["id"]: s for s in result["scheduled"]}
+        assert scheduled["low"]["start_shift"] == scheduled["a"]["end_shift"]
+        assert result["summary"]["makespan_shifts"] == pytest.approx(
+            2 * scheduled["a"]["end_shift"]
+        )
+
+
+class TestQuoteSolver:
+    """Test inverse quote solving from a target unit price."""
+
+    def test_solve_quote(self, test_db_session: Session):
+        from app.db.seed import seed_database
+        from app.services.calculator_service import (
+            build_calculator_from_db,
+            solve_quote,
+        )
+
+        seed_database(test_db_session)
+        calc = build_calculator_from_db(test_db_session)
+        base = {
+            "length": 3.0,
+            "width": 2.0,
+            "thickness": 0.4,
+            "color_count": 4,
+            "area_ratio": 0.8,
+            "order_quantity": 1000,
+            "worker_type": "standard",
+        }
+
+        def price(**overrides):
+            return calc.calculate_quote(**{**base, **overrides}).get("产品单价")
+
+        target = 0.2
+        # 最小数量：恰好满足目标，少一件则超出
+        quantity = solve_quote(test_db_session, "quantity", target, base)["value"]
+        assert price(order_quantity=quantity) <= target
+        assert price(order_quantity=quantity - 1) > target
+
+        # 最大尺寸：再加 0.01 cm 即超出目标（或放不进模具）
+        for name in ("length", "width", "thickness"):
+            result = solve_quote(test_db_session, name, target, base)
+            assert result["feasible"]
+            assert price(**{name: result["value"]}) <= target
+            bigger = price(**{name: result["value"] + 0.01})
+            assert bigger is None or bigger > target
+
+        colors = solve_quote(test_db_session, "color_count", target, base)["value"]
+        assert price(color_count=colors) <= target
+        assert price(color_count=colors + 1) > target
+
+        # 按当前报价成交时隐含利润率等于设置的利润率
+        quoted = price()
+        margin = solve_quote(test_db_session, "margin", quoted, base)["value"]
+        assert margin == pytest.approx(calc.PROFIT_MARGIN, abs=1e-3)
+
+        # 低于极限单价时不可行
+        result = solve_quote(test_db_session, "quantity", 0.001, base)
+        assert not result["feasible"]
+        assert result["floor_unit_price"] > 0.001
+        # 紧贴极限单价时所需数量超过请求上限，同样不可行
+        near_floor = result["floor_unit_price"] + 0.0001
+        result = solve_quote(test_db_session, "quantity", near_floor, base)
+        assert not result["feasible"] and "上限" in result["reason"]
+
+
+class TestWorkerTypeComparison:
+    """Test multi-worker-type comparison in a single quote."""
+
+    def test_compare_worker_types(self, test_db_session: Session):
+        from app.db.seed import seed_database
+
+        seed_database(test_db_session)
+        params = {
+            "length": 3.0,
+            "width": 2.0,
+            "thickness": 0.4,
+            "color_count": 4,
+            "area_ratio": 0.8,
+            "order_quantity": 1000,
+        }
+        result = compute_quote(
+            test_db_session, **params, worker_type="standard", compare_worker_types=[]
+        )
+        rows = {row["worker_type"]: row for row in result["worker_comparison"]}
+        assert {"standard", "skilled"} <= set(rows)
+        assert rows["standard"]["unit_price"] == result["产品单价"]
+        assert rows["standard"]["price_diff"] == 0.0
+
+        # 每行与单独按该工人类型报价一致
+        skilled = compute_quote(test_db_session, **params, worker_type="skilled")
+        assert rows["skilled"]["unit_price"] == skilled["产品单价"]
+        assert rows["skilled"]["total_price"] == skilled["订单货款总额"]
+        assert rows["skilled"]["price_diff"] == pytest.approx(
+            skilled["产品单价"] - result["产品单价"]
+        )
+
+        with pytest.raises(ValueError):
+            compute_quote(test_db_session, **params, compare_worker_types=["unknown"])
+
+
+class TestQuoteImport:
+    """Test bulk quote import from spreadsheets."""
+
+    def test_import_csv(self):
+        import csv
+        import io
+
+        from app.services import import_service
+        from quotation import QuotationCalculator
+
+        calc = QuotationCalculator()
+        source = (
+            "SKU,长(cm),宽(cm),厚(cm),颜色数,面积比例,订单数量,工人类型\n"
+            "A,3,2,0.4,4,0.8,1000,\n"
+            ",,,,,,,\n"
+            "B,3,2,0.4,4,0.8,1000,skilled\n"
+            "C,x,2,0.4,4,0.8,1000,\n"
+            "D,30,2,0.4,4,0.8,1000,\n"
+        ).encode("gb18030")
+
+        rows = import_service.iter_sheet_rows(io.BytesIO(source), "csv")
+        header = next(rows)
+        columns = import_service.map_columns(header)
+        results = import_service.quote_rows(calc, rows, columns, chunk_size=2)
+        output = "".join(import_service.iter_csv_output(header, results))
+        lines = list(csv.reader(io.StringIO(output.lstrip("\ufeff"))))
+
+        assert lines[0][-3:] == list(import_service.RESULT_HEADERS)
+        # 空行跳过，其余行按原顺序输出
+        assert [line[0] for line in lines[1:]] == ["A", "B", "C", "D"]
+        a = calc.calculate_quote(3, 2, 0.4, 4, 0.8, 1000)
+        assert float(lines[1][-3]) == a["产品单价"]
+        assert float(lines[1][-2]) == a["订单货款总额"]
+        b = calc.calculate_quote(3, 2, 0.4, 4, 0.8, 1000, worker_type="skilled")
+        assert float(lines[2][-3]) == b["产品单价"]
+        # 参数校验错误与计算错误逐行给出
+        assert lines[3][-3:-1] == ["", ""] and "length" in lines[3][-1]
+        assert lines[4][-1] == calc.calculate_quote(30, 2, 0.4, 4, 0.8, 1000)["error"]
+
+        with pytest.raises(ValueError):
+            import_service.map_columns(["SKU", "长(cm)"])
+
+    def test_import_limits(self):
+        import io
+
+        from app.services import import_service
+        from quotation import QuotationCalculator
+
+        source = b"length,width,thickness,color_count,area_ratio,order_quantity\n" + (
+            b"3,2,0.4,4,0.8,1000\n" * 5
+        )
+        with pytest.raises(import_service.UploadTooLargeError):
+            import_service.spool_upload(io.BytesIO(source), max_size=len(source) - 1)
+
+        spool = import_service.spool_upload(io.BytesIO(source), max_size=len(source))
+        rows = import_service.iter_sheet_rows(spool, "csv")
+        columns = import_service.map_columns(next(rows))
+        results = list(
+            import_service.quote_rows(
+                QuotationCalculator(), rows, columns, chunk_size=2, max_rows=3
+            )
+        )
+        # 前 3 行报价，第 4 行给出超限错误后停止
+        assert [row[-1] for row in results[:3]] == [None] * 3
+        assert len(results) == 4 and "上限" in results[3][-1]
+
+    def test_import_encoding_checked_past_first_block(self):
+        import io
+
+        from app.services import import_service
+
+        # 前 64 KB 只有 ASCII，GB18030 编码的中文出现在其后
+        ascii_part = (
+            b"sku,length,width,thickness,color_count,area_ratio,order_quantity\n"
+            + b"A,3,2,0.4,4,0.8,1000\n" * 5000
+        )
+        source = ascii_part + "钥匙扣,3,2,0.4,4,0.8,1000\n".encode("gb18030")
+        rows = list(import_service.iter_sheet_rows(io.BytesIO(source), "csv"))
+        assert len(rows) == 5002
+        assert rows[-1][0] == "钥匙扣"
+
+        # 两种编码都无法解码时，在读出表头（开始流式输出）之前报错
+        broken = ascii_part + b"\xff\xff,3,2,0.4,4,0.8,1000\n"
+        with pytest.raises(ValueError, match="编码"):
+            next(import_service.iter_sheet_rows(io.BytesIO(broken), "csv"))
+
+
+class TestBatchQuoteScript:
+    """Test the multi-process batch quoting script."""
+
+    def test_imap_ordered_keeps_input_order(self):
+        import threading
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+
+        from scripts.batch_quote import _imap_ordered
+
+        lock = threading.Lock()
+        running = {"now": 0, "max": 0}
+
+        def work(i: int) -> int:
+            with lock:
+                running["now"] += 1
+                running["max"] = max(running["max"], running["now"])
+            # 先提交的任务更晚完成
+            time.sleep((5 - i % 5) * 0.002)
+            with lock:
+                running["now"] -= 1
+            return i
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(_imap_ordered(pool, work, range(20), window=3))
+        assert results == list(range(20))
+        assert running["max"] <= 3
+
+    def test_verify_reports_mismatches(self, tmp_path, monkeypatch):
+        import sys
+
+        from quotation import QuotationCalculator
+        from scripts import batch_quote
+
+        source = tmp_path / "products.csv"
+        source.write_text(
+            "length,width,thickness,color_count,area_ratio,order_quantity\n"
+            "3,2,0.4,4,0.8,1000\n"
+            "3,2,0.4,4,0.8,2000\n",
+            encoding="utf-8",
+        )
+        argv = [
+            "batch_quote.py",
+            str(source),
+            "-o",
+            str(tmp_path / "prices.csv"),
+            "--workers",
+            "1",
+            "--default-settings",
+            "--verify",
+        ]
+        monkeypatch.setattr(sys, "argv", argv)
+        assert batch_quote.main() == 0
+
+        # 让逐条计算在第二行给出不同的单价
+        calculate_quote = QuotationCalculator.calculate_quote
+
+        def drifted(self, *args, **kwargs):
+            result = calculate_quote(self, *args, **kwargs)
+            if kwargs.get("order_quantity") == 2000:
+                result["产品单价"] += 0.01
+            return result
+
+        monkeypatch.setattr(QuotationCalculator, "calculate_quote", drifted)
+        assert batch_quote.main() == 1
+
+    def test_input_file_closed(self, tmp_path, monkeypatch):
+        import builtins
+        import sys
+
+        from scripts import batch_quote
+
+        opened = []
+
+        def tracking_open(*args, **kwargs):
+            f = builtins.open(*args, **kwargs)
+            opened.append(f)
+            return f
+
+        monkeypatch.setattr(batch_quote, "open", tracking_open, raising=False)
+        source = tmp_path / "products.csv"
+        output = str(tmp_path / "prices.csv")
+        argv = ["batch_quote.py", str(source), "-o", output, "--default-settings"]
+        monkeypatch.setattr(sys, "argv", [*argv, "--workers", "1"])
+
+        # 正常结束与表头缺列提前返回时，输入文件都已关闭
+        source.write_text(
+            "length,width,thickness,color_count,area_ratio,order_quantity\n"
+            "3,2,0.4,4,0.8,1000\n",
+            encoding="utf-8",
+        )
+        assert batch_quote.main() == 0
+        source.write_text("length,width\n3,2\n", encoding="utf-8")
+        assert batch_quote.main() == 1
+        assert len(opened) == 3 and all(f.closed for f in opened)
+
+
+class TestImageAnalysis:
+    """Test single-pass image analysis used by batch analysis."""
+
+    def test_analyze_image(self):
+        import cv2
+        import numpy as np
+
+        from app.services.image_analysis_service import analyze_image
+
+        # 白底上的红色矩形 + 蓝色圆形
+        image = np.full((200, 300, 3), 255, np.uint8)
+        cv2.rectangle(image, (40, 50), (260, 150), (0, 0, 200), -1)
+        cv2.circle(image, (150, 100), 30, (200, 0, 0), -1)
+        ok, encoded = cv2.imencode(".png", image)
+        assert ok
+
+        result = analyze_image(image, encoded.tobytes(), "opencv")
+
+        # 矩形主体填满最小外接矩形
+        assert result["area_ratio"] == pytest.approx(1.0, abs=0.02)
+        assert result["color_count"] == len(result["palette"]) >= 1
+        assert result["preview"].shape == image.shape
+        assert sum(p["ratio"] for p in result["palette"]) <= 1.0 + 1e-6
+
+    def test_analyze_image_path_shares_remover(self):
+        import uuid
+
+        import cv2
+        import numpy as np
+
+        from app.services import image_analysis_service as service
+
+        image = np.full((120, 160, 3), 255, np.uint8)
+        cv2.rectangle(image, (30, 30), (130, 90), (0, 120, 0), -1)
+        name = f"test_{uuid.uuid4().hex}.png"
+        path = service.UPLOADS_DIR / name
+        cv2.imwrite(str(path), image)
+        preview = None
+        try:
+            remover = service.get_background_remover("opencv")
+            # 同一进程内复用同一个抠图器
+            assert service.get_background_remover("opencv") is remover
+            result = service.analyze_image_path(
+                f"/static/uploads/{name}", "opencv", remover
+            )
+            preview = service.STATIC_DIR / result["preview_path"][len("/static/") :]
+            assert preview.exists()
+            assert "preview" not in result
+            assert result["area_ratio"] == pytest.approx(1.0, abs=0.02)
+        finally:
+            path.unlink()
+            if preview is not None:
+                preview.unlink(missing_ok=True)
+
+        with pytest.raises(FileNotFoundError):
+            service.analyze_image_path(f"/static/uploads/{name}", "opencv", remover)
+
+    def test_analyze_parts(self):
+        import cv2
+        import numpy as np
+
+        from app.services.image_analysis_service import analyze_parts
+
+        # 白底排版图：两行共 5 个零件（含 1 个圆形）+ 1 个噪点
+        image = np.full((300, 400, 3), 245, np.uint8)
+        boxes = [(20, 20), (150, 30), (280, 20), (20, 170), (150, 160)]
+        for i, (x, y) in enumerate(boxes):
+            color = (0, 0, 180) if i % 2 else (150, 0, 0)
+            if i == 2:
+                cv2.circle(image, (x + 50, y + 50), 50, color, -1)
+            else:
+                cv2.rectangle(image, (x, y), (x + 100, y + 80), color, -1)
+        image[280, 380] = 0
+        ok, encoded = cv2.imencode(".png", image)
+        assert ok
+
+        result = analyze_parts(image, encoded.tobytes(), "opencv")
+
+        assert result["part_count"] == 5
+        parts = result["parts"]
+        # 按行从上到下、行内从左到右编号
+        # 抠图后处理会腐蚀边缘约 1 像素
+        for part, (x, y) in zip(parts, boxes):
+            assert part["bbox"][:2] == pytest.approx([x, y], abs=2)
+        assert [p["index"] for p in parts] == [1, 2, 3, 4, 5]
+        assert parts[0]["area_ratio"] == pytest.approx(1.0, abs=0.02)
+        assert parts[2]["area_ratio"] == pytest.approx(np.pi / 4, abs=0.03)
+        assert parts[0]["rect_size"] == pytest.approx([100, 80], abs=2)
+        for part in parts:
+            # 单色零件：主色占比接近 100%
+            assert part["color_count"] >= 1
+            assert max(c["ratio"] for c in part["palette"]) > 0.9
+        red = [c["rgb"] for c in parts[1]["palette"]][0]
+        blue = [c["rgb"] for c in parts[0]["palette"]][0]
+        assert red[0] > red[2] and blue[2] > blue[0]
+
+    def test_roi_crop_and_cache(self):
+        import uuid
+
+        import cv2
+        import numpy as np
+
+        from app.services import image_analysis_service as service
+
+        image = np.full((200, 300, 3), 240, np.uint8)
+        cv2.rectangle(image, (20, 20), (120, 120), (0, 0, 0), -1)
+        cv2.rectangle(image, (150, 50), (290, 190), (200, 0, 0), -1)
+
+        box = service.crop_to_roi(image, {"box": [10, 10, 120, 500]})
+        assert box.shape == (190, 120, 3)
+        # 多边形外的像素填充为边缘背景色
+        polygon = service.crop_to_roi(
+            image, {"polygon": [[140, 40], [299, 40], [140, 199]]}
+        )
+        assert polygon.shape == (160, 160, 3)
+        assert polygon[-2, -2].tolist() == [240, 240, 240]
+        with pytest.raises(ValueError):
+            service.crop_to_roi(image, {"box": [400, 0, 10, 10]})
+
+        name = f"test_{uuid.uuid4().hex}.png"
+        path = service.UPLOADS_DIR / name
+        cv2.imwrite(str(path), image)
+        static_path = f"/static/uploads/{name}"
+        previews = []
+        try:
+            img, data = service.load_image_bgr_from_path(
+                static_path, {"box": [10, 10, 120, 120]}
+            )
+            assert img.shape == (120, 120, 3)
+            assert (
+                cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR).shape
+                == img.shape
+            )
+
+            full = service.analyze_area_ratio(static_path, "opencv")
+            again = service.analyze_area_ratio(static_path, "opencv")
+            cropped = service.analyze_area_ratio(
+                static_path, "opencv", roi={"box": [10, 10, 120, 120]}
+            )
+            previews = [full[1], cropped[1]]
+            # 相同参数命中缓存，不同 ROI 单独计算
+            assert again == full
+            assert cropped[1] != full[1]
+            assert cropped[0] == pytest.approx(1.0, abs=0.02)
+        finally:
+            path.unlink()
+            for preview in previews:
+                (service.STATIC_DIR / preview[len("/static/") :]).unlink(
+                    missing_ok=True
+                )
+
+    def test_auto_method_choice(self):
+        import cv2
+        import numpy as np
+
+        from app.services.image_analysis_service import analyze_image, choose_method
+
+        # 白底上占满大半画面的产品：opencv 可信，不需要 rembg
+        image = np.full((200, 300, 3), 255, np.uint8)
+        cv2.rectangle(image, (30, 30), (270, 170), (0, 0, 200), -1)
+        method, quality = choose_method(image)
+        assert method == "opencv"
+        assert quality["polarity_agreement"] == 1.0
+        assert quality["score"] >= quality["threshold"]
+
+        ok, encoded = cv2.imencode(".png", image)
+        assert ok
+        result = analyze_image(image, encoded.tobytes(), "auto")
+        assert result["method"] == "opencv"
+        assert result["auto"]["score"] == quality["score"]
+        assert result["area_ratio"] == pytest.approx(1.0, abs=0.02)
+
+        # 白底上的小产品：按边缘取到主体，像素多少规则不一致但主体不接触边缘，仍用 opencv
+        small = np.full((200, 300, 3), 255, np.uint8)
+        cv2.circle(small, (150, 100), 40, (0, 0, 200), -1)
+        method, quality = choose_method(small)
+        assert method == "opencv"
+        assert quality["polarity_agreement"] == 0.0
+        assert quality["border_contact"] == 0.0
+        assert quality["foreground_fraction"] < 0.1
+        ok, encoded = cv2.imencode(".png", small)
+        result = analyze_image(small, encoded.tobytes(), "auto")
+        assert result["method"] == "opencv"
+        assert result["area_ratio"] == pytest.approx(np.pi / 4, abs=0.05)
+
+        # 贴边的少数一侧：两种规则不一致且前景大量接触边缘，难以区分，改用 rembg
+        edge = np.full((200, 300, 3), 255, np.uint8)
+        cv2.rectangle(edge, (0, 0), (99, 199), (0, 0, 200), -1)
+        method, quality = choose_method(edge)
+        assert method == "rembg"
+        assert quality["border_contact"] > 0.05
+
+    def test_auto_scoring_within_timeout(self, monkeypatch):
+        import asyncio
+        import threading
+
+        from fastapi import HTTPException
+
+        from app.api.routers import analyze
+
+        released = threading.Event()
+
+        def slow_choose(*args, **kwargs):
+            released.wait(5)
+            return "opencv", {"score": 1.0}
+
+        real_wait_for = asyncio.wait_for
+        monkeypatch.setattr(analyze, "choose_method_for_path", slow_choose)
+        monkeypatch.setattr(
+            analyze.asyncio,
+            "wait_for",
+            lambda aw, timeout: real_wait_for(aw, timeout=0.05),
+        )
+        payload = analyze.AnalyzeRequest(image_path="/static/x.png", method="auto")
+        # auto 的可信度评估与分析共用同一个超时
+        try:
+            for endpoint in (
+                analyze.analyze_area_ratio_api,
+                analyze.analyze_colors_api,
+            ):
+                with pytest.raises(HTTPException) as excinfo:
+                    asyncio.run(endpoint(payload))
+                assert excinfo.value.status_code == 504
+        finally:
+            released.set()
+
+    def test_rembg_model_selection(self, monkeypatch):
+        from app.services import image_analysis_service as service
+        from scripts.background_remover import (
+            REMBG_MODELS,
+            BackgroundRemover,
+            resolve_rembg_model,
+        )
+
+        monkeypatch.delenv("REMBG_MODEL", raising=False)
+        assert resolve_rembg_model() == "u2net"
+        assert resolve_rembg_model("U2NETP") == "u2netp"
+        monkeypatch.setenv("REMBG_MODEL", "silueta")
+        assert BackgroundRemover().rembg_model == "silueta"
+        assert BackgroundRemover("isnet").rembg_model == "isnet"
+        # 量化模型只能从 models/ 加载
+        assert REMBG_MODELS["u2net_int8"]["offline"]
+
+        with pytest.raises(ValueError, match="未知的抠图模型"):
+            BackgroundRemover("u3net")
+        with pytest.raises(ValueError, match="未知的抠图模型"):
+            service.get_background_remover("opencv", "u3net")
+
+
+class TestBatchAnalyzeStream:
+    """Test the streamed /batch image analysis endpoint without an HTTP client."""
+
+    def _run(self, payload, accept: str = "") -> list[str]:
+        import asyncio
+        from types import SimpleNamespace
+
+        from app.api.routers import analyze
+
+        async def collect():
+            response = await analyze.analyze_batch_api(
+                payload, SimpleNamespace(headers={"accept": accept})
+            )
+            return [chunk async for chunk in response.body_iterator]
+
+        return asyncio.run(collect())
+
+    @pytest.fixture
+    def fake_analysis(self, monkeypatch):
+        """替换抠图器加载与单张分析，记录同时进行的分析数"""
+        import threading
+        import time
+
+        from app.api.routers import analyze
+
+        lock = threading.Lock()
+        running = {"now": 0, "max": 0}
+
+        def analyze_image_path(image_path, method, remover):
+            with lock:
+                running["now"] += 1
+                running["max"] = max(running["max"], running["now"])
+            try:
+                time.sleep(0.01)
+                if image_path.endswith("missing.png"):
+                    raise FileNotFoundError(image_path)
+                if image_path.endswith("blank.png"):
+                    raise ValueError("未检测到前景轮廓")
+                return {
+                    "method": method,
+                    "area_ratio": 0.5,
+                    "color_count": 2,
+                    "palette": [],
+                    "preview_path": "/static/uploads/analysis/x.png",
+                }
+            finally:
+                with lock:
+                    running["now"] -= 1
+
+        monkeypatch.setattr(analyze, "analyze_image_path", analyze_image_path)
+        monkeypatch.setattr(
+            analyze, "get_background_remover", lambda method, model=None: object()
+        )
+        return running
+
+    def test_ndjson_items_and_errors(self, fake_analysis):
+        import json
+
+        from app.api.routers.analyze import BatchAnalyzeRequest
+
+        paths = ["/static/a.png", "/static/missing.png", "/static/blank.png"] + [
+            f"/static/{i}.png" for i in range(5)
+        ]
+        payload = BatchAnalyzeRequest(image_paths=paths, concurrency=1)
+        chunks = self._run(payload)
+
+        # 每行一个 JSON，单张失败不中断，最后一条为汇总
+        assert all(chunk.endswith("\n") and chunk.count("\n") == 1 for chunk in chunks)
+        items = [json.loads(chunk) for chunk in chunks]
+        assert items[-1] == {"status": "done", "total": 8, "succeeded": 6, "failed": 2}
+        by_index = {item["index"]: item for item in items[:-1]}
+        assert sorted(by_index) == list(range(8))
+        assert by_index[1]["status_code"] == 404
+        assert by_index[2]["status_code"] == 400
+        assert by_index[0]["status"] == "ok" and by_index[0]["area_ratio"] == 0.5
+        assert fake_analysis["max"] == 1
+
+    def test_sse_framing_and_load_failure(self, monkeypatch, fake_analysis):
+        import json
+
+        from app.api.routers import analyze
+
+        payload = analyze.BatchAnalyzeRequest(image_paths=["/static/a.png"])
+        chunks = self._run(payload, accept="text/event-stream")
+        events = [chunk.split("\n") for chunk in chunks]
+        assert [event[0] for event in events] == ["event: ok", "event: done"]
+        assert all(chunk.endswith("\n\n") for chunk in chunks)
+        assert json.loads(events[0][1].removeprefix("data: "))["index"] == 0
+
+        # 抠图器加载失败时每张图片给出错误，再给出汇总
+        def fail(method, model=None):
+            raise ValueError("未知的抠图模型")
+
+        monkeypatch.setattr(analyze, "get_background_remover", fail)
+        payload = analyze.BatchAnalyzeRequest(image_paths=["/a.png", "/b.png"])
+        items = [json.loads(chunk) for chunk in self._run(payload)]
+        assert [item.get("status_code") for item in items] == [400, 400, None]
+        assert items[-1]["succeeded"] == 0
+
+    def test_request_limits(self):
+        from pydantic import ValidationError
+
+        from app.api.routers.analyze import BatchAnalyzeRequest
+
+        BatchAnalyzeRequest(image_paths=["/a.png"] * 50, concurrency=2)
+        with pytest.raises(ValidationError):
+            BatchAnalyzeRequest(image_paths=["/a.png"] * 51)
+        with pytest.raises(ValidationError):
+            BatchAnalyzeRequest(image_paths=[])
+        for concurrency in (0, 3):
+            with pytest.raises(ValidationError):
+                BatchAnalyzeRequest(image_paths=["/a.png"], concurrency=concurrency)